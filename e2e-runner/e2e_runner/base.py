@@ -1,23 +1,60 @@
+import hashlib
 import json
 import os
 import re
 import shutil
 import tempfile
+import time
 
+import tenacity
 import yaml
 from e2e_runner import constants as e2e_constants
 from e2e_runner import exceptions as e2e_exceptions
 from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import failure_monitor as e2e_failure_monitor
+from e2e_runner.utils import history as e2e_history
+from e2e_runner.utils import images_prepull as e2e_images_prepull
+from e2e_runner.utils import junit as e2e_junit
 from e2e_runner.utils import kubernetes as e2e_k8s_utils
+from e2e_runner.utils import parallelism as e2e_parallelism
+from e2e_runner.utils import report as e2e_report
+from e2e_runner.utils import results_sync as e2e_results_sync
+from e2e_runner.utils import scheduler as e2e_scheduler
+from e2e_runner.utils import smoke_tests as e2e_smoke_tests
+from e2e_runner.utils import stress as e2e_stress
+from e2e_runner.utils import telemetry as e2e_telemetry
+from e2e_runner.utils import test_selection as e2e_test_selection
 from e2e_runner.utils import utils as e2e_utils
 
 
 class CI(object):
     HELPER_POD = "alpine"
     CONFORMANCE_POD = "conformance-tests"
+    CONFORMANCE_DRY_RUN_POD = "conformance-tests-dry-run"
+    CONFORMANCE_OUTPUT_DIR = "/output"
     JUMPBOX_POD = "jumpbox"
+    DEFAULT_PARALLEL_TEST_NODES = 4
+    SMOKE_TESTS_NAMESPACE = "e2e-smoke-tests"
+    # Whether the cluster smoke tests run by default. They need Linux and
+    # Windows nodes sharing the same pods network.
+    SMOKE_TESTS_DEFAULT = False
     TESTS_TIMEOUT = 3 * 3600  # 3 hours
 
+    # Options which don't change the run results, excluded from the run
+    # fingerprint.
+    FINGERPRINT_EXCLUDED_OPTIONS = [
+        "cluster_name", "artifacts_directory", "artifacts_url",
+        "results_store", "memoize_max_age", "retain_testing_env",
+        "node_telemetry_interval", "results_sync_interval",
+        "report_slowest_specs", "spec_durations_source",
+        "ginkgo_node_usage_source", "machine_timeline_interval",
+        "registry_cache", "registry_cache_address", "http_cache",
+        "go_build_cache_store", "go_build_cache_max_size", "build_profile",
+        "build_workers", "build_worker_vm_size",
+        "clusterctl_repository_dir", "preload_mgmt_images", "mgmt_kubeconfig",
+        "warm_pool",
+    ]
+
     def __init__(self, opts):
         self.e2e_runner_dir = os.path.dirname(__file__)
         self.logging = e2e_logger.get_logger(__name__)
@@ -27,6 +64,11 @@ class CI(object):
         self.kubeconfig_path = os.path.join(self.kubeconfig_dir, "config")
         self.ssh_private_key_path = os.environ["SSH_PRIVATE_KEY_PATH"]
         self.is_jumpbox_pod_ready = False
+        self.is_conformance_helper_ready = False
+        self.parallelism = None
+        self.test_selection_focus_regex = None
+        self.images_prepull = None
+        self.http_cache_endpoint = None
 
     @property
     def k8s_client(self):
@@ -47,8 +89,111 @@ class CI(object):
     def down(self):
         pass
 
+    def run_fingerprint(self):
+        # Canonical SHA-256 fingerprint of all the run inputs.
+        inputs = self._run_fingerprint_inputs()
+        canonical = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _run_fingerprint_inputs(self):
+        options = {
+            k: v for k, v in sorted(vars(self.opts).items())
+            if k not in self.FINGERPRINT_EXCLUDED_OPTIONS
+        }
+        inputs = {
+            "options": options,
+            "conformance_image": self._conformance_image(),
+            "repos_commits": self._resolve_repos_commits(),
+        }
+        # The files are hashed, since they can be updated in place.
+        inputs["repo_list_sha256"] = self._file_url_sha256(
+            self.opts.repo_list)
+        if self.opts.test_regex_file_url:
+            inputs["test_regex_file_sha256"] = self._file_url_sha256(
+                self.opts.test_regex_file_url)
+        return inputs
+
+    def _file_url_sha256(self, url):
+        with tempfile.NamedTemporaryFile() as f:
+            e2e_utils.download_file(url, f.name)
+            with open(f.name, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+
+    def _fingerprint_repos(self):
+        # The git repos (and branches) of the binaries built by the run.
+        repos = {
+            "k8sbins": (self.opts.k8s_repo, self.opts.k8s_branch),
+            "containerdbins": (self.opts.containerd_repo,
+                               self.opts.containerd_branch),
+            "containerdshim": (self.opts.containerd_shim_repo,
+                               self.opts.containerd_shim_branch),
+            "sdncnibins": (self.opts.sdn_repo, self.opts.sdn_branch),
+            "critools": (self.opts.cri_tools_repo,
+                         self.opts.cri_tools_branch),
+        }
+        return {b: repos[b] for b in self.opts.build if b in repos}
+
+    def _resolve_repos_commits(self):
+        commits = {}
+        for bins, (repo, ref) in self._fingerprint_repos().items():
+            stdout, _ = e2e_utils.run_shell_cmd(
+                ["git", "ls-remote", repo, ref],
+                capture_output=True, hide_cmd=True, timeout=300)
+            lines = stdout.decode().split()
+            # The ref is a commit SHA, if it's not found as a branch or tag.
+            commits[bins] = lines[0] if len(lines) > 0 else ref
+        return commits
+
+    def smoke_test(self):
+        # Fast connectivity checks (cross-node pod-to-pod, pod-to-service,
+        # DNS and node-port), run before the conformance tests.
+        smoke_tests = self.opts.smoke_tests
+        if smoke_tests is None:
+            smoke_tests = self.SMOKE_TESTS_DEFAULT
+        if not smoke_tests:
+            return
+        start = time.time()
+        self.logging.info("Running the cluster smoke tests")
+        manifest_file = "/tmp/smoke-tests.yaml"
+        e2e_utils.render_template(
+            "templates/smoke-tests.yaml.j2", manifest_file,
+            {"namespace": self.SMOKE_TESTS_NAMESPACE,
+             "image": self.opts.smoke_tests_image},
+            self.e2e_runner_dir)
+        self.k8s_client.create_from_yaml(manifest_file)
+        smoke_tests = e2e_smoke_tests.ClusterSmokeTests(
+            self.SMOKE_TESTS_NAMESPACE,
+            pods_timeout=self.opts.smoke_tests_timeout,
+            windows_node_port=self._smoke_tests_windows_node_port())
+        smoke_tests.wait_ready()
+        results = smoke_tests.run()
+        with open(os.path.join(self.opts.artifacts_directory,
+                               "smoke-tests.json"), "w") as f:
+            json.dump(results, f, indent=2)
+        failed = [r for r in results if not r["passed"]]
+        for r in failed:
+            self.logging.error(
+                "Smoke test %s failed from %s to %s: %s",
+                r["check"], r["source"], r["target"], r["error"])
+        if len(failed) > 0:
+            # The smoke tests resources are kept for the logs collection.
+            raise e2e_exceptions.SmokeTestsFailed(
+                f"{len(failed)} out of {len(results)} cluster smoke tests "
+                "failed")
+        e2e_utils.exec_kubectl(
+            ["delete", "namespace", self.SMOKE_TESTS_NAMESPACE,
+             "--wait=false"])
+        self.logging.info("All %d cluster smoke tests passed in %.2f seconds",
+                          len(results), time.time() - start)
+
+    def _smoke_tests_windows_node_port(self):
+        # Whether the node ports are reachable from the Windows pods.
+        return True
+
     def test(self):
         self._prepare_tests()
+        if self.opts.stress_iterations > 0:
+            return self._run_stress_tests()
         return self._run_tests()
 
     def collect_logs(self):
@@ -65,22 +210,405 @@ class CI(object):
             json.dump(metadata, f)
 
     def _prepare_tests(self):
+        self._finish_images_prepull()
         self._setup_repo_list_configmap()
         self._setup_private_registry_secret()
 
     def _run_tests(self):
-        self._start_conformance_tests()
+        telemetry_sampler = self._start_node_telemetry_sampler()
+        results_syncer = None
+        failure_monitor = None
+        try:
+            conformance_pods = self._start_conformance_tests()
+            results_syncer = self._start_results_syncer()
+            failure_monitor = self._start_failure_monitor(conformance_pods)
+            self._wait_conformance_pods(conformance_pods,
+                                        timeout=self.TESTS_TIMEOUT,
+                                        failure_monitor=failure_monitor)
+        except e2e_exceptions.ConformanceTestsAborted:
+            self._abort_conformance_tests(conformance_pods)
+            raise
+        finally:
+            if failure_monitor:
+                failure_monitor.stop()
+            if telemetry_sampler:
+                self._stop_node_telemetry_sampler(telemetry_sampler)
+            self._write_parallelism_artifact(telemetry_sampler)
+            if results_syncer:
+                # Final sync, downloading only the files not synced yet.
+                try:
+                    results_syncer.stop()
+                except Exception as e:
+                    self.logging.warning(
+                        "Failed to sync the conformance results: %s", e)
+
+        for pod_name in conformance_pods:
+            e2e_utils.get_pod_logs(pod_name)
+        empty_shards = []
+        if len(conformance_pods) > 1:
+            empty_shards = self._merge_conformance_shards_junit_files(
+                conformance_pods)
+
+        failed_pods = [
+            pod_name for pod_name in conformance_pods
+            if self.k8s_client.get_pod_phase(pod_name) != "Succeeded" or
+            pod_name in empty_shards
+        ]
+        for attempt in range(1, self.opts.rerun_failed_attempts + 1):
+            if len(failed_pods) == 0:
+                break
+            failed_specs = e2e_junit.failed_test_names(
+                e2e_junit.find_junit_files(self.opts.artifacts_directory))
+            if len(failed_specs) == 0:
+                self.logging.warning(
+                    "No failed specs found in the JUnit files. Skipping "
+                    "the rerun of the failed specs")
+                break
+            failed_pods = self._rerun_failed_specs(
+                failed_specs, attempt, results_syncer)
+        self._create_conformance_report()
+
+        if len(failed_pods) > 0:
+            raise e2e_exceptions.ConformanceTestsFailed(
+                "The end-to-end conformance tests failed in pod(s): "
+                f"{', '.join(failed_pods)}")
+
+    def _run_stress_tests(self):
+        # The focused specs are run for a number of iterations, with each
+        # iteration in its own conformance pod, and a number of iterations
+        # running concurrently on the same cluster. Only the failing
+        # iterations artifacts are kept.
+        if not self.opts.stress_focus_regex:
+            raise ValueError(
+                "The stress focus regex is required for the stress mode")
+        image = self._conformance_image()
+        self._setup_conformance_helper()
+        ginkgo_flags, e2e_flags = self._conformance_tests_flags(image)
+        report = e2e_stress.StressReport()
+        pending = list(range(self.opts.stress_iterations))
+        running = {}
+        self.logging.info(
+            "Running %d stress iterations (concurrency: %d) for the specs "
+            "matching: %s", len(pending), self.opts.stress_concurrency,
+            self.opts.stress_focus_regex)
+        for attempt in tenacity.Retrying(
+                stop=tenacity.stop_after_delay(self.TESTS_TIMEOUT),  # pyright: ignore # noqa:
+                wait=tenacity.wait_fixed(15),  # pyright: ignore
+                retry=tenacity.retry_if_exception_type(AssertionError),  # pyright: ignore # noqa:
+                reraise=True):
+            with attempt:
+                while (len(pending) > 0 and
+                       len(running) < self.opts.stress_concurrency):
+                    iteration = pending.pop(0)
+                    pod_name = f"{self.CONFORMANCE_POD}-stress-{iteration}"
+                    iteration_ginkgo_flags, iteration_e2e_flags = \
+                        self._shard_flags(
+                            ginkgo_flags, e2e_flags,
+                            focus=self.opts.stress_focus_regex,
+                            output_dir=(f"{self.CONFORMANCE_OUTPUT_DIR}/"
+                                        f"stress-{iteration}"))
+                    self._create_conformance_pod(
+                        pod_name, image, iteration_ginkgo_flags,
+                        iteration_e2e_flags)
+                    running[pod_name] = iteration
+                for pod_name in list(running):
+                    if self.k8s_client.get_pod_phase(pod_name) in [
+                            "Succeeded", "Failed"]:
+                        self._collect_stress_iteration(
+                            pod_name, running.pop(pod_name), report)
+                assert len(pending) == 0 and len(running) == 0, (
+                    f"{len(pending)} stress iterations pending, and "
+                    f"{len(running)} running")
+
+        report.write(os.path.join(
+            self.opts.artifacts_directory, "stress-report.json"))
+        if len(report.failed_iterations) > 0:
+            raise e2e_exceptions.ConformanceTestsFailed(
+                f"{len(report.failed_iterations)} out of {report.iterations} "
+                "stress iterations failed")
+
+    def _collect_stress_iteration(self, pod_name, iteration, report):
+        iteration_dir = f"stress-{iteration}"
+        local_dir = os.path.join(self.opts.artifacts_directory, iteration_dir)
+        remote_dir = f"{self.CONFORMANCE_OUTPUT_DIR}/{iteration_dir}"
+        try:
+            e2e_utils.download_from_pod(
+                self.HELPER_POD, remote_dir, local_dir)
+        except Exception as e:
+            self.logging.warning(
+                "Failed to download the stress iteration %d results: %s",
+                iteration, e)
+        failures = report.add_iteration(
+            iteration, e2e_junit.find_junit_files(local_dir))
+        if iteration in report.failed_iterations:
+            self.logging.warning(
+                "Stress iteration %d failed (%d failed specs)",
+                iteration, failures)
+            logs, _ = e2e_utils.exec_kubectl(
+                ["logs", pod_name], capture_output=True, hide_cmd=True)
+            os.makedirs(local_dir, exist_ok=True)
+            with open(os.path.join(local_dir, "ginkgo.log"), "w") as f:
+                f.write(logs or "")
+        else:
+            shutil.rmtree(local_dir, ignore_errors=True)
+        e2e_utils.exec_pod(self.HELPER_POD, ["rm", "-rf", remote_dir])
+        self.k8s_client.delete_pod(pod_name)
+
+    def _wait_conformance_pods(self, pods_names, timeout,
+                               failure_monitor=None):
+        self.logging.info("Waiting for the conformance pod(s) to finish")
+        for attempt in tenacity.Retrying(
+                stop=tenacity.stop_after_delay(timeout),  # pyright: ignore
+                wait=tenacity.wait_exponential(max=30),  # pyright: ignore
+                retry=tenacity.retry_if_exception_type(AssertionError),  # pyright: ignore # noqa:
+                reraise=True):
+            with attempt:
+                if failure_monitor and failure_monitor.abort_reason:
+                    raise e2e_exceptions.ConformanceTestsAborted(
+                        "The end-to-end conformance tests were aborted: "
+                        f"{failure_monitor.abort_reason}")
+                running_pods = [
+                    pod_name for pod_name in pods_names
+                    if self.k8s_client.is_pod_running(pod_name)
+                ]
+                assert len(running_pods) == 0, (
+                    "The following conformance pods are still running: "
+                    f"{', '.join(running_pods)}")
+
+    def _start_failure_monitor(self, pods_names):
+        if not self.opts.early_abort:
+            return None
+        monitor = e2e_failure_monitor.FailureMonitor(
+            pods_names,
+            signatures=(e2e_failure_monitor.DEFAULT_FAILURE_SIGNATURES +
+                        self.opts.abort_failure_signature),
+            signature_threshold=self.opts.abort_signature_threshold,
+            max_failure_rate=self.opts.abort_failure_rate,
+            min_specs=self.opts.abort_min_specs)
+        monitor.start()
+        return monitor
+
+    def _abort_conformance_tests(self, pods_names):
+        for pod_name in pods_names:
+            e2e_utils.get_pod_logs(pod_name)
+            self.logging.info("Stopping the conformance pod %s", pod_name)
+            try:
+                self.k8s_client.delete_pod(pod_name)
+            except Exception as e:
+                self.logging.warning(
+                    "Failed to delete the pod %s: %s", pod_name, e)
+
+    def _merge_conformance_shards_junit_files(self, pods_names):
+        # Returns the shards pods which executed no specs. Their focus
+        # didn't match any spec, so they're failed, even if their pods
+        # succeeded.
+        shards_junit_files = []
+        empty_shards = []
+        for i, pod_name in enumerate(pods_names):
+            shard_junit_files = e2e_junit.find_junit_files(os.path.join(
+                self.opts.artifacts_directory, f"shard-{i}"))
+            if e2e_junit.executed_specs_count(shard_junit_files) == 0:
+                self.logging.error(
+                    "The conformance shard %s executed no specs", pod_name)
+                empty_shards.append(pod_name)
+            shards_junit_files += shard_junit_files
+        if len(shards_junit_files) == 0:
+            self.logging.warning("No JUnit files found for the shards")
+            return empty_shards
+        merged_file = os.path.join(
+            self.opts.artifacts_directory, "junit_01.xml")
+        totals = e2e_junit.merge_junit_files(shards_junit_files, merged_file)
+        # The merged file has all the test cases, so the shards' JUnit
+        # files are removed to avoid reporting the test cases twice.
+        for junit_file in shards_junit_files:
+            os.remove(junit_file)
+        self.logging.info(
+            "Merged %d shards JUnit files into %s (tests: %d, failures: %d)",
+            len(shards_junit_files), merged_file, totals["tests"],
+            totals["failures"])
+        return empty_shards
+
+    def _rerun_failed_specs(self, specs, attempt, results_syncer):
+        # Only the failed specs are rerun, against the same cluster. Their
+        # results replace the failed test cases in the merged JUnit file,
+        # which decides the final verdict.
+        pod_name = f"{self.CONFORMANCE_POD}-rerun-{attempt}"
+        rerun_dir = f"rerun-{attempt}"
+        self.logging.info("Rerunning %d failed spec(s) (attempt %d)",
+                          len(specs), attempt)
+        image = self._conformance_image()
+        ginkgo_flags, e2e_flags = self._conformance_tests_flags(image)
+        ginkgo_flags, e2e_flags = self._shard_flags(
+            ginkgo_flags, e2e_flags,
+            focus=e2e_junit.focus_regex(specs),
+            output_dir=f"{self.CONFORMANCE_OUTPUT_DIR}/{rerun_dir}")
+        self._create_conformance_pod(pod_name, image, ginkgo_flags, e2e_flags)
+        self.k8s_client.wait_running_pod(pod_name)
+        self._wait_conformance_pods([pod_name], timeout=self.TESTS_TIMEOUT)
+        results_syncer.sync()
+        e2e_utils.get_pod_logs(pod_name)
+
+        rerun_dir = os.path.join(self.opts.artifacts_directory, rerun_dir)
+        rerun_junit_files = e2e_junit.find_junit_files(rerun_dir)
+        if e2e_junit.executed_specs_count(rerun_junit_files) == 0:
+            # The rerun focus didn't match any spec. Its results are
+            # removed, so they are not reported.
+            self.logging.error("The rerun executed no specs")
+            for junit_file in rerun_junit_files:
+                os.remove(junit_file)
+            return [pod_name]
+        totals = self._merge_rerun_junit_files(rerun_dir, attempt)
+        if totals is None or totals["failures"] > 0:
+            return [pod_name]
+        return []
 
-        self.k8s_client.wait_non_running_pod(self.CONFORMANCE_POD,
-                                             timeout=self.TESTS_TIMEOUT)
-        e2e_utils.get_pod_logs(self.CONFORMANCE_POD)
-        e2e_utils.download_from_pod(
-            self.HELPER_POD, "output", self.opts.artifacts_directory)
+    def _merge_rerun_junit_files(self, rerun_dir, attempt):
+        rerun_junit_files = e2e_junit.find_junit_files(rerun_dir)
+        if len(rerun_junit_files) == 0:
+            self.logging.warning("No JUnit files found for the rerun")
+            return None
+        junit_files = [
+            f for f in e2e_junit.find_junit_files(
+                self.opts.artifacts_directory)
+            if f not in rerun_junit_files
+        ]
+        merged_file = os.path.join(
+            self.opts.artifacts_directory, "junit_01.xml")
+        with tempfile.NamedTemporaryFile(
+                dir=self.opts.artifacts_directory, delete=False) as f:
+            tmp_file = f.name
+        totals = e2e_junit.merge_junit_files(
+            junit_files, tmp_file, replacement_files=rerun_junit_files)
+        # The previous attempt results are kept, but renamed so they are
+        # not reported together with the merged results.
+        for junit_file in junit_files:
+            os.rename(junit_file, os.path.join(
+                os.path.dirname(junit_file),
+                f"attempt-{attempt}-{os.path.basename(junit_file)}"))
+        for junit_file in rerun_junit_files:
+            os.remove(junit_file)
+        os.rename(tmp_file, merged_file)
+        self.logging.info(
+            "Merged the rerun results into %s (tests: %d, failures: %d)",
+            merged_file, totals["tests"], totals["failures"])
+        return totals
+
+    def _start_node_telemetry_sampler(self):
+        if self.opts.node_telemetry_interval <= 0:
+            return None
+        sampler = e2e_telemetry.NodeTelemetrySampler(
+            self.k8s_client, interval=self.opts.node_telemetry_interval)
+        sampler.start()
+        return sampler
+
+    def _stop_node_telemetry_sampler(self, sampler):
+        sampler.stop()
+        try:
+            sampler.write_artifacts(
+                os.path.join(self.opts.artifacts_directory, "node-telemetry"))
+        except Exception as e:
+            self.logging.warning(
+                "Failed to write node telemetry artifacts: %s", e)
+
+    def _ginkgo_nodes(self):
+        if self.opts.parallel_test_nodes != "auto":
+            return self.opts.parallel_test_nodes
+        if self.parallelism is None:
+            self.parallelism = self._compute_parallelism()
+        return self.parallelism["ginkgo_nodes"]
+
+    def _compute_parallelism(self):
+        # The ginkgo nodes are sized from the allocatable resources of the
+        # schedulable Windows nodes, and the resource usage of a single
+        # ginkgo node measured by previous runs. The conformance shards run
+        # concurrently, so the ginkgo nodes are split across them.
+        non_blocking_taints = self._conformance_nodes_non_blocking_taints()
+        nodes = [
+            n for n in self.k8s_client.list_nodes(operating_system="windows")
+            if e2e_parallelism.is_node_schedulable(n, non_blocking_taints)
+        ]
+        usage = dict(e2e_parallelism.DEFAULT_GINKGO_NODE_USAGE)
+        if self.opts.ginkgo_node_usage_source:
+            try:
+                usage.update(e2e_parallelism.load_ginkgo_node_usage(
+                    self.opts.ginkgo_node_usage_source))
+            except Exception as e:
+                self.logging.warning(
+                    "Failed to load the ginkgo node usage: %s", e)
+        allocatable = e2e_parallelism.nodes_allocatable(nodes)
+        if len(nodes) == 0:
+            self.logging.warning(
+                "No schedulable Windows nodes found. Using %d ginkgo nodes",
+                self.DEFAULT_PARALLEL_TEST_NODES)
+            total_nodes = self.DEFAULT_PARALLEL_TEST_NODES
+        else:
+            total_nodes = e2e_parallelism.ginkgo_nodes(
+                allocatable, usage, self.opts.max_parallel_test_nodes)
+        ginkgo_nodes = max(1, total_nodes // self.opts.conformance_shards)
+        self.logging.info(
+            "Using %d ginkgo nodes per conformance pod (schedulable Windows "
+            "nodes: %d, allocatable CPU: %.2f cores, allocatable memory: "
+            "%.2f GiB, ginkgo node usage: %.2f cores, %.2f GiB)",
+            ginkgo_nodes, len(nodes), allocatable["cpu"],
+            allocatable["memory"] / 1024 ** 3, usage["cpu"],
+            usage["memory"] / 1024 ** 3)
+        return {
+            "ginkgo_nodes": ginkgo_nodes,
+            "conformance_shards": self.opts.conformance_shards,
+            "schedulable_windows_nodes": len(nodes),
+            "allocatable": allocatable,
+            "ginkgo_node_usage": usage,
+        }
 
-        pod_phase = self.k8s_client.get_pod_phase(self.CONFORMANCE_POD)
-        if pod_phase != "Succeeded":
-            raise e2e_exceptions.ConformanceTestsFailed(
-                "The end-to-end conformance tests failed")
+    def _write_parallelism_artifact(self, telemetry_sampler=None):
+        # The chosen parallelism is always reported. With the node
+        # telemetry, the measured usage of a single ginkgo node is reported
+        # as well, and it's used by the next runs, via
+        # '--ginkgo-node-usage-source'.
+        parallelism_file = os.path.join(
+            self.opts.artifacts_directory, "parallelism.json")
+        try:
+            if self.parallelism is None:
+                self.parallelism = {
+                    "ginkgo_nodes": int(self._ginkgo_nodes()),
+                    "conformance_shards": self.opts.conformance_shards,
+                }
+            if telemetry_sampler:
+                total_nodes = (self.parallelism["ginkgo_nodes"] *
+                               self.parallelism["conformance_shards"])
+                usage = telemetry_sampler.peak_usage_increase("windows")
+                self.parallelism["measured_ginkgo_node_usage"] = {
+                    key: value / total_nodes for key, value in usage.items()
+                }
+            with open(parallelism_file, "w") as f:
+                json.dump(self.parallelism, f, indent=2)
+        except Exception as e:
+            self.logging.warning(
+                "Failed to write the parallelism artifact: %s", e)
+
+    def _start_results_syncer(self):
+        syncer = e2e_results_sync.PodResultsSyncer(
+            self.HELPER_POD, self.CONFORMANCE_OUTPUT_DIR,
+            self.opts.artifacts_directory,
+            interval=self.opts.results_sync_interval)
+        syncer.start()
+        return syncer
+
+    def _create_conformance_report(self):
+        junit_files = e2e_junit.find_junit_files(self.opts.artifacts_directory)
+        if len(junit_files) == 0:
+            self.logging.warning(
+                "No JUnit files found. Skipping the conformance report")
+            return
+        try:
+            report = e2e_report.ConformanceReport(
+                slowest_specs_count=self.opts.report_slowest_specs)
+            report.add_junit_files(junit_files)
+            report.write(os.path.join(self.opts.artifacts_directory,
+                                      "conformance-report-summary.json"))
+        except Exception as e:
+            self.logging.warning(
+                "Failed to create the conformance report: %s", e)
 
     def _setup_repo_list_configmap(self):
         repo_list_file = "/tmp/repo-list.yaml"
@@ -88,6 +616,27 @@ class CI(object):
         self.k8s_client.create_configmap_from_file(
             "repo-list", repo_list_file, config_map_file_name="repos.yaml")
 
+    def _start_images_prepull(self):
+        if not self.opts.prepull_images:
+            return
+        repo_list_file = "/tmp/prepull-repo-list.yaml"
+        try:
+            e2e_utils.download_file(self.opts.repo_list, repo_list_file)
+            self.images_prepull = e2e_images_prepull.ImagesPrepull(
+                self.k8s_client, self._conformance_image(), repo_list_file,
+                self.e2e_runner_dir)
+            self.images_prepull.start()
+        except Exception as e:
+            self.logging.warning(
+                "Failed to start the E2E images pre-pull: %s", e)
+
+    def _finish_images_prepull(self):
+        if not self.images_prepull:
+            return
+        self.images_prepull.finish(os.path.join(
+            self.opts.artifacts_directory, "images-prepull.json"))
+        self.images_prepull = None
+
     def _setup_private_registry_secret(self):
         docker_config_file = os.environ.get("DOCKER_CONFIG_FILE")
         if not docker_config_file:
@@ -95,23 +644,185 @@ class CI(object):
         self.k8s_client.create_secret_from_file(
             "docker-creds", docker_config_file, secret_file_name="config.json")
 
+    def _setup_conformance_helper(self):
+        if self.is_conformance_helper_ready:
+            return
+        manifest_file = os.path.join(
+            self.e2e_runner_dir, "templates/conformance-helper.yaml")
+        self.k8s_client.create_from_yaml(manifest_file)
+        self.k8s_client.wait_running_pod(self.HELPER_POD)
+        self.is_conformance_helper_ready = True
+
     def _start_conformance_tests(self):
         image = self._conformance_image()
+        self._setup_conformance_helper()
         ginkgo_flags, e2e_flags = self._conformance_tests_flags(image)
+
+        specs = None
+        if self.test_selection_focus_regex:
+            specs = self._select_conformance_specs(
+                image, ginkgo_flags, e2e_flags)
+            if specs:
+                ginkgo_flags["focus"] = e2e_junit.focus_regex(specs)
+
+        shards_specs = []
+        if self.opts.conformance_shards > 1:
+            shards_specs = self._conformance_shards_specs(
+                image, ginkgo_flags, e2e_flags, specs=specs)
+
+        self.logging.info("Starting the conformance tests")
+        if len(shards_specs) == 0:
+            self._create_conformance_pod(
+                self.CONFORMANCE_POD, image, ginkgo_flags, e2e_flags)
+            pods_names = [self.CONFORMANCE_POD]
+        else:
+            pods_names = []
+            for i, specs in enumerate(shards_specs):
+                pod_name = f"{self.CONFORMANCE_POD}-{i}"
+                shard_ginkgo_flags, shard_e2e_flags = self._shard_flags(
+                    ginkgo_flags, e2e_flags,
+                    focus=e2e_junit.focus_regex(specs),
+                    output_dir=f"{self.CONFORMANCE_OUTPUT_DIR}/shard-{i}")
+                self._create_conformance_pod(
+                    pod_name, image, shard_ginkgo_flags, shard_e2e_flags)
+                pods_names.append(pod_name)
+
+        for pod_name in pods_names:
+            self.k8s_client.wait_running_pod(pod_name)
+        return pods_names
+
+    def _create_conformance_pod(self, pod_name, image, ginkgo_flags,
+                                e2e_flags):
         ctxt = {
+            'pod_name': pod_name,
             'conformance_image': image,
             'ginkgo_flags': ginkgo_flags,
             'e2e_flags': e2e_flags,
         }
         if self.opts.e2e_bin:
-            ctxt["e2e_bin_url"] = self.opts.e2e_bin
-        output_file = "/tmp/conformance.yaml"
+            ctxt["e2e_bin_url"] = e2e_utils.http_cache_url(
+                self.opts.e2e_bin, self.http_cache_endpoint)
+        output_file = f"/tmp/{pod_name}.yaml"
         e2e_utils.render_template("templates/conformance.yaml.j2", output_file,
                                   ctxt, self.e2e_runner_dir)
-        self.logging.info("Starting the conformance tests")
         self.k8s_client.create_from_yaml(output_file)
-        self.k8s_client.wait_running_pod(self.HELPER_POD)
-        self.k8s_client.wait_running_pod(self.CONFORMANCE_POD)
+
+    def _shard_flags(self, ginkgo_flags, e2e_flags, focus, output_dir):
+        shard_ginkgo_flags = dict(ginkgo_flags)
+        shard_ginkgo_flags["focus"] = focus
+        shard_e2e_flags = dict(e2e_flags)
+        shard_e2e_flags["report-dir"] = output_dir
+        shard_e2e_flags["e2e-output-dir"] = f"{output_dir}/e2e-output"
+        return shard_ginkgo_flags, shard_e2e_flags
+
+    def _select_conformance_specs(self, image, ginkgo_flags, e2e_flags):
+        # The change-based test selection is intersected with the specs
+        # matched by the configured focus and skip regexes, listed with a
+        # dry-run. Returns None if the configured focus is kept.
+        specs = self._list_conformance_specs(image, ginkgo_flags, e2e_flags)
+        if len(specs) == 0:
+            self.logging.warning(
+                "Could not list the conformance specs. Running the "
+                "configured E2E tests focus")
+            return None
+        selected_specs = e2e_test_selection.select_specs(
+            specs, self.test_selection_focus_regex)
+        if len(selected_specs) == 0:
+            self.logging.warning(
+                "The test selection matched none of the %d configured "
+                "specs. Running the configured E2E tests focus", len(specs))
+            return None
+        self.logging.info(
+            "Selected %d out of %d configured specs",
+            len(selected_specs), len(specs))
+        return selected_specs
+
+    def _conformance_shards_specs(self, image, ginkgo_flags, e2e_flags,
+                                  specs=None):
+        if specs is None:
+            specs = self._list_conformance_specs(
+                image, ginkgo_flags, e2e_flags)
+        if len(specs) == 0:
+            self.logging.warning(
+                "Could not list the conformance specs. Running the "
+                "conformance tests without sharding")
+            return []
+        shards = min(self.opts.conformance_shards, len(specs))
+        self.logging.info(
+            "Splitting %d conformance specs across %d shards",
+            len(specs), shards)
+        return self._split_specs(specs, shards)
+
+    def _split_specs(self, specs, shards):
+        durations = self._load_spec_durations()
+        if len(durations) > 0:
+            return e2e_scheduler.pack_specs(specs, shards, durations)
+        shards_specs = [[] for _ in range(shards)]
+        for i, spec in enumerate(sorted(specs)):
+            shards_specs[i % shards].append(spec)
+        return shards_specs
+
+    def _load_spec_durations(self):
+        durations = {}
+        if self.opts.results_store:
+            try:
+                store = e2e_history.ResultsStore(self.opts.results_store)
+                try:
+                    durations.update(store.spec_mean_durations(
+                        os.environ.get("JOB_NAME")))
+                finally:
+                    store.close()
+            except Exception as e:
+                self.logging.warning(
+                    "Failed to load the spec durations from the results "
+                    "store: %s", e)
+        if not self.opts.spec_durations_source:
+            return durations
+        try:
+            durations.update(e2e_scheduler.load_spec_durations(
+                self.opts.spec_durations_source))
+        except Exception as e:
+            self.logging.warning(
+                "Failed to load the historical spec durations: %s", e)
+        return durations
+
+    def _list_conformance_specs(self, image, ginkgo_flags, e2e_flags):
+        # Ginkgo dry-run reports all the specs selected by the focus and
+        # skip regexes as passed, without running them.
+        output_dir = f"{self.CONFORMANCE_OUTPUT_DIR}/dry-run"
+        dry_run_ginkgo_flags, dry_run_e2e_flags = self._shard_flags(
+            ginkgo_flags, e2e_flags,
+            focus=ginkgo_flags["focus"], output_dir=output_dir)
+        dry_run_ginkgo_flags["dry-run"] = "true"
+        dry_run_ginkgo_flags["nodes"] = 1
+        self._create_conformance_pod(
+            self.CONFORMANCE_DRY_RUN_POD, image,
+            dry_run_ginkgo_flags, dry_run_e2e_flags)
+        try:
+            self.k8s_client.wait_non_running_pod(
+                self.CONFORMANCE_DRY_RUN_POD, timeout=900)
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                e2e_utils.download_from_pod(
+                    self.HELPER_POD, output_dir.lstrip("/"), tmp_dir)
+                test_cases = e2e_junit.iter_junit_files_test_cases(
+                    e2e_junit.find_junit_files(tmp_dir))
+                return [
+                    tc["name"] for tc in test_cases
+                    if tc["status"] == e2e_junit.STATUS_PASSED and
+                    not e2e_junit.is_suite_node(tc["name"])
+                ]
+        except Exception as e:
+            self.logging.warning(
+                "Failed to list the conformance specs: %s", e)
+            return []
+        finally:
+            e2e_utils.exec_pod(self.HELPER_POD, ["rm", "-rf", output_dir])
+            try:
+                self.k8s_client.delete_pod(self.CONFORMANCE_DRY_RUN_POD)
+            except Exception as e:
+                self.logging.warning(
+                    "Failed to delete the pod %s: %s",
+                    self.CONFORMANCE_DRY_RUN_POD, e)
 
     def _conformance_image(self):
         if self.opts.conformance_image:
@@ -154,7 +865,7 @@ class CI(object):
             "v": "true",
             "timeout": "3h",
             "no-color": "true",
-            "nodes": self.opts.parallel_test_nodes,
+            "nodes": self._ginkgo_nodes(),
             "focus": test_focus_regex,
             "skip": test_skip_regex,
         }
@@ -1,6 +1,7 @@
 import base64
 import os
 import subprocess
+import threading
 
 import tenacity
 from azure.core import exceptions as azure_exceptions
@@ -11,6 +12,7 @@ from azure.mgmt.network import models as net_models
 from azure.mgmt.resource import ResourceManagementClient
 from e2e_runner import logger as e2e_logger
 from e2e_runner.utils import azure as e2e_azure_utils
+from e2e_runner.utils import registry_cache as e2e_registry_cache
 from e2e_runner.utils import utils as e2e_utils
 
 
@@ -25,6 +27,10 @@ class BootstrapVM(object):
         self.rg_name = f"{opts.cluster_name}-bootstrap"
         self.rg_tags = e2e_azure_utils.get_resource_group_tags()
         self.vm_info = {}
+        self.git_clones = {}
+        # Set when the vNET subnet is created, and the build workers can
+        # be created as well.
+        self.network_ready = threading.Event()
         self.vm_name = "k8s-bootstrap"
         self.vm_size = opts.bootstrap_vm_size
         self.vnet_name = "k8s-bootstrap-vnet"
@@ -67,17 +73,24 @@ class BootstrapVM(object):
         return "~/www"
 
     @e2e_utils.retry_on_error()
-    def setup(self):
+    def setup(self, git_repos=[]):
         self.logging.info("Setting up the bootstrap VM")
 
         try:
             self._create_rg()
             self._create_vnet()
             self._create_vnet_subnet()
+            self.network_ready.set()
             self._create_azure_vm()
+            # The git repositories are cloned as soon as the VM is
+            # reachable, while the VM initialization goes on.
+            self._start_git_clones(git_repos)
             self._init_azure_vm()
         except Exception as ex:
             self._delete_rg()
+            # The clones of the removed VM fail fast without its info.
+            self._reset_vm_info()
+            self._join_git_clones()
             raise ex
 
         self.logging.info("Finished setting up the bootstrap VM")
@@ -127,9 +140,53 @@ class BootstrapVM(object):
                 self.vnet_name,
                 peering.name).wait()  # pyright: ignore
 
+    def setup_registry_cache(self, layout):
+        self.logging.info("Setting up the registry cache")
+        self.exec(e2e_registry_cache.deploy_script(layout))
+
     def clone_git_repo(self, url, branch_name, dir):
+        clone = self.git_clones.pop(dir, None)
+        if clone:
+            clone["thread"].join()
+            if clone["error"]:
+                self.logging.warning(
+                    "Background clone of %s failed: %s. Retrying",
+                    url, clone["error"])
+        self._clone_git_repo(url, branch_name, dir)
+
+    def _clone_git_repo(self, url, branch_name, dir):
+        # Blobless partial clone: the history (needed for the build version)
+        # is fetched, but the blobs only for the checked out commit.
         self.exec([f"test -e {dir} || "
-                   f"git clone --single-branch {url} --branch {branch_name} {dir}"])  # noqa:
+                   f"git clone --filter=blob:none --single-branch {url} --branch {branch_name} {dir} || "  # noqa:
+                   f"(rm -rf {dir}; exit 1)"])
+
+    def _join_git_clones(self):
+        # Waits for the background clones of a previous (failed) setup
+        # attempt, so they don't race the next attempt on the same
+        # directories.
+        for clone in self.git_clones.values():
+            clone["thread"].join()
+        self.git_clones = {}
+
+    def _start_git_clones(self, git_repos):
+        self._join_git_clones()
+        for url, branch_name, dir in git_repos:
+            clone = {"error": None}
+
+            def _clone(url=url, branch_name=branch_name, dir=dir,
+                       clone=clone):
+                try:
+                    self._clone_git_repo(url, branch_name, dir)
+                except Exception as e:
+                    clone["error"] = e
+
+            self.logging.info("Cloning %s in the background", url)
+            clone["thread"] = threading.Thread(
+                target=_clone, name=f"git-clone-{os.path.basename(dir)}",
+                daemon=True)
+            clone["thread"].start()
+            self.git_clones[dir] = clone
 
     def _set_vm_info(self):
         self.vm_info = {
@@ -401,10 +458,13 @@ class BootstrapVM(object):
     @e2e_utils.retry_on_error()
     def _setup_www(self):
         self.logging.info("Setup bootstrap VM file share")
+        self.upload(os.path.join(self.current_dir, "nginx/"), "nginx/")
         self.exec([
-            f"mkdir -p {self.artifacts_dir}",
+            f"mkdir -p {self.artifacts_dir} ~/nginx-cache",
             ("docker run --name nginx --restart unless-stopped -p 8081:80 "
              f"-v {self.artifacts_dir}:/usr/share/nginx/html:ro "
+             "-v ~/nginx/default.conf:/etc/nginx/conf.d/default.conf:ro "
+             "-v ~/nginx-cache:/var/cache/nginx/artifacts "
              "-d nginx:stable"),
         ])
 
@@ -423,3 +483,66 @@ class BootstrapVM(object):
             self.current_dir, "cloud-init/install-kind.sh")
         self.upload(script_file, "/tmp/install-kind.sh")
         self.exec(["bash /tmp/install-kind.sh"])
+
+
+class BuildWorkerVM(BootstrapVM):
+    # Extra VM running some of the CI builds, in the bootstrap VM resource
+    # group and subnet. The build artifacts are synced to the bootstrap VM
+    # file share, over the private network.
+    SSH_KEY_PATH = ".ssh/bootstrap-vm-key"
+
+    def __init__(self, opts, bootstrap_vm, index):
+        super(BuildWorkerVM, self).__init__(opts, bootstrap_vm.location)
+        self.bootstrap_vm = bootstrap_vm
+        self.vm_name = f"k8s-build-worker-{index}"
+        self.vm_size = opts.build_worker_vm_size or opts.bootstrap_vm_size
+        self.nic_name = f"{self.vm_name}-nic"
+        self.public_ip_name = f"{self.vm_name}-public-ip"
+
+    @e2e_utils.retry_on_error()
+    def setup(self, git_repos=[], timeout=1800):
+        if not self.bootstrap_vm.network_ready.wait(timeout):
+            raise Exception("Timed out waiting for the bootstrap vNET")
+        self.logging.info("Setting up the build worker %s", self.vm_name)
+        self._create_azure_vm()
+        self._start_git_clones(git_repos)
+        self._wait_cloud_init_complete()
+        self._install_golang()
+        self.upload(self.ssh_private_key_path, self.SSH_KEY_PATH)
+        self.exec([f"chmod 600 {self.SSH_KEY_PATH}"])
+        self.logging.info("Finished setting up the build worker %s",
+                          self.vm_name)
+
+    def remove(self, wait=True):
+        # The worker resources are removed together with the bootstrap VM
+        # resource group as well. This removes them earlier.
+        self.logging.info("Removing the build worker %s", self.vm_name)
+        e2e_utils.retry_on_error()(
+            self.compute_client.virtual_machines.begin_delete)(
+                self.rg_name, self.vm_name).wait()  # pyright: ignore
+        e2e_utils.retry_on_error()(
+            self.network_client.network_interfaces.begin_delete)(
+                self.rg_name, self.nic_name).wait()  # pyright: ignore
+        e2e_utils.retry_on_error()(
+            self.network_client.public_ip_addresses.begin_delete)(
+                self.rg_name, self.public_ip_name).wait()  # pyright: ignore
+        self._reset_vm_info()
+
+    @e2e_utils.retry_on_error()
+    def sync_artifacts(self):
+        self.logging.info("Syncing the %s build artifacts to the bootstrap "
+                          "VM", self.vm_name)
+        ssh_cmd = (f"ssh -q -i {self.SSH_KEY_PATH} "
+                   "-o StrictHostKeyChecking=no "
+                   "-o UserKnownHostsFile=/dev/null")
+        self.exec([
+            f"mkdir -p {self.artifacts_dir}",
+            f"rsync -rlptD -e '{ssh_cmd}' {self.artifacts_dir}/ "
+            f"{self.VM_USER}@{self.bootstrap_vm.private_ip}:www/",
+        ])
+
+    def _get_storage_profile(self):
+        storage_profile = super(BuildWorkerVM, self)._get_storage_profile()
+        storage_profile.os_disk.delete_option = (
+            compute_models.DiskDeleteOptionTypes.DELETE)
+        return storage_profile
@@ -0,0 +1,101 @@
+import os
+import threading
+
+from e2e_runner import logger as e2e_logger
+
+
+class GoBuildCache(object):
+    # Snapshots of the build VMs Go build cache and modules cache, kept
+    # in a local (or mounted) store directory, keyed by the Go version and
+    # the built component. The least recently used snapshots are evicted
+    # when the store grows over its maximum size.
+    CACHE_DIRS = [".cache/go-build", "go/pkg/mod"]
+    REMOTE_SNAPSHOT = "/tmp/go-build-cache.tar.gz"
+
+    def __init__(self, store_dir, max_size):
+        self.logging = e2e_logger.get_logger(__name__)
+        self.store_dir = store_dir
+        self.max_size = max_size
+        self._go_version = None
+        # The builds may run concurrently on multiple VMs.
+        self._lock = threading.Lock()
+
+    def restore(self, vm, component):
+        try:
+            self._clean(vm)
+            snapshot = self._snapshot_path(vm, component)
+            if not os.path.exists(snapshot):
+                self.logging.info("No Go build cache snapshot for %s",
+                                  component)
+                return
+            self.logging.info("Restoring the Go build cache snapshot %s",
+                              os.path.basename(snapshot))
+            # Mark the snapshot as recently used, for the eviction.
+            os.utime(snapshot)
+            vm.upload(snapshot, self.REMOTE_SNAPSHOT)
+            vm.exec([
+                f"tar -xzf {self.REMOTE_SNAPSHOT}",
+                f"rm -f {self.REMOTE_SNAPSHOT}",
+            ])
+        except Exception as e:
+            self.logging.warning(
+                "Failed to restore the Go build cache for %s: %s",
+                component, e)
+
+    def save(self, vm, component):
+        try:
+            snapshot = self._snapshot_path(vm, component)
+            self.logging.info("Saving the Go build cache snapshot %s",
+                              os.path.basename(snapshot))
+            os.makedirs(self.store_dir, exist_ok=True)
+            vm.exec([
+                f"tar -czf {self.REMOTE_SNAPSHOT} "
+                f"$(ls -d {' '.join(self.CACHE_DIRS)} 2>/dev/null)",
+            ])
+            vm.download(self.REMOTE_SNAPSHOT, f"{snapshot}.tmp")
+            os.replace(f"{snapshot}.tmp", snapshot)
+            vm.exec([f"rm -f {self.REMOTE_SNAPSHOT}"])
+            with self._lock:
+                self._evict()
+        except Exception as e:
+            self.logging.warning(
+                "Failed to save the Go build cache for %s: %s", component, e)
+
+    def _clean(self, vm):
+        # The caches of the previously built components are removed, so
+        # every snapshot has only the cache of its own component. The
+        # modules cache is read-only.
+        cache_dirs = " ".join(self.CACHE_DIRS)
+        vm.exec([
+            f"chmod -R u+w {cache_dirs} 2>/dev/null || true",
+            f"rm -rf {cache_dirs}",
+        ])
+
+    def _snapshot_path(self, vm, component):
+        return os.path.join(
+            self.store_dir, f"{self._get_go_version(vm)}-{component}.tar.gz")
+
+    def _get_go_version(self, vm):
+        if not self._go_version:
+            stdout, _ = vm.exec(  # pyright: ignore
+                ["go env GOVERSION"], timeout=30, return_result=True)
+            self._go_version = stdout.decode().strip()
+        return self._go_version
+
+    def _evict(self):
+        snapshots = []
+        for name in os.listdir(self.store_dir):
+            if not name.endswith(".tar.gz"):
+                continue
+            path = os.path.join(self.store_dir, name)
+            stat = os.stat(path)
+            snapshots.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(s[1] for s in snapshots)
+        # The least recently used snapshots are evicted first.
+        for _, size, path in sorted(snapshots):
+            if total_size <= self.max_size:
+                break
+            self.logging.info("Evicting the Go build cache snapshot %s",
+                              os.path.basename(path))
+            os.remove(path)
+            total_size -= size
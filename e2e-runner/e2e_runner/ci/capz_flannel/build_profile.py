@@ -0,0 +1,166 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+
+import pendulum
+from e2e_runner import logger as e2e_logger
+
+
+class BuildProfiler(object):
+    # Profiles the CI builds on the bootstrap VM: the wall and CPU time of
+    # every build command, and the per-package Go compile times, from the
+    # action graphs recorded by the 'build-profile/go' wrapper. The Docker
+    # builds (like 'quick-release-images') are only profiled at the command
+    # level, since their Go builds run in containers.
+    REMOTE_DIR = "build-profile"
+
+    def __init__(self):
+        self.logging = e2e_logger.get_logger(__name__)
+        # The VMs running the builds (the bootstrap VM, and the build
+        # workers, if any).
+        self.vms = []
+        # The build commands by name. The retried builds replace them.
+        self.commands = {}
+        self.components = {}
+
+    def wrap(self, vm, component, step, script):
+        # Returns the script with every command timed, and with the Go
+        # action graphs recorded.
+        if vm not in self.vms:
+            self._setup(vm)
+        wrapped = [
+            f"export PATH=$HOME/{self.REMOTE_DIR}/bin:$PATH",
+            'TIMEFORMAT="%R %U %S"',
+        ]
+        for index, cmd in enumerate(script):
+            name = f"{step}-{index}"
+            self.commands[name] = {
+                "name": name,
+                "component": component,
+                "step": step,
+                "command": cmd,
+                "vm": self.vms.index(vm),
+            }
+            wrapped += [
+                f"export GO_ACTIONGRAPH_DIR=$HOME/{self.REMOTE_DIR}/actiongraph/{name}",  # noqa:
+                "rm -rf $GO_ACTIONGRAPH_DIR",
+                f"echo $(date +%s.%N) > $HOME/{self.REMOTE_DIR}/times/{name}.start",  # noqa:
+                f"{{ time {cmd} 2>&3 ; }} 3>&2 2> $HOME/{self.REMOTE_DIR}/times/{name}.time",  # noqa:
+            ]
+        return wrapped
+
+    def add_component_duration(self, component, duration):
+        self.components[component] = duration
+
+    def write(self, output_dir, slowest_packages=50):
+        # Writes the 'build-profile.json' (sorted by duration) and the
+        # 'build-trace.json' (Chrome trace format) artifacts.
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for index, vm in enumerate(self.vms):
+                vm.download(f"{self.REMOTE_DIR}/",
+                            os.path.join(tmp_dir, str(index)))
+            commands = self._commands_profile(tmp_dir)
+            packages = self._packages_profile(tmp_dir)
+        finally:
+            shutil.rmtree(tmp_dir)
+        packages.sort(key=lambda p: p["duration"], reverse=True)
+        profile = {
+            "components": self.components,
+            "commands": sorted(
+                commands, key=lambda c: c.get("wall", 0), reverse=True),
+            "slowest_packages": packages[:slowest_packages],
+            "packages_count": len(packages),
+        }
+        with open(os.path.join(output_dir, "build-profile.json"), "w") as f:
+            json.dump(profile, f, indent=2)
+        with open(os.path.join(output_dir, "build-trace.json"), "w") as f:
+            json.dump({"traceEvents": self._trace_events(commands, packages)},
+                      f)
+        for cmd in profile["commands"][:5]:
+            self.logging.info(
+                "Build command %s took %.2f seconds (CPU: %.2f seconds)",
+                cmd["command"], cmd.get("wall", 0), cmd.get("cpu", 0))
+
+    def _setup(self, vm):
+        vm.exec([
+            f"mkdir -p {self.REMOTE_DIR}/bin {self.REMOTE_DIR}/times "
+            f"{self.REMOTE_DIR}/actiongraph",
+        ])
+        vm.upload(
+            os.path.join(os.path.dirname(__file__), "build-profile/go"),
+            f"{self.REMOTE_DIR}/bin/go")
+        self.vms.append(vm)
+
+    def _commands_profile(self, profile_dir):
+        commands = []
+        for cmd in self.commands.values():
+            cmd = dict(cmd)
+            times_file = os.path.join(
+                profile_dir, str(cmd["vm"]), "times", cmd["name"])
+            try:
+                with open(f"{times_file}.start") as f:
+                    cmd["start"] = float(f.read().strip())
+                with open(f"{times_file}.time") as f:
+                    # The last line has the 'time' output. The command
+                    # stderr is not redirected there.
+                    wall, user, system = f.read().split()[-3:]
+                cmd.update({
+                    "wall": float(wall),
+                    "cpu": float(user) + float(system),
+                    "user": float(user),
+                    "system": float(system),
+                })
+            except (OSError, ValueError):
+                # The command wasn't run, or it failed.
+                pass
+            commands.append(cmd)
+        return commands
+
+    def _packages_profile(self, profile_dir):
+        packages = []
+        for cmd in self.commands.values():
+            graphs = glob.glob(os.path.join(
+                profile_dir, str(cmd["vm"]), "actiongraph", cmd["name"],
+                "*.json"))
+            for graph_file in graphs:
+                with open(graph_file) as f:
+                    actions = json.load(f)
+                for action in actions:
+                    if action.get("Mode") != "build" or \
+                       not action.get("TimeStart") or \
+                       not action.get("TimeDone"):
+                        continue
+                    start = pendulum.parse(action["TimeStart"])
+                    done = pendulum.parse(action["TimeDone"])
+                    packages.append({
+                        "package": action.get("Package"),
+                        "command": cmd["name"],
+                        "component": cmd["component"],
+                        "start": start.timestamp(),
+                        "duration": (done - start).total_seconds(),
+                    })
+        return packages
+
+    def _trace_events(self, commands, packages):
+        events = []
+        for cmd in commands:
+            if "start" not in cmd or "wall" not in cmd:
+                continue
+            events.append({
+                "name": cmd["command"], "cat": "command", "ph": "X",
+                "ts": cmd["start"] * 1e6, "dur": cmd["wall"] * 1e6,
+                "pid": cmd["component"], "tid": cmd["step"],
+                "args": {"cpu": cmd["cpu"]},
+            })
+        for package in packages:
+            events.append({
+                "name": package["package"], "cat": "package", "ph": "X",
+                "ts": package["start"] * 1e6,
+                "dur": package["duration"] * 1e6,
+                "pid": package["component"],
+                "tid": f"{package['command']}-packages",
+            })
+        return events
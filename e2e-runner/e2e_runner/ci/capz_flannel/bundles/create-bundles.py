@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# Creates one compressed bundle per CI component found in the artifacts
+# directory, and the 'manifest.json' with the sizes and SHA-256 hashes of
+# the bundles and of all the CI artifacts.
+import hashlib
+import json
+import os
+import sys
+import tarfile
+import time
+
+# The components downloaded by the Windows nodes, as bundles.
+BUNDLES = {
+    "kubernetes-windows": "kubernetes/bin/windows/amd64",
+    "containerd": "containerd/bin",
+    "containerd-shim": "containerd-shim/bin",
+    "cri-tools": "cri-tools/bin",
+    "sdn-cni": "cni/bin",
+}
+# The directories not listed in the manifest.
+EXCLUDED_DIRS = ["bundles", "scripts"]
+
+
+def file_info(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return {"size": os.path.getsize(path), "sha256": sha256.hexdigest()}
+
+
+def create_bundle(artifacts_dir, name, component_dir):
+    bundle_path = os.path.join("bundles", f"{name}.tar.gz")
+    files = {}
+    with tarfile.open(os.path.join(artifacts_dir, bundle_path), "w:gz") as t:
+        for file_name in sorted(os.listdir(component_dir)):
+            file_path = os.path.join(component_dir, file_name)
+            if not os.path.isfile(file_path):
+                continue
+            t.add(file_path, arcname=file_name)
+            files[file_name] = file_info(file_path)
+    bundle = file_info(os.path.join(artifacts_dir, bundle_path))
+    bundle.update({"path": bundle_path, "files": files})
+    return bundle
+
+
+def main(artifacts_dir):
+    os.makedirs(os.path.join(artifacts_dir, "bundles"), exist_ok=True)
+    manifest = {"created_at": time.time(), "bundles": {}, "files": {}}
+    for name, rel_dir in BUNDLES.items():
+        component_dir = os.path.join(artifacts_dir, rel_dir)
+        if os.path.isdir(component_dir):
+            manifest["bundles"][name] = create_bundle(
+                artifacts_dir, name, component_dir)
+    for root, dirs, files in os.walk(artifacts_dir):
+        if root == artifacts_dir:
+            dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+            files = [f for f in files if f != "manifest.json"]
+        for file_name in sorted(files):
+            file_path = os.path.join(root, file_name)
+            rel_path = os.path.relpath(file_path, artifacts_dir)
+            manifest["files"][rel_path] = file_info(file_path)
+    with open(os.path.join(artifacts_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main(os.path.expanduser(sys.argv[1]))
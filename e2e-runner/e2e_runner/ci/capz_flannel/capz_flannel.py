@@ -4,6 +4,7 @@ import os
 import shutil
 import stat
 import tempfile
+import threading
 import time
 from datetime import datetime
 from urllib.parse import urlparse
@@ -18,12 +19,30 @@ from e2e_runner import constants as e2e_constants
 from e2e_runner import exceptions as e2e_exceptions
 from e2e_runner import logger as e2e_logger
 from e2e_runner.ci.capz_flannel import bootstrap_vm
+from e2e_runner.ci.capz_flannel import build_cache
+from e2e_runner.ci.capz_flannel import build_profile
+from e2e_runner.ci.capz_flannel import clusterctl_repository
+from e2e_runner.ci.capz_flannel import machine_timeline
+from e2e_runner.ci.capz_flannel import warm_pool
 from e2e_runner.utils import azure as e2e_azure_utils
+from e2e_runner.utils import images_prepull as e2e_images_prepull
 from e2e_runner.utils import kubernetes as e2e_k8s_utils
+from e2e_runner.utils import registry_cache as e2e_registry_cache
+from e2e_runner.utils import test_selection as e2e_test_selection
 from e2e_runner.utils import utils as e2e_utils
 
 
 class CapzFlannelCI(e2e_base.CI):
+    # Rough relative build durations, used to spread the builds across the
+    # build VMs.
+    BUILD_WEIGHTS = {
+        "k8sbins": 10,
+        "containerdbins": 3,
+        "containerdshim": 1,
+        "critools": 1,
+        "sdncnibins": 1,
+    }
+    SMOKE_TESTS_DEFAULT = True
 
     def __init__(self, opts):
         super(CapzFlannelCI, self).__init__(opts)
@@ -34,8 +53,23 @@ class CapzFlannelCI(e2e_base.CI):
         self.resource_group_tags = e2e_azure_utils.get_resource_group_tags()
         self.kubernetes_version = self.opts.kubernetes_version
         self.bins_built = []
+        self.machine_timeline = None
+        self.registry_cache_address = None
         self.mgmt_kubeconfig_path = os.path.join(
             self.kubeconfig_dir, "mgmt-kubeconfig.yaml")
+        # With a shared management cluster, every CAPZ cluster has its own
+        # namespace.
+        self.capz_namespace = "default"
+        if opts.mgmt_kubeconfig:
+            self.mgmt_kubeconfig_path = os.path.expanduser(
+                opts.mgmt_kubeconfig)
+            self.capz_namespace = opts.cluster_name
+        if opts.warm_pool and not opts.mgmt_kubeconfig:
+            raise ValueError("The warm pool requires the '--mgmt-kubeconfig'")
+        self._warm_pool = None
+        # The claimed warm pool cluster name, if any.
+        self.warm_pool_cluster = None
+        self.warm_pool_provisioning = False
 
         self.ssh_private_key_path = os.environ["SSH_PRIVATE_KEY_PATH"]
         self.ssh_public_key = e2e_utils.get_file_content(
@@ -48,12 +82,41 @@ class CapzFlannelCI(e2e_base.CI):
         self.location = self._get_location(opts.location)
 
         self.bootstrap_vm = bootstrap_vm.BootstrapVM(opts, self.location)
+        self.build_workers = [
+            bootstrap_vm.BuildWorkerVM(opts, self.bootstrap_vm, i)
+            for i in range(opts.build_workers)
+        ]
+        self._build_vm_local = threading.local()
+        self.build_profiler = None
+        if opts.build_profile:
+            self.build_profiler = build_profile.BuildProfiler()
+        self.clusterctl_repository = None
+        if opts.capi_version and opts.capz_version and \
+           opts.cert_manager_version and not opts.mgmt_kubeconfig:
+            self.clusterctl_repository = \
+                clusterctl_repository.ClusterctlRepository(
+                    opts.clusterctl_repository_dir, opts.capi_version,
+                    opts.capz_version, opts.cert_manager_version)
+        self.mgmt_images_pull = None
+        self.go_build_cache = None
+        if opts.go_build_cache_store:
+            self.go_build_cache = build_cache.GoBuildCache(
+                opts.go_build_cache_store,
+                max_size=opts.go_build_cache_max_size * 1024 ** 3)
 
     @property
     def mgmt_k8s_client(self):
         return e2e_k8s_utils.KubernetesClient(
             config_file=self.mgmt_kubeconfig_path)
 
+    @property
+    def warm_pool(self):
+        if not self._warm_pool:
+            self._warm_pool = warm_pool.WarmPool(
+                self.mgmt_k8s_client, self.kubernetes_version,
+                self.opts.win_os, self.opts.flannel_mode)
+        return self._warm_pool
+
     @property
     def control_plane_public_address(self):
         if os.path.exists(self.kubeconfig_path):
@@ -162,39 +225,77 @@ class CapzFlannelCI(e2e_base.CI):
             self.bootstrap_vm.go_path,
             "src", "github.com", "Microsoft", "windows-container-networking")
 
+    @property
+    def _build_vm(self):
+        # The VM running the builds of the current thread.
+        return getattr(self._build_vm_local, "vm", self.bootstrap_vm)
+
     def setup_bootstrap_vm(self):
-        self.bootstrap_vm.setup()
+        if self._claim_warm_pool_cluster():
+            # The claimed cluster is already provisioned, and the bootstrap
+            # VM isn't needed.
+            return
+        self._setup_clusterctl_repository()
+        assignments = self._build_assignments(self.opts.build)
+        workers_setup = self._start_build_workers_setup(assignments)
+        self.bootstrap_vm.setup(git_repos=self._git_repos(
+            assignments[self.bootstrap_vm]))
         self.bootstrap_vm.upload(
             local_path=os.path.join(self.e2e_runner_dir, "scripts"),
             remote_path="www/",
         )
+        self._setup_registry_cache()
+        if self.opts.http_cache:
+            self.http_cache_endpoint = f"{self.bootstrap_vm.private_ip}:8081"
+        self._start_mgmt_images_pull()
+        self._wait_build_workers_setup(workers_setup)
 
     def cleanup_bootstrap_vm(self):
+        if self.warm_pool_cluster:
+            return
+        if self._is_bootstrap_vm_used_by_tests():
+            # The bootstrap VM caches are used during the tests, so it's
+            # removed only when the cluster is deleted.
+            return
         self.bootstrap_vm.remove()
 
     def build(self, bins_to_build):
-        builder_mapping = {
-            "k8sbins": self._build_k8s_artifacts,
-            "containerdbins": self._build_containerd_binaries,
-            "containerdshim": self._build_containerd_shim,
-            "critools": self._build_cri_tools,
-            "sdncnibins": self._build_sdn_cni_binaries,
-        }
         for bins in bins_to_build:
-            self.logging.info("Building %s", bins)
-            build_func = builder_mapping.get(bins)
-            if not build_func:
+            if bins not in self.BUILD_WEIGHTS:
                 raise e2e_exceptions.BuildFailed(f"Cannot build {bins}")
-            build_func()
-            self.bins_built.append(bins)
+        assignments = self._build_assignments(bins_to_build)
+        try:
+            if not self.build_workers:
+                self._build_on_vm(self.bootstrap_vm, bins_to_build)
+            else:
+                self._build_on_workers(assignments)
+            if self.bins_built:
+                self._create_artifacts_bundles()
+        finally:
+            # The build profile is downloaded from the build workers as
+            # well, so it's written before they are removed.
+            if self.bins_built:
+                self._write_build_profile()
+            self._remove_build_workers()
 
     def up(self):
         self._create_metadata_artifact()
-        self._setup_capz_cluster()
+        if self.warm_pool_cluster:
+            self._attach_warm_pool_cluster()
+        else:
+            self._setup_capz_cluster()
 
     def down(self):
-        self.bootstrap_vm.remove()
-        self._delete_capz_rg()
+        if self.warm_pool_cluster and self._release_warm_pool_cluster():
+            return
+        try:
+            if self.opts.mgmt_kubeconfig:
+                # The cluster is deleted while the bootstrap VM, and its
+                # vNET peered with the cluster vNET, still exist.
+                self._delete_capz_namespace()
+        finally:
+            self.bootstrap_vm.remove()
+            self._delete_capz_rg()
 
     def collect_logs(self):
         if self.bootstrap_vm.is_deployed:
@@ -202,6 +303,209 @@ class CapzFlannelCI(e2e_base.CI):
         self._collect_linux_logs()
         self._collect_windows_logs()
 
+    def provision_warm_pool_cluster(self):
+        # Provisions a cluster for the warm pool, and marks it as ready to
+        # be claimed. The bootstrap VM is kept together with the cluster,
+        # since the cluster vNET is peered with the bootstrap VM vNET, and
+        # the re-created nodes download their bootstrap scripts from it. It
+        # is removed when the pool cluster is deleted.
+        self.warm_pool_provisioning = True
+        self.setup_bootstrap_vm()
+        self.up()
+        # The pool cluster nodes keep the pre-pulled images.
+        self._finish_images_prepull()
+        self.warm_pool.set_state(self.capz_namespace, warm_pool.STATE_READY)
+
+    def _claim_warm_pool_cluster(self):
+        if not self.opts.warm_pool or self.warm_pool_provisioning:
+            return False
+        if self.opts.build:
+            self.logging.info("The warm pool clusters cannot be used with "
+                              "custom builds")
+            return False
+        try:
+            name = self.warm_pool.claim(claimed_by=self.opts.cluster_name)
+        except Exception as e:
+            self.logging.warning(
+                "Failed to claim a warm pool cluster: %s", e)
+            return False
+        if not name:
+            self.logging.info("There is no ready warm pool cluster")
+            return False
+        self.warm_pool_cluster = name
+        self.opts.cluster_name = name
+        self.capz_namespace = name
+        # The bootstrap VM provisioned together with the claimed cluster.
+        self.bootstrap_vm = bootstrap_vm.BootstrapVM(self.opts, self.location)
+        return True
+
+    def _attach_warm_pool_cluster(self):
+        self.logging.info("Using the warm pool cluster %s",
+                          self.warm_pool_cluster)
+        self._setup_capz_kubeconfig()
+        self._setup_ssh_config()
+        self._start_images_prepull()
+        self.k8s_client.wait_running_pods(ignored_namespaces=[
+            e2e_images_prepull.ImagesPrepull.NAMESPACE])
+
+    def _release_warm_pool_cluster(self):
+        # The released cluster is deleted by the warm pool controller.
+        # Returns False if the release failed, and the cluster needs to be
+        # deleted by the job.
+        try:
+            self.warm_pool.release(self.warm_pool_cluster)
+        except Exception as e:
+            self.logging.warning(
+                "Failed to release the warm pool cluster %s: %s. Deleting "
+                "it", self.warm_pool_cluster, e)
+            return False
+        return True
+
+    def _is_bootstrap_vm_registry_cache(self):
+        return (self.opts.registry_cache and
+                not self.opts.registry_cache_address)
+
+    def _build_on_vm(self, vm, bins_to_build):
+        builder_mapping = {
+            "k8sbins": self._build_k8s_artifacts,
+            "containerdbins": self._build_containerd_binaries,
+            "containerdshim": self._build_containerd_shim,
+            "critools": self._build_cri_tools,
+            "sdncnibins": self._build_sdn_cni_binaries,
+        }
+        self._build_vm_local.vm = vm
+        for bins in bins_to_build:
+            self.logging.info("Building %s on %s", bins, vm.vm_name)
+            if self.go_build_cache:
+                self.go_build_cache.restore(vm, bins)
+            start = time.time()
+            builder_mapping[bins]()
+            if self.build_profiler:
+                self.build_profiler.add_component_duration(
+                    bins, time.time() - start)
+            if self.go_build_cache:
+                self.go_build_cache.save(vm, bins)
+            self.bins_built.append(bins)
+        if vm is not self.bootstrap_vm:
+            vm.sync_artifacts()
+
+    def _build_on_workers(self, assignments):
+        # Every build VM runs its builds in its own thread. The bootstrap VM
+        # runs builds as well.
+        errors = []
+
+        def _build(vm, vm_bins):
+            try:
+                self._build_on_vm(vm, vm_bins)
+            except Exception as e:
+                self.logging.error("Build failed on %s: %s", vm.vm_name, e)
+                errors.append(e)
+
+        threads = []
+        for vm, vm_bins in assignments.items():
+            if not vm_bins:
+                continue
+            thread = threading.Thread(
+                target=_build, args=(vm, vm_bins),
+                name=f"build-{vm.vm_name}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def _build_assignments(self, bins_to_build):
+        # Assigns the builds to the build VMs, the longest first, each one
+        # to the least loaded VM.
+        vms = [self.bootstrap_vm] + self.build_workers
+        assignments = {vm: [] for vm in vms}
+        loads = {vm: 0 for vm in vms}
+        bins_to_build = sorted(
+            bins_to_build, key=lambda b: self.BUILD_WEIGHTS.get(b, 1),
+            reverse=True)
+        for bins in bins_to_build:
+            vm = min(vms, key=lambda v: loads[v])
+            assignments[vm].append(bins)
+            loads[vm] += self.BUILD_WEIGHTS.get(bins, 1)
+        return assignments
+
+    def _start_build_workers_setup(self, assignments):
+        workers_setup = []
+        for worker in self.build_workers:
+            setup = {"worker": worker, "error": None}
+
+            def _setup(worker=worker, setup=setup):
+                try:
+                    worker.setup(
+                        git_repos=self._git_repos(assignments[worker]))
+                except Exception as e:
+                    setup["error"] = e
+
+            setup["thread"] = threading.Thread(
+                target=_setup, name=f"setup-{worker.vm_name}", daemon=True)
+            setup["thread"].start()
+            workers_setup.append(setup)
+        return workers_setup
+
+    def _wait_build_workers_setup(self, workers_setup):
+        # The builds of the failed workers are reassigned to the others, or
+        # to the bootstrap VM.
+        for setup in workers_setup:
+            setup["thread"].join()
+            if setup["error"]:
+                self.logging.warning(
+                    "Failed to set up the build worker %s: %s",
+                    setup["worker"].vm_name, setup["error"])
+                self.build_workers.remove(setup["worker"])
+
+    def _remove_build_workers(self):
+        for worker in self.build_workers:
+            threading.Thread(
+                target=e2e_utils.retry_on_error()(worker.remove),
+                name=f"remove-{worker.vm_name}", daemon=True).start()
+        self.build_workers = []
+
+    def _git_repos(self, bins_to_build):
+        repos = {
+            "k8sbins": (
+                self.opts.k8s_repo, self.opts.k8s_branch, self.k8s_path),
+            "containerdbins": (
+                self.opts.containerd_repo, self.opts.containerd_branch,
+                self.containerd_path),
+            "containerdshim": (
+                self.opts.containerd_shim_repo,
+                self.opts.containerd_shim_branch, self.containerd_shim_path),
+            "critools": (
+                self.opts.cri_tools_repo, self.opts.cri_tools_branch,
+                self.cri_tools_path),
+            "sdncnibins": (
+                self.opts.sdn_repo, self.opts.sdn_branch, self.sdn_path),
+        }
+        return [repos[bins] for bins in bins_to_build if bins in repos]
+
+    def _is_bootstrap_vm_used_by_tests(self):
+        if self._is_bootstrap_vm_registry_cache():
+            return True
+        # The '--e2e-bin' is downloaded through the HTTP cache.
+        return bool(self.opts.http_cache and self.opts.e2e_bin and
+                    e2e_utils.is_immutable_url(self.opts.e2e_bin))
+
+    def _setup_registry_cache(self):
+        if self.opts.registry_cache_address:
+            self.registry_cache_address = self.opts.registry_cache_address
+        elif self._is_bootstrap_vm_registry_cache():
+            self.bootstrap_vm.setup_registry_cache(
+                self._registry_cache_layout())
+            self.registry_cache_address = self.bootstrap_vm.private_ip
+        if self.registry_cache_address:
+            self.logging.info("Using the registry cache %s",
+                              self.registry_cache_address)
+
+    def _registry_cache_layout(self):
+        return e2e_registry_cache.load_layout(
+            os.path.join(self.e2e_runner_dir, "registry-cache.yaml"))
+
     def _get_location(self, location=None):
         if not location:
             location = e2e_azure_utils.get_least_used_location(
@@ -437,6 +741,7 @@ class CapzFlannelCI(e2e_base.CI):
             args=[
                 "get", "cluster", self.opts.cluster_name,
                 "--kubeconfig", self.mgmt_kubeconfig_path,
+                "-n", self.capz_namespace,
                 "--no-headers",
                 "-o", "custom-columns=ADDRESS:.spec.controlPlaneEndpoint.host",  # noqa:
             ],
@@ -449,6 +754,7 @@ class CapzFlannelCI(e2e_base.CI):
             args=[
                 "get", "cluster", self.opts.cluster_name,
                 "--kubeconfig", self.mgmt_kubeconfig_path,
+                "-n", self.capz_namespace,
                 "--no-headers",
                 "-o", "custom-columns=PORT:.spec.controlPlaneEndpoint.port",  # noqa:
             ],
@@ -460,18 +766,25 @@ class CapzFlannelCI(e2e_base.CI):
     def _setup_capz_cluster(self):
         try:
             start = time.time()
-            self._setup_mgmt_cluster()
-            self._setup_mgmt_kubeconfig()
-            self._setup_capz_components()
+            if self.opts.mgmt_kubeconfig:
+                self._setup_capz_namespace()
+            else:
+                self._setup_mgmt_cluster()
+                self._setup_mgmt_kubeconfig()
+                self._setup_capz_components()
+            self._start_machine_timeline()
             self._create_capz_cluster()
             self._wait_capz_control_plane(timeout=600)
             self._setup_capz_kubeconfig()
             self._add_azure_cloud_provider()
             self._add_flannel_cni()
             self._wait_windows_agents(timeout=1000) # server 2025 is ocassionally taking a little longer to boot
+            self._start_images_prepull()
+            self._stop_machine_timeline()
             self._setup_ssh_config()
             self._add_kube_proxy_windows()
-            self.k8s_client.wait_running_pods()
+            self.k8s_client.wait_running_pods(ignored_namespaces=[
+                e2e_images_prepull.ImagesPrepull.NAMESPACE])
             self._validate_k8s_api_versions()
             elapsed = time.time() - start
             self.logging.info(
@@ -479,6 +792,7 @@ class CapzFlannelCI(e2e_base.CI):
         except Exception as ex:
             self.logging.error(
                 "Failed to create CAPZ cluster. Exception details: %s", ex)
+            self._stop_machine_timeline()
             self._cleanup_capz_cluster()
             raise ex
 
@@ -489,6 +803,63 @@ class CapzFlannelCI(e2e_base.CI):
                 "kind create cluster --config ~/kind-config.yaml --wait 15m"
             ],
         )
+        self._load_mgmt_images()
+
+    def _setup_clusterctl_repository(self):
+        if not self.clusterctl_repository:
+            return
+        try:
+            self.clusterctl_repository.setup()
+        except Exception as e:
+            self.logging.warning(
+                "Failed to set up the local clusterctl repository: %s. "
+                "Using the upstream providers repositories", e)
+            self.clusterctl_repository = None
+
+    def _start_mgmt_images_pull(self):
+        # The management cluster providers images are pulled on the
+        # bootstrap VM in the background, and loaded into the kind node
+        # once it's created.
+        if not self.clusterctl_repository or \
+           not self.opts.preload_mgmt_images:
+            return
+        images = self.clusterctl_repository.images()
+        pull = {"images": images, "error": None}
+
+        def _pull():
+            try:
+                self.bootstrap_vm.exec([
+                    f"echo {' '.join(images)} | "
+                    "xargs -n 1 -P 8 docker pull --quiet",
+                ], timeout=1800)
+            except Exception as e:
+                pull["error"] = e
+
+        self.logging.info("Pulling %d management cluster images",
+                          len(images))
+        pull["thread"] = threading.Thread(
+            target=_pull, name="mgmt-images-pull", daemon=True)
+        pull["thread"].start()
+        self.mgmt_images_pull = pull
+
+    def _load_mgmt_images(self):
+        pull = self.mgmt_images_pull
+        if not pull:
+            return
+        self.mgmt_images_pull = None
+        pull["thread"].join()
+        if pull["error"]:
+            self.logging.warning(
+                "Failed to pull the management cluster images: %s",
+                pull["error"])
+            return
+        self.logging.info("Loading the management cluster images into kind")
+        try:
+            self.bootstrap_vm.exec(
+                [f"kind load docker-image {' '.join(pull['images'])}"])
+        except Exception as e:
+            self.logging.warning(
+                "Failed to load the management cluster images: %s", e)
 
     def _setup_mgmt_kubeconfig(self):
         self.logging.info("Setting up the management cluster kubeconfig")
@@ -505,27 +876,103 @@ class CapzFlannelCI(e2e_base.CI):
         with open(self.mgmt_kubeconfig_path, 'w') as f:
             f.write(yaml.safe_dump(cfg))
 
-    def _setup_capz_components(self):
+    def _setup_capz_namespace(self):
+        self.logging.info("Creating the namespace %s in the shared "
+                          "management cluster", self.capz_namespace)
+        e2e_utils.exec_kubectl([
+            "create", "namespace", self.capz_namespace,
+            "--kubeconfig", self.mgmt_kubeconfig_path,
+        ])
+        if self.warm_pool_provisioning:
+            self.warm_pool.set_state(
+                self.capz_namespace, warm_pool.STATE_PROVISIONING)
+        self._create_cluster_identity_secret()
+
+    def _delete_capz_namespace(self, wait=False):
+        # The cluster is deleted before its namespace, while the cluster
+        # identity secret still exists. Otherwise, the providers cannot
+        # delete the Azure resources, and the namespace deletion is stuck
+        # on the CAPZ objects finalizers.
+        self.logging.info("Deleting the namespace %s from the shared "
+                          "management cluster", self.capz_namespace)
+        try:
+            self._delete_capi_cluster()
+        except Exception as e:
+            # Once the Azure resources are gone, the providers can complete
+            # the cluster deletion.
+            self.logging.warning(
+                "Failed to delete the CAPZ cluster %s: %s. Retrying after "
+                "its resource group is deleted", self.opts.cluster_name, e)
+            self._delete_capz_rg(wait=True)
+            self._delete_capi_cluster()
+        e2e_utils.exec_kubectl([
+            "delete", "namespace", self.capz_namespace,
+            "--kubeconfig", self.mgmt_kubeconfig_path,
+            "--ignore-not-found", f"--wait={str(wait).lower()}",
+        ])
+
+    def _delete_capi_cluster(self):
+        # Waits until the cluster, and its Azure resources, are deleted.
+        e2e_utils.exec_kubectl([
+            "delete", "cluster", self.opts.cluster_name,
+            "--kubeconfig", self.mgmt_kubeconfig_path,
+            "-n", self.capz_namespace,
+            "--ignore-not-found", "--timeout=30m",
+        ], retries=1)
+
+    def _create_cluster_identity_secret(self):
         self.logging.info("Creating CAPI cluster identity")
         self.mgmt_k8s_client.create_secret(
             name="cluster-identity-secret",
             secret_name="clientSecret",
             secret_value=os.environ["AZURE_CLIENT_SECRET"],
+            namespace=self.capz_namespace,
         )
+
+    def _setup_capz_components(self):
+        self._create_cluster_identity_secret()
         self.logging.info("Setup the Azure Cluster API components")
         clusterctlEnv = {}
         if os.environ.get("GITHUB_TOKEN"):
             clusterctlEnv["GITHUB_TOKEN"] = os.environ.get("GITHUB_TOKEN")
+        cmd = [
+            "clusterctl", "init",
+            "--kubeconfig", self.mgmt_kubeconfig_path,
+            "--wait-providers",
+        ]
+        if self.clusterctl_repository:
+            cmd += self.clusterctl_repository.init_args()
+        else:
+            cmd += ["--infrastructure", "azure"]
         e2e_utils.retry_on_error()(e2e_utils.run_shell_cmd)(
-            cmd=[
-                "clusterctl", "init",
-                "--kubeconfig", self.mgmt_kubeconfig_path,
-                "--infrastructure", "azure",
-                "--wait-providers",
-            ],
+            cmd=cmd,
             env=clusterctlEnv,
         )
 
+    def _start_machine_timeline(self):
+        if self.opts.machine_timeline_interval <= 0:
+            return
+        self.machine_timeline = machine_timeline.MachineTimelineRecorder(
+            self.mgmt_kubeconfig_path,
+            namespace=self.capz_namespace,
+            interval=self.opts.machine_timeline_interval)
+        self.machine_timeline.start()
+
+    def _stop_machine_timeline(self):
+        # The timeline must be saved before the management cluster is
+        # deleted, otherwise the CAPI objects are gone.
+        if not self.machine_timeline:
+            return
+        self.machine_timeline.stop()
+        try:
+            self.machine_timeline.write_artifact(
+                os.path.join(self.opts.artifacts_directory,
+                             "capz-machines-timeline.json"))
+        except Exception as e:
+            self.logging.warning(
+                "Failed to write the CAPI machines timeline: %s", e)
+        self.machine_timeline = None
+
     def _create_capz_cluster(self):
         self.logging.info("Create CAPZ cluster")
         output_file = "/tmp/capz-cluster.yaml"
@@ -552,10 +999,12 @@ class CapzFlannelCI(e2e_base.CI):
         )
         context = {
             "cluster_name": self.opts.cluster_name,
+            "capz_namespace": self.capz_namespace,
             "resource_group_tags": self.resource_group_tags,
 
             "bootstrap_vm_vnet_name": self.bootstrap_vm.vnet_name,
             "bootstrap_vm_endpoint": f"{self.bootstrap_vm.private_ip}:8081",
+            "registry_mirrors": self._registry_mirrors(),
 
             "vnet_cidr": self.opts.vnet_cidr_block,
             "control_plane_subnet_cidr": control_plane_subnet_cidr,
@@ -590,6 +1039,12 @@ class CapzFlannelCI(e2e_base.CI):
         }
         return context
 
+    def _registry_mirrors(self):
+        if not self.registry_cache_address:
+            return None
+        return e2e_registry_cache.registry_mirrors(
+            self.registry_cache_address, self._registry_cache_layout())
+
     def _capz_images_version_prefix(self):
         ver = self.kubernetes_version
         if "k8sbins" in self.bins_built:
@@ -604,14 +1059,34 @@ class CapzFlannelCI(e2e_base.CI):
         v = ver.strip("v").split(".")
         return f"{v[0]}.{v[1]}"
 
-    def _capz_image_latest_version(self, gallery_name, image_name):
+    def _run_fingerprint_inputs(self):
+        inputs = super(CapzFlannelCI, self)._run_fingerprint_inputs()
+        # The gallery images versions are resolved as they will be when the
+        # cluster is created, after the K8s binaries (if any) are built.
+        ver = self.kubernetes_version
+        if "k8sbins" in self.opts.build:
+            ver = e2e_constants.DEFAULT_KUBERNETES_VERSION
+        v = ver.strip("v").split(".")
+        prefix = f"{v[0]}.{v[1]}"
+        inputs["capz_images_versions"] = {
+            image_name: self._capz_image_latest_version(
+                self.capz_sig_image_gallery, image_name, prefix=prefix)
+            for image_name in [self.capz_sig_ubuntu_image_name,
+                               self.capz_sig_windows_image_name]
+        }
+        return inputs
+
+    def _capz_image_latest_version(self, gallery_name, image_name,
+                                   prefix=None):
         img_vers = e2e_utils.retry_on_error()(
             self.compute_client.community_gallery_image_versions.list)(
                 location=self.location,
                 public_gallery_name=gallery_name,
                 gallery_image_name=image_name
             )
-        prefix = self._capz_sig_gallery_version_prefix(is_node_setup=True)
+        if prefix is None:
+            prefix = self._capz_sig_gallery_version_prefix(
+                is_node_setup=True)
         vers = [i.name for i in img_vers if i.name.startswith(prefix)]
         vers.sort()
         return vers[-1]
@@ -651,6 +1126,7 @@ class CapzFlannelCI(e2e_base.CI):
                     args=[
                         "get", "machine", "-l", f"'{selector}'",
                         "--kubeconfig", self.mgmt_kubeconfig_path,
+                        "-n", self.capz_namespace,
                         "-o", f"jsonpath=\"{{.items[?(@.status.phase == '{status}')].metadata.name}}\"",  # noqa:
                     ],
                     capture_output=True,
@@ -670,6 +1146,7 @@ class CapzFlannelCI(e2e_base.CI):
             cmd=[
                 "clusterctl", "get", "kubeconfig",
                 "--kubeconfig", self.mgmt_kubeconfig_path,
+                "--namespace", self.capz_namespace,
                 self.opts.cluster_name,
             ],
             capture_output=True,
@@ -823,6 +1300,9 @@ class CapzFlannelCI(e2e_base.CI):
         if ("k8sbins" not in self.bins_built) and (self.kubernetes_version != e2e_constants.DEFAULT_KUBERNETES_VERSION):  # noqa:
             # The kube-proxy bundled with the container image is different
             # than the one needed for this job run. So, we update it.
+            kube_proxy_url = e2e_utils.http_cache_url(
+                f"https://dl.k8s.io/{self.kubernetes_version}/bin/windows/amd64/kube-proxy.exe",  # noqa:
+                self.http_cache_endpoint)
             for node_address in self.windows_private_addresses:
                 self._run_node_cmd(
                     node_address=node_address,
@@ -830,7 +1310,7 @@ class CapzFlannelCI(e2e_base.CI):
                 )
                 self._run_node_cmd(
                     node_address=node_address,
-                    cmd=f"curl.exe --fail -L -o /build/kube-proxy.exe https://dl.k8s.io/{self.kubernetes_version}/bin/windows/amd64/kube-proxy.exe",  # noqa:
+                    cmd=f"curl.exe --fail -L -o /build/kube-proxy.exe {kube_proxy_url}",  # noqa:
                 )
         context = {
             "cni_version": self.opts.cni_version,
@@ -878,8 +1358,12 @@ class CapzFlannelCI(e2e_base.CI):
     def _cleanup_capz_cluster(self):
         self._collect_bootstrap_vm_logs()
 
-        self.logging.info("Deleting the mgmt cluster")
-        self.bootstrap_vm.exec(["kind delete cluster"])
+        if self.opts.mgmt_kubeconfig:
+            # The namespace is recreated by the next attempt.
+            self._delete_capz_namespace(wait=True)
+        else:
+            self.logging.info("Deleting the mgmt cluster")
+            self.bootstrap_vm.exec(["kind delete cluster"])
 
         self._delete_capz_rg(wait=True)
         self.bootstrap_vm.cleanup_vnet_peerings()
@@ -889,10 +1373,16 @@ class CapzFlannelCI(e2e_base.CI):
             "node-role.kubernetes.io/control-plane",
         ]
 
+    def _smoke_tests_windows_node_port(self):
+        # With the Flannel l2bridge (host-gw) mode, the Windows pods cannot
+        # reach the node ports through the other nodes addresses.
+        return self.opts.flannel_mode != e2e_constants.FLANNEL_MODE_L2BRIDGE
+
     @e2e_utils.retry_on_error()
     def _build_k8s_linux_bins(self):
         self.logging.info("Building K8s Linux binaries")
-        self.bootstrap_vm.exec(
+        self._exec_build(
+            "k8sbins", "k8s-linux-bins",
             script=[
                 'make WHAT="cmd/kubectl cmd/kubelet cmd/kubeadm" KUBE_BUILD_PLATFORMS="linux/amd64"',  # noqa:
             ],
@@ -901,7 +1391,8 @@ class CapzFlannelCI(e2e_base.CI):
     @e2e_utils.retry_on_error()
     def _build_k8s_windows_bins(self):
         self.logging.info("Building K8s Windows binaries")
-        self.bootstrap_vm.exec(
+        self._exec_build(
+            "k8sbins", "k8s-windows-bins",
             script=[
                 'make WHAT="cmd/kubectl cmd/kubelet cmd/kubeadm cmd/kube-proxy" KUBE_BUILD_PLATFORMS="windows/amd64"',  # noqa:
             ],
@@ -910,7 +1401,8 @@ class CapzFlannelCI(e2e_base.CI):
     @e2e_utils.retry_on_error()
     def _build_k8s_linux_daemonset_images(self):
         self.logging.info("Building K8s Linux DaemonSet container images")
-        self.bootstrap_vm.exec(
+        self._exec_build(
+            "k8sbins", "k8s-linux-images",
             script=[
                 "KUBE_FASTBUILD=true KUBE_BUILD_CONFORMANCE=y make quick-release-images",  # noqa:
             ],
@@ -918,9 +1410,9 @@ class CapzFlannelCI(e2e_base.CI):
 
     def _copy_k8s_build_artifacts(self):
         self.logging.info("Copying K8s artifacts to their own directory")
-        linux_bin_dir = f"{self.bootstrap_vm.artifacts_dir}/kubernetes/bin/linux/amd64"  # noqa:
-        windows_bin_dir = f"{self.bootstrap_vm.artifacts_dir}/kubernetes/bin/windows/amd64"  # noqa:
-        images_dir = f"{self.bootstrap_vm.artifacts_dir}/kubernetes/images"
+        linux_bin_dir = f"{self._build_vm.artifacts_dir}/kubernetes/bin/linux/amd64"  # noqa:
+        windows_bin_dir = f"{self._build_vm.artifacts_dir}/kubernetes/bin/windows/amd64"  # noqa:
+        images_dir = f"{self._build_vm.artifacts_dir}/kubernetes/images"
 
         script = [f"mkdir -p {linux_bin_dir} {windows_bin_dir} {images_dir}"]
 
@@ -948,13 +1440,65 @@ class CapzFlannelCI(e2e_base.CI):
         script.append(f"mv {images_dir}/conformance-amd64.tar {images_dir}/conformance.tar")  # noqa:
         script.append(f"chmod 644 {images_dir}/*")
 
-        self.bootstrap_vm.exec(script)
+        self._build_vm.exec(script)
+
+    def _exec_build(self, component, step, script, cwd):
+        if self.build_profiler:
+            script = self.build_profiler.wrap(
+                self._build_vm, component, step, script)
+        self._build_vm.exec(script=script, cwd=cwd)
+
+    def _write_build_profile(self):
+        if not self.build_profiler:
+            return
+        try:
+            self.build_profiler.write(self.opts.artifacts_directory)
+        except Exception as e:
+            self.logging.warning("Failed to write the build profile: %s", e)
+
+    def _create_artifacts_bundles(self):
+        # The Windows nodes download one bundle per component, verified
+        # with the manifest. The manifest is kept as the build record.
+        self.logging.info("Creating the CI artifacts bundles")
+        self.bootstrap_vm.upload(
+            os.path.join(self.capz_flannel_dir, "bundles/create-bundles.py"),
+            "/tmp/create-bundles.py")
+        self.bootstrap_vm.exec([
+            f"python3 /tmp/create-bundles.py {self.bootstrap_vm.artifacts_dir}"
+        ])
+        self.bootstrap_vm.download(
+            f"{self.bootstrap_vm.artifacts_dir}/manifest.json",
+            os.path.join(self.opts.artifacts_directory, "build-manifest.json"))
+
+    def _select_tests_from_changes(self):
+        # Narrow the E2E tests focus to the tests covering the K8s paths
+        # changed since the merge base with the test selection base.
+        stdout, _ = self._build_vm.exec(  # pyright: ignore
+            script=[
+                f"git fetch --quiet {self.opts.test_selection_base_repo} "
+                f"{self.opts.test_selection_base}",
+                "git diff --name-only FETCH_HEAD...HEAD",
+            ],
+            cwd=self.k8s_path,
+            timeout=900,
+            return_result=True)
+        changed_files = stdout.decode().split()
+        mapping = e2e_test_selection.load_mapping(
+            os.path.join(self.e2e_runner_dir, "test-selection.yaml"))
+        focus_regex = e2e_test_selection.select_focus_regex(
+            changed_files, mapping)
+        if not focus_regex:
+            return
+        self.logging.info(
+            "Selected the E2E tests for %d changed file(s). Focus regex: %s",
+            len(changed_files), focus_regex)
+        self.test_selection_focus_regex = focus_regex
 
     def _set_k8s_build_version(self):
         # Discover the K8s version built
         kubeadm_bin = os.path.join(
             self.k8s_path, "_output/local/bin/linux/amd64/kubeadm")
-        stdout, _ = self.bootstrap_vm.exec(  # pyright: ignore
+        stdout, _ = self._build_vm.exec(  # pyright: ignore
             script=[
                 f"{kubeadm_bin} version -o=short",
             ],
@@ -963,11 +1507,13 @@ class CapzFlannelCI(e2e_base.CI):
         self.kubernetes_version = stdout.decode().strip()
 
     def _build_k8s_artifacts(self):
-        self.bootstrap_vm.clone_git_repo(
+        self._build_vm.clone_git_repo(
             self.opts.k8s_repo,
             self.opts.k8s_branch,
             self.k8s_path,
         )
+        if self.opts.test_selection_base:
+            self._select_tests_from_changes()
         self._build_k8s_linux_bins()
         self._build_k8s_windows_bins()
         self._build_k8s_linux_daemonset_images()
@@ -978,7 +1524,7 @@ class CapzFlannelCI(e2e_base.CI):
         self.logging.info(
             "Copying containerd binaries to artifacts directory")
         artifacts_containerd_bin_dir = os.path.join(
-            self.bootstrap_vm.artifacts_dir, "containerd/bin"
+            self._build_vm.artifacts_dir, "containerd/bin"
         )
         script = [f"mkdir -p {artifacts_containerd_bin_dir}"]
         containerd_bins = os.path.join(self.containerd_path, "bin")
@@ -991,12 +1537,13 @@ class CapzFlannelCI(e2e_base.CI):
             f"{containerd_bins}/cri-tools/usr/local/bin/crictl.exe "
             f"{containerd_bins}/cri-tools/usr/local/bin/critest.exe "
             f"{artifacts_containerd_bin_dir}")
-        self.bootstrap_vm.exec(script)
+        self._build_vm.exec(script)
 
     @e2e_utils.retry_on_error()
     def _build_containerd_windows_bins(self):
         self.logging.info("Building containerd binaries")
-        self.bootstrap_vm.exec(
+        self._exec_build(
+            "containerdbins", "containerd-windows-bins",
             script=[
                 "VERSION=1.7.0+unknown GOOS=windows make binaries",  # noqa: TODO(ibalutoiu): This hard-coded version needs to be removed once containerd v1.7.0 gets released.
                 "GOOS=windows make -f Makefile.windows bin/containerd-shim-runhcs-v1.exe",  # noqa:
@@ -1005,7 +1552,7 @@ class CapzFlannelCI(e2e_base.CI):
             cwd=self.containerd_path)
 
     def _build_containerd_binaries(self):
-        self.bootstrap_vm.clone_git_repo(
+        self._build_vm.clone_git_repo(
             self.opts.containerd_repo,
             self.opts.containerd_branch,
             self.containerd_path,
@@ -1016,7 +1563,8 @@ class CapzFlannelCI(e2e_base.CI):
     @e2e_utils.retry_on_error()
     def _build_containerd_shim_windows_bins(self):
         self.logging.info("Building containerd shim")
-        self.bootstrap_vm.exec(
+        self._exec_build(
+            "containerdshim", "containerd-shim-windows-bins",
             script=[
                 "GOOS=windows GO111MODULE=on go build -mod=vendor -o containerd-shim-runhcs-v1.exe ./cmd/containerd-shim-runhcs-v1",  # noqa:
             ],
@@ -1027,17 +1575,17 @@ class CapzFlannelCI(e2e_base.CI):
         self.logging.info(
             "Copying containerd-shim build to artifacts directory")
         artifacts_containerd_bin_dir = os.path.join(
-            self.bootstrap_vm.artifacts_dir, "containerd-shim/bin"
+            self._build_vm.artifacts_dir, "containerd-shim/bin"
         )
         script = [f"mkdir -p {artifacts_containerd_bin_dir}"]
         containerd_shim_bin = os.path.join(
             self.containerd_shim_path, "containerd-shim-runhcs-v1.exe")
         script.append(
             f"cp {containerd_shim_bin} {artifacts_containerd_bin_dir}")
-        self.bootstrap_vm.exec(script)
+        self._build_vm.exec(script)
 
     def _build_containerd_shim(self):
-        self.bootstrap_vm.clone_git_repo(
+        self._build_vm.clone_git_repo(
             self.opts.containerd_shim_repo,
             self.opts.containerd_shim_branch,
             self.containerd_shim_path,
@@ -1048,7 +1596,8 @@ class CapzFlannelCI(e2e_base.CI):
     @e2e_utils.retry_on_error()
     def _build_cri_tools_windows_bins(self):
         self.logging.info("Building cri-tools")
-        self.bootstrap_vm.exec(
+        self._exec_build(
+            "critools", "cri-tools-windows-bins",
             script=[
                 "GOOS=windows make binaries",
             ],
@@ -1057,7 +1606,7 @@ class CapzFlannelCI(e2e_base.CI):
     def _copy_cri_tools_build_artifacts(self):
         self.logging.info("Copying cri-tools build to artifacts directory")
         artifacts_cri_tools_bin_dir = os.path.join(
-            self.bootstrap_vm.artifacts_dir, "cri-tools/bin"
+            self._build_vm.artifacts_dir, "cri-tools/bin"
         )
         script = [f"mkdir -p {artifacts_cri_tools_bin_dir}"]
         cri_tools_bins = os.path.join(self.cri_tools_path, "build/bin")
@@ -1067,10 +1616,10 @@ class CapzFlannelCI(e2e_base.CI):
             f"{cri_tools_bins}/critest.exe "
             f"{artifacts_cri_tools_bin_dir}"
         )
-        self.bootstrap_vm.exec(script)
+        self._build_vm.exec(script)
 
     def _build_cri_tools(self):
-        self.bootstrap_vm.clone_git_repo(
+        self._build_vm.clone_git_repo(
             self.opts.cri_tools_repo,
             self.opts.cri_tools_branch,
             self.cri_tools_path,
@@ -1081,7 +1630,8 @@ class CapzFlannelCI(e2e_base.CI):
     @e2e_utils.retry_on_error()
     def _build_sdn_cni_windows_bins(self):
         self.logging.info("Building the SDN CNI binaries")
-        self.bootstrap_vm.exec(
+        self._exec_build(
+            "sdncnibins", "sdn-cni-windows-bins",
             script=[
                 "GOOS=windows make all",
             ],
@@ -1090,16 +1640,16 @@ class CapzFlannelCI(e2e_base.CI):
     def _copy_sdn_cni_build_artifacts(self):
         self.logging.info("Copying SDN CNI binaries to artifacts directory")
         artifacts_cni_dir = os.path.join(
-            self.bootstrap_vm.artifacts_dir, "cni/bin"
+            self._build_vm.artifacts_dir, "cni/bin"
         )
         script = [f"mkdir -p {artifacts_cni_dir}"]
         for sdn_bin_name in ["nat.exe", "sdnbridge.exe", "sdnoverlay.exe"]:
             sdn_bin = os.path.join(self.sdn_path, "out", sdn_bin_name)
             script.append(f"cp {sdn_bin} {artifacts_cni_dir}")
-        self.bootstrap_vm.exec(script)
+        self._build_vm.exec(script)
 
     def _build_sdn_cni_binaries(self):
-        self.bootstrap_vm.clone_git_repo(
+        self._build_vm.clone_git_repo(
             self.opts.sdn_repo,
             self.opts.sdn_branch,
             self.sdn_path
@@ -0,0 +1,106 @@
+import os
+import re
+
+import yaml
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import utils as e2e_utils
+
+CAPI_RELEASES_URL = "https://github.com/kubernetes-sigs/cluster-api/releases/download"  # noqa:
+CAPZ_RELEASES_URL = "https://github.com/kubernetes-sigs/cluster-api-provider-azure/releases/download"  # noqa:
+CERT_MANAGER_RELEASES_URL = "https://github.com/cert-manager/cert-manager/releases/download"  # noqa:
+
+IMAGE_REGEX = re.compile(r"^\s*-?\s*image:\s*[\"']?([^\s\"']+)", re.MULTILINE)
+
+
+class ClusterctlRepository(object):
+    # Local clusterctl providers repository, with pinned provider versions.
+    # The provider manifests are downloaded only once per version, and the
+    # management cluster initialization doesn't depend on GitHub anymore.
+
+    def __init__(self, repository_dir, capi_version, capz_version,
+                 cert_manager_version):
+        self.logging = e2e_logger.get_logger(__name__)
+        self.repository_dir = os.path.expanduser(repository_dir)
+        self.capi_version = capi_version
+        self.capz_version = capz_version
+        self.cert_manager_version = cert_manager_version
+        self.config_file = os.path.join(self.repository_dir, "clusterctl.yaml")
+
+    @property
+    def providers(self):
+        # (name, type, label, version, components file, releases URL)
+        return [
+            ("cluster-api", "CoreProvider", "cluster-api",
+             self.capi_version, "core-components.yaml", CAPI_RELEASES_URL),
+            ("kubeadm", "BootstrapProvider", "bootstrap-kubeadm",
+             self.capi_version, "bootstrap-components.yaml",
+             CAPI_RELEASES_URL),
+            ("kubeadm", "ControlPlaneProvider", "control-plane-kubeadm",
+             self.capi_version, "control-plane-components.yaml",
+             CAPI_RELEASES_URL),
+            ("azure", "InfrastructureProvider", "infrastructure-azure",
+             self.capz_version, "infrastructure-components.yaml",
+             CAPZ_RELEASES_URL),
+        ]
+
+    def setup(self):
+        # Downloads the missing manifests, and writes the clusterctl config.
+        config = {"providers": []}
+        for name, provider_type, label, version, components_file, url in self.providers:  # noqa:
+            version_dir = os.path.join(self.repository_dir, label, version)
+            for file_name in [components_file, "metadata.yaml"]:
+                self._download(f"{url}/{version}/{file_name}",
+                               os.path.join(version_dir, file_name))
+            config["providers"].append({
+                "name": name,
+                "type": provider_type,
+                "url": os.path.join(version_dir, components_file),
+            })
+        cert_manager_file = os.path.join(
+            self.repository_dir, "cert-manager", self.cert_manager_version,
+            "cert-manager.yaml")
+        self._download(
+            f"{CERT_MANAGER_RELEASES_URL}/{self.cert_manager_version}/"
+            "cert-manager.yaml", cert_manager_file)
+        config["cert-manager"] = {
+            "url": cert_manager_file,
+            "version": self.cert_manager_version,
+        }
+        with open(self.config_file, "w") as f:
+            f.write(yaml.safe_dump(config))
+
+    def init_args(self):
+        return [
+            "--config", self.config_file,
+            "--core", f"cluster-api:{self.capi_version}",
+            "--bootstrap", f"kubeadm:{self.capi_version}",
+            "--control-plane", f"kubeadm:{self.capi_version}",
+            "--infrastructure", f"azure:{self.capz_version}",
+        ]
+
+    def images(self):
+        # The container images used by the providers and cert-manager. The
+        # images with variables in their names are skipped.
+        manifests = [
+            os.path.join(self.repository_dir, label, version, components)
+            for _, _, label, version, components, _ in self.providers
+        ]
+        manifests.append(os.path.join(
+            self.repository_dir, "cert-manager", self.cert_manager_version,
+            "cert-manager.yaml"))
+        images = set()
+        for manifest in manifests:
+            with open(manifest) as f:
+                for image in IMAGE_REGEX.findall(f.read()):
+                    if "${" not in image:
+                        images.add(image)
+        return sorted(images)
+
+    def _download(self, url, path):
+        if os.path.exists(path):
+            return
+        self.logging.info("Downloading %s", url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        e2e_utils.retry_on_error()(e2e_utils.download_file)(
+            url, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
@@ -0,0 +1,156 @@
+import json
+import threading
+
+import pendulum
+import yaml
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import utils as e2e_utils
+
+
+class MachineTimelineRecorder(object):
+    RESOURCES = [
+        "machines.cluster.x-k8s.io",
+        "azuremachines.infrastructure.cluster.x-k8s.io",
+        "kubeadmconfigs.bootstrap.cluster.x-k8s.io",
+    ]
+
+    def __init__(self, kubeconfig_path, namespace="default", interval=10):
+        self.logging = e2e_logger.get_logger(__name__)
+        self.kubeconfig_path = kubeconfig_path
+        self.namespace = namespace
+        self.interval = interval
+        # Last observed state for every object, used to detect transitions.
+        self.states = {}
+        self.events = {}
+        self.machines_refs = {}
+        self._lock = threading.Lock()
+        self._task = e2e_utils.PeriodicTask(
+            self.poll, interval, name="machine-timeline-recorder")
+
+    def start(self):
+        self.logging.info("Starting CAPI machines timeline recorder")
+        self._task.start()
+
+    def stop(self):
+        self._task.stop()
+        # Make sure that the final state is recorded as well.
+        try:
+            self.poll()
+        except Exception as e:
+            self.logging.warning("Failed to poll CAPI objects: %s", e)
+        self.logging.info("Stopped CAPI machines timeline recorder")
+
+    def poll(self):
+        output, _ = e2e_utils.exec_kubectl(  # pyright: ignore
+            args=[
+                "get", ",".join(self.RESOURCES),
+                "--kubeconfig", self.kubeconfig_path,
+                "-n", self.namespace,
+                "-o", "yaml",
+            ],
+            capture_output=True,
+            hide_cmd=True,
+            retries=1,
+        )
+        objects = yaml.safe_load(output)  # pyright: ignore
+        observed_at = pendulum.now(tz="UTC").to_iso8601_string()
+        with self._lock:
+            for obj in objects.get("items") or []:
+                self._record_object(obj, observed_at)
+
+    def timeline(self):
+        with self._lock:
+            machines = {}
+            for machine_name, refs in self.machines_refs.items():
+                events = []
+                for key in [("Machine", machine_name), *refs]:
+                    events += self.events.get(key, [])
+                events.sort(key=lambda e: e["time"])
+                machines[machine_name] = {
+                    "events": events,
+                    "milestones": self._milestones(events),
+                }
+            return machines
+
+    def write_artifact(self, output_file):
+        with open(output_file, "w") as f:
+            json.dump(self.timeline(), f, indent=2)
+        self.logging.info("CAPI machines timeline written to %s", output_file)
+
+    def _record_object(self, obj, observed_at):
+        kind = obj["kind"]
+        name = obj["metadata"]["name"]
+        key = (kind, name)
+        status = obj.get("status") or {}
+        state = self.states.setdefault(key, {})
+        events = self.events.setdefault(key, [])
+
+        if kind == "Machine":
+            spec = obj.get("spec") or {}
+            refs = []
+            infra_ref = spec.get("infrastructureRef") or {}
+            if infra_ref.get("name"):
+                refs.append((infra_ref["kind"], infra_ref["name"]))
+            config_ref = (spec.get("bootstrap") or {}).get("configRef") or {}
+            if config_ref.get("name"):
+                refs.append((config_ref["kind"], config_ref["name"]))
+            self.machines_refs[name] = refs
+
+        if "created" not in state:
+            state["created"] = True
+            events.append(self._event(
+                obj["metadata"]["creationTimestamp"], kind, name, "Created"))
+
+        phase = status.get("phase") or status.get("vmState")
+        if phase and phase != state.get("phase"):
+            state["phase"] = phase
+            events.append(self._event(
+                observed_at, kind, name, "Phase", status=phase))
+
+        if status.get("nodeRef") and "node" not in state:
+            state["node"] = status["nodeRef"]["name"]
+            events.append(self._event(
+                observed_at, kind, name, "NodeRef", status=state["node"]))
+
+        conditions = state.setdefault("conditions", {})
+        for c in status.get("conditions") or []:
+            value = (c.get("status"), c.get("reason"))
+            if conditions.get(c["type"]) == value:
+                continue
+            conditions[c["type"]] = value
+            events.append(self._event(
+                c.get("lastTransitionTime") or observed_at, kind, name,
+                "Condition", condition=c["type"], status=c.get("status"),
+                reason=c.get("reason"), message=c.get("message")))
+
+    def _event(self, time, kind, name, event_type, **kwargs):
+        event = {
+            "time": time,
+            "kind": kind,
+            "name": name,
+            "type": event_type,
+        }
+        event.update({k: v for k, v in kwargs.items() if v is not None})
+        return event
+
+    def _milestones(self, events):
+        # Seconds elapsed from the Machine creation until each condition
+        # became true for the first time, for every object of the machine.
+        created = next(
+            (e for e in events
+             if e["kind"] == "Machine" and e["type"] == "Created"), None)
+        if not created:
+            return {}
+        start = pendulum.parse(created["time"])
+        milestones = {}
+        for e in events:
+            if e["type"] == "Condition" and e.get("status") == "True":
+                name = f"{e['kind']}/{e['condition']}"
+            elif e["type"] == "NodeRef":
+                name = f"{e['kind']}/NodeRef"
+            else:
+                continue
+            if name not in milestones:
+                elapsed = pendulum.parse(e["time"]) - start  # pyright: ignore # noqa:
+                milestones[name] = elapsed.total_seconds()  # pyright: ignore
+        return milestones
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import time
+
+from e2e_runner import logger as e2e_logger
+from kubernetes.client.rest import ApiException
+
+POOL_LABEL = "e2e-runner.k8s.io/warm-pool"
+STATE_LABEL = "e2e-runner.k8s.io/warm-pool-state"
+STATE_TIME_ANNOTATION = "e2e-runner.k8s.io/warm-pool-state-time"
+CLAIMED_BY_ANNOTATION = "e2e-runner.k8s.io/warm-pool-claimed-by"
+CONFIG_ANNOTATION = "e2e-runner.k8s.io/warm-pool-config"
+
+STATE_PROVISIONING = "provisioning"
+STATE_READY = "ready"
+STATE_CLAIMED = "claimed"
+STATE_RELEASED = "released"
+
+
+class WarmPool(object):
+    # Pool of provisioned CAPZ clusters in the shared management cluster.
+    # Every pool cluster has its own namespace, labeled with the pool key
+    # (the cluster configuration hash) and the cluster state. The state
+    # transitions are conditional namespace updates, so a ready cluster is
+    # claimed by a single job, even with concurrent claims.
+
+    def __init__(self, mgmt_k8s_client, kubernetes_version, win_os,
+                 flannel_mode):
+        self.logging = e2e_logger.get_logger(__name__)
+        self.core_v1_api = mgmt_k8s_client.core_v1_api
+        self.config = {
+            "kubernetes_version": kubernetes_version,
+            "win_os": win_os,
+            "flannel_mode": flannel_mode,
+        }
+        canonical = json.dumps(self.config, sort_keys=True)
+        self.key = hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+    def namespaces(self, states=[]):
+        selector = f"{POOL_LABEL}={self.key}"
+        if states:
+            selector += f",{STATE_LABEL} in ({','.join(states)})"
+        namespaces = self.core_v1_api.list_namespace(
+            label_selector=selector).items
+        # Oldest state transitions first.
+        return sorted(namespaces, key=self.state_time)
+
+    def state_time(self, namespace):
+        annotations = namespace.metadata.annotations or {}
+        return float(annotations.get(STATE_TIME_ANNOTATION, 0))
+
+    def set_state(self, name, state, resource_version=None,
+                  annotations={}):
+        metadata = {
+            "labels": {
+                POOL_LABEL: self.key,
+                STATE_LABEL: state,
+            },
+            "annotations": {
+                STATE_TIME_ANNOTATION: str(time.time()),
+                CONFIG_ANNOTATION: json.dumps(self.config, sort_keys=True),
+                **annotations,
+            },
+        }
+        if resource_version:
+            # The update fails with a conflict if the namespace was changed
+            # since it was listed.
+            metadata["resourceVersion"] = resource_version
+        self.core_v1_api.patch_namespace(name, {"metadata": metadata})
+
+    def claim(self, claimed_by):
+        # Returns the name of the claimed cluster, or None if there is no
+        # ready cluster in the pool.
+        for namespace in self.namespaces(states=[STATE_READY]):
+            name = namespace.metadata.name
+            try:
+                self.set_state(
+                    name, STATE_CLAIMED,
+                    resource_version=namespace.metadata.resource_version,
+                    annotations={CLAIMED_BY_ANNOTATION: claimed_by})
+            except ApiException as e:
+                if e.status != 409:
+                    raise e
+                self.logging.info(
+                    "Warm pool cluster %s was claimed by another job", name)
+                continue
+            self.logging.info("Claimed the warm pool cluster %s", name)
+            return name
+        return None
+
+    def release(self, name):
+        self.logging.info("Releasing the warm pool cluster %s", name)
+        self.set_state(name, STATE_RELEASED)
@@ -0,0 +1,141 @@
+import os
+
+from cliff.command import Command
+from cliff.lister import Lister
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import history as e2e_history
+from e2e_runner.utils import utils as e2e_utils
+
+
+def add_store_arguments(p):
+    p.add_argument(
+        "--results-store",
+        required=True,
+        help="Path to the SQLite historical results store.")
+    p.add_argument(
+        "--job-name",
+        default=os.environ.get("JOB_NAME"),
+        help="The CI job name. Defaults to the JOB_NAME environment "
+             "variable.")
+    return p
+
+
+def add_window_arguments(p):
+    p.add_argument(
+        "--last-runs",
+        type=int,
+        default=100,
+        help="Number of the most recent runs queried.")
+    p.add_argument(
+        "--limit",
+        type=int,
+        default=50,
+        help="Maximum number of returned rows.")
+    return p
+
+
+class HistoryIngest(Command):
+    """Ingest a run results into the historical results store"""
+    logging = e2e_logger.get_logger(__name__)
+
+    def get_parser(self, prog_name):
+        p = super(HistoryIngest, self).get_parser(prog_name)
+        add_store_arguments(p)
+        p.add_argument(
+            "--artifacts-directory",
+            default="/tmp/ci_artifacts",
+            help="Local path with the run artifacts.")
+        p.add_argument(
+            "--build-id",
+            default=os.environ.get("BUILD_ID"),
+            help="The CI build ID. Defaults to the BUILD_ID environment "
+                 "variable.")
+        p.add_argument(
+            "--passed",
+            type=e2e_utils.str2bool,
+            default=True,
+            help="Whether the run passed.")
+        return p
+
+    def take_action(self, args):
+        if not args.job_name or not args.build_id:
+            raise ValueError("The job name and the build ID are required.")
+        store = e2e_history.ResultsStore(args.results_store)
+        try:
+            store.ingest_run(
+                args.artifacts_directory, args.job_name, args.build_id,
+                args.passed)
+        finally:
+            store.close()
+
+
+class HistoryFlakes(Lister):
+    """List the flaky specs, with their flake rate"""
+
+    def get_parser(self, prog_name):
+        p = super(HistoryFlakes, self).get_parser(prog_name)
+        add_store_arguments(p)
+        add_window_arguments(p)
+        return p
+
+    def take_action(self, args):
+        store = e2e_history.ResultsStore(args.results_store)
+        try:
+            rows = store.flakes(args.job_name, args.last_runs, args.limit)
+        finally:
+            store.close()
+        return (
+            ("Spec", "Runs", "Failures", "Flake Rate"),
+            [(n, r, f, f"{rate:.2%}") for n, r, f, rate in rows])
+
+
+class HistoryDurations(Lister):
+    """List the specs duration percentiles, slowest first"""
+
+    def get_parser(self, prog_name):
+        p = super(HistoryDurations, self).get_parser(prog_name)
+        add_store_arguments(p)
+        add_window_arguments(p)
+        p.add_argument(
+            "--spec-pattern",
+            default="%",
+            help="SQL LIKE pattern used to filter the spec names.")
+        return p
+
+    def take_action(self, args):
+        store = e2e_history.ResultsStore(args.results_store)
+        try:
+            rows = store.durations(
+                args.spec_pattern, args.job_name, args.last_runs,
+                percentiles=(50, 90, 99), limit=args.limit)
+        finally:
+            store.close()
+        return (
+            ("Spec", "Runs", "P50", "P90", "P99"),
+            [(n, r, *[f"{v:.2f}" for v in p]) for n, r, *p in rows])
+
+
+class HistoryRegressions(Lister):
+    """List the specs which regressed in a Kubernetes revision"""
+
+    def get_parser(self, prog_name):
+        p = super(HistoryRegressions, self).get_parser(prog_name)
+        add_store_arguments(p)
+        p.add_argument(
+            "--revision",
+            required=True,
+            help="The Kubernetes revision checked for regressions.")
+        p.add_argument(
+            "--base-revision",
+            help="The Kubernetes revision compared against. Defaults to "
+                 "the previously tested revision.")
+        return p
+
+    def take_action(self, args):
+        store = e2e_history.ResultsStore(args.results_store)
+        try:
+            rows = store.regressions(
+                args.revision, args.base_revision, args.job_name)
+        finally:
+            store.close()
+        return (("Spec", "Base Revision", "Failures", "Runs"), rows)
@@ -1,3 +1,4 @@
+import json
 import os
 import time
 import traceback
@@ -8,6 +9,7 @@ from e2e_runner import constants as e2e_constants
 from e2e_runner import exceptions as e2e_exceptions
 from e2e_runner import factory as e2e_factory
 from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import history as e2e_history
 from e2e_runner.utils import utils as e2e_utils
 
 
@@ -34,7 +36,43 @@ class RunCI(Command):
 
         p.add_argument(
             "--parallel-test-nodes",
-            default=4)
+            default=4,
+            help="Number of ginkgo parallel nodes. If set to 'auto', the "
+                 "ginkgo nodes are sized from the allocatable CPU and "
+                 "memory of the schedulable Windows nodes, and from the "
+                 "ginkgo node usage measured by previous runs.")
+        p.add_argument(
+            "--max-parallel-test-nodes",
+            type=int,
+            default=16,
+            help="Upper bound for the automatically sized ginkgo nodes.")
+        p.add_argument(
+            "--ginkgo-node-usage-source",
+            action="append",
+            default=[],
+            help="Path or URL of a previous run's 'parallelism.json' "
+                 "artifact, with the measured CPU and memory usage of a "
+                 "single ginkgo node. Used to size the ginkgo nodes, when "
+                 "'--parallel-test-nodes' is 'auto'. Can be given multiple "
+                 "times.")
+        p.add_argument(
+            "--conformance-shards",
+            type=int,
+            default=1,
+            help="Number of conformance pods the E2E tests are sharded "
+                 "across. If greater than 1, the focused specs are listed "
+                 "via a ginkgo dry-run, and split across the conformance "
+                 "pods, each one running ginkgo with the "
+                 "'--parallel-test-nodes' nodes.")
+        p.add_argument(
+            "--spec-durations-source",
+            action="append",
+            default=[],
+            help="JUnit file, directory with JUnit files, or URL of a JUnit "
+                 "file from previous runs. The historical spec durations "
+                 "are used to pack the specs into the conformance shards, "
+                 "longest first. Specs without a known duration are split "
+                 "evenly. Can be given multiple times.")
         p.add_argument(
             "--repo-list",
             default="https://capzwin.blob.core.windows.net/images/image-repo-list",  # noqa
@@ -64,8 +102,9 @@ class RunCI(Command):
             "--retain-testing-env",
             type=e2e_utils.str2bool,
             default=False,
-            help="Retain the testing environment, if the conformance tests "
-                 "failed. Useful for debugging purposes.")
+            help="Retain the testing environment, if the smoke tests or "
+                 "the conformance tests failed. Useful for debugging "
+                 "purposes.")
         p.add_argument(
             "--flake-attempts",
             type=int,
@@ -73,6 +112,136 @@ class RunCI(Command):
             help="Ginkgo flake attempts. If the value is greater than 0, the "
                  "E2E tests will be run multiple times, until they pass or "
                  "the number of attempts is reached.")
+        p.add_argument(
+            "--artifacts-url",
+            help="URL where the run artifacts are published. It's "
+                 "recorded in the results store, and it's given as the "
+                 "reference of the memoized runs.")
+        p.add_argument(
+            "--memoize-max-age",
+            type=float,
+            default=0,
+            help="Maximum age (in hours) of a successful run, from the "
+                 "results store, with the same fingerprint of all the run "
+                 "inputs (resolved commits, gallery images versions, "
+                 "options and test regex file). If such a run is found, "
+                 "this run is skipped. Set it to 0 to disable the run "
+                 "memoization.")
+        p.add_argument(
+            "--rerun-failed-attempts",
+            type=int,
+            default=0,
+            help="Number of times the failed specs are rerun, after the "
+                 "E2E tests finished, against the same cluster. Only the "
+                 "failed specs from the JUnit results are rerun, and the "
+                 "final verdict is given by the merged results.")
+        p.add_argument(
+            "--stress-iterations",
+            type=int,
+            default=0,
+            help="If greater than 0, run the E2E tests in the stress mode: "
+                 "the specs matching '--stress-focus-regex' are run for "
+                 "the given number of iterations, each one in its own "
+                 "conformance pod, and the per-spec failure rate is "
+                 "reported with a 95%% confidence interval. Only the "
+                 "failing iterations artifacts are kept.")
+        p.add_argument(
+            "--stress-focus-regex",
+            help="Focus regex of the specs run in the stress mode.")
+        p.add_argument(
+            "--stress-concurrency",
+            type=int,
+            default=4,
+            help="Number of stress iterations run concurrently.")
+        p.add_argument(
+            "--prepull-images",
+            type=e2e_utils.str2bool,
+            default=True,
+            help="Pre-pull the conformance image, and the E2E test images "
+                 "(resolved with the '--repo-list'), on the nodes in the "
+                 "background, during the cluster bring-up. The per-node "
+                 "pull durations are reported in 'images-prepull.json'.")
+        p.add_argument(
+            "--smoke-tests",
+            type=e2e_utils.str2bool,
+            help="Run the cluster smoke tests (cross-node pod-to-pod, "
+                 "pod-to-service, DNS and node-port connectivity between "
+                 "Windows and Linux pods) before the E2E tests. If they "
+                 "fail, the E2E tests are not run. If not set, they run "
+                 "only for the 'capz_flannel' CI.")
+        p.add_argument(
+            "--smoke-tests-timeout",
+            type=int,
+            default=180,
+            help="Timeout (in seconds) for the cluster smoke tests pods to "
+                 "be ready.")
+        p.add_argument(
+            "--smoke-tests-image",
+            default="registry.k8s.io/e2e-test-images/agnhost:2.52",
+            help="Multi-arch image with the agnhost netexec server, used "
+                 "by the cluster smoke tests pods.")
+        p.add_argument(
+            "--early-abort",
+            type=e2e_utils.str2bool,
+            default=False,
+            help="Monitor the conformance pods output, and abort the E2E "
+                 "tests early, if the cluster is clearly broken (a "
+                 "catastrophic failure signature, or a failure rate "
+                 "threshold is reached).")
+        p.add_argument(
+            "--abort-failure-signature",
+            action="append",
+            default=[],
+            help="Regex of a catastrophic failure signature, matched "
+                 "against the failed specs output. Added to the default "
+                 "signatures (broken pod networking, HNS failures). Can be "
+                 "given multiple times.")
+        p.add_argument(
+            "--abort-signature-threshold",
+            type=int,
+            default=10,
+            help="Number of failed specs matching the same failure "
+                 "signature, which aborts the E2E tests.")
+        p.add_argument(
+            "--abort-failure-rate",
+            type=float,
+            default=0.5,
+            help="Specs failure rate which aborts the E2E tests.")
+        p.add_argument(
+            "--abort-min-specs",
+            type=int,
+            default=20,
+            help="Minimum number of finished specs, before the failure "
+                 "rate is checked.")
+        p.add_argument(
+            "--node-telemetry-interval",
+            type=int,
+            default=30,
+            help="Interval (in seconds) at which the nodes' CPU, memory, "
+                 "disk and network usage is sampled, from the kubelet "
+                 "stats summary, while the E2E tests are running. Set it to "
+                 "0 to disable the node telemetry.")
+        p.add_argument(
+            "--results-sync-interval",
+            type=int,
+            default=300,
+            help="Interval (in seconds) at which the new or changed E2E "
+                 "tests results are synced to the artifacts directory, "
+                 "while the tests are running. Set it to 0 to sync the "
+                 "results only after the tests finished.")
+        p.add_argument(
+            "--report-slowest-specs",
+            type=int,
+            default=20,
+            help="Number of the slowest specs included in the conformance "
+                 "report summary.")
+        p.add_argument(
+            "--results-store",
+            help="Path to the SQLite historical results store. If set, the "
+                 "run results are ingested into the store, together with "
+                 "the run metadata, the JOB_NAME and the BUILD_ID "
+                 "environment variables. The store is used as a source of "
+                 "historical spec durations as well.")
 
         p.add_argument(
             "--k8s-repo",
@@ -180,6 +349,64 @@ class RunCI(Command):
             "--bootstrap-vm-size",
             default="Standard_D2s_v3",
             help="Size of the bootstrap VM.")
+        p.add_argument(
+            "--mgmt-kubeconfig",
+            help="Kubeconfig of a long-lived management cluster, with the "
+                 "Cluster API Azure providers already installed. If set, "
+                 "the kind management cluster isn't created, and the CAPZ "
+                 "cluster is created in its own namespace (named after the "
+                 "cluster), with its own cluster identity.")
+        p.add_argument(
+            "--warm-pool",
+            type=e2e_utils.str2bool,
+            default=False,
+            help="Claim a ready cluster from the warm pool of the shared "
+                 "management cluster ('--mgmt-kubeconfig'), with the same "
+                 "Kubernetes version, Windows OS and Flannel mode, instead "
+                 "of provisioning a new one. The claimed cluster is "
+                 "released for deletion at the end of the run. Ignored "
+                 "with custom builds, and if there is no ready cluster.")
+        p.add_argument(
+            "--capi-version",
+            help="Pinned Cluster API version (like 'v1.8.5'). If set, "
+                 "together with '--capz-version' and "
+                 "'--cert-manager-version', the management cluster is "
+                 "initialized from a local clusterctl repository, instead "
+                 "of the upstream GitHub releases.")
+        p.add_argument(
+            "--capz-version",
+            help="Pinned Cluster API Provider Azure version, used with the "
+                 "local clusterctl repository.")
+        p.add_argument(
+            "--cert-manager-version",
+            help="Pinned cert-manager version, used with the local "
+                 "clusterctl repository.")
+        p.add_argument(
+            "--clusterctl-repository-dir",
+            default="~/.cache/e2e-runner/clusterctl",
+            help="Directory of the local clusterctl repository. The "
+                 "pinned providers manifests are downloaded there once, "
+                 "and reused by the later runs.")
+        p.add_argument(
+            "--preload-mgmt-images",
+            type=e2e_utils.str2bool,
+            default=True,
+            help="With the local clusterctl repository, pull the providers "
+                 "images on the bootstrap VM during the builds, and load "
+                 "them into the kind management cluster node, before the "
+                 "providers are installed.")
+        p.add_argument(
+            "--build-workers",
+            type=int,
+            default=0,
+            help="Number of build worker VMs, provisioned alongside the "
+                 "bootstrap VM, in the same vNET. The builds are spread "
+                 "across the bootstrap VM and the workers, and the workers "
+                 "build artifacts are synced to the bootstrap VM.")
+        p.add_argument(
+            "--build-worker-vm-size",
+            help="Size of the build worker VMs. Defaults to the bootstrap "
+                 "VM size.")
         p.add_argument(
             "--master-vm-size",
             default="Standard_D2s_v3",
@@ -198,6 +425,77 @@ class RunCI(Command):
             "--win-agent-size",
             default="Standard_D4s_v3",
             help="Size of K8s Windows agents.")
+        p.add_argument(
+            "--test-selection-base",
+            help="Git ref (branch, tag or commit) of the test selection "
+                 "base. If set, when the K8s binaries are built, the E2E "
+                 "tests focus is narrowed to the tests covering the K8s "
+                 "paths changed since the merge base with this ref, using "
+                 "the checked-in 'test-selection.yaml' mapping. A small "
+                 "mandatory core of tests is always run. Only the tests "
+                 "matched by the configured focus and skip regexes (listed "
+                 "with a Ginkgo dry-run) are selected.")
+        p.add_argument(
+            "--test-selection-base-repo",
+            default="https://github.com/kubernetes/kubernetes",
+            help="Git repository of the test selection base.")
+        p.add_argument(
+            "--build-profile",
+            type=e2e_utils.str2bool,
+            default=True,
+            help="Profile the builds: the wall and CPU time of every build "
+                 "command, and the per-package Go compile times, written "
+                 "to 'build-profile.json', and to 'build-trace.json' "
+                 "(Chrome trace format).")
+        p.add_argument(
+            "--go-build-cache-store",
+            help="Local (or mounted) directory used to store snapshots of "
+                 "the bootstrap VM Go build and modules caches, keyed by "
+                 "the Go version and the built component. If set, the "
+                 "snapshot is restored before every build, and updated "
+                 "after it.")
+        p.add_argument(
+            "--go-build-cache-max-size",
+            type=float,
+            default=50,
+            help="Maximum size (in GiB) of the Go build cache store. The "
+                 "least recently used snapshots are evicted above it.")
+        p.add_argument(
+            "--registry-cache",
+            type=e2e_utils.str2bool,
+            default=False,
+            help="Deploy pull-through registry caches (see the checked-in "
+                 "'registry-cache.yaml') on the bootstrap VM. They are "
+                 "configured as containerd mirrors of the upstream "
+                 "registries on the Windows nodes. The bootstrap VM is kept "
+                 "until the cluster is deleted.")
+        p.add_argument(
+            "--registry-cache-address",
+            help="Address of a persistent registry cache host, deployed "
+                 "with the 'registry-cache.yaml' layout and reachable from "
+                 "the cluster nodes. If set, it's used instead of deploying "
+                 "the registry caches on the bootstrap VM.")
+        p.add_argument(
+            "--http-cache",
+            type=e2e_utils.str2bool,
+            default=False,
+            help="Download the external files fetched by every node (like "
+                 "the Windows 'kube-proxy.exe', or the '--e2e-bin') through "
+                 "the caching proxy of the bootstrap VM file share. Each "
+                 "URL is fetched only once. Only the immutable URLs (with "
+                 "a release version or a content digest, and without a "
+                 "moving reference like 'latest') are cached. If the "
+                 "cached '--e2e-bin' is set, the bootstrap VM is kept "
+                 "until the cluster is deleted.")
+        p.add_argument(
+            "--machine-timeline-interval",
+            type=int,
+            default=10,
+            help="Interval (in seconds) at which the CAPI Machine, "
+                 "AzureMachine and KubeadmConfig objects are polled to "
+                 "record their phase and condition transitions, while "
+                 "the CAPZ cluster is provisioned. Set it to 0 to disable "
+                 "the machines provisioning timeline.")
 
     def add_aks_subparser(self, subparsers):
         p = subparsers.add_parser("aks")
@@ -246,23 +544,83 @@ class RunCI(Command):
         # conflicts.
         args.cluster_name += f"-{int(time.time())}"
         ci = e2e_factory.get_ci(args.ci)(args)
-        conformance_tests_failed = False
+        fingerprint = None
+        if args.results_store:
+            fingerprint = self._run_fingerprint(ci)
+            if fingerprint and self._find_memoized_run(args, fingerprint):
+                return
+        tests_failed = False
+        failed = True
         try:
             ci.setup_bootstrap_vm()
             ci.build(args.build)
             ci.up()
             ci.cleanup_bootstrap_vm()
+            ci.smoke_test()
             ci.test()
+            failed = False
         except Exception as ex:
             self.logging.error("{}".format(traceback.format_exc()))
-            if isinstance(ex, e2e_exceptions.ConformanceTestsFailed):
-                conformance_tests_failed = True
+            if isinstance(ex, (e2e_exceptions.ConformanceTestsFailed,
+                               e2e_exceptions.SmokeTestsFailed)):
+                tests_failed = True
             raise
         finally:
             ci.collect_logs()
-            if conformance_tests_failed and args.retain_testing_env:
+            if args.results_store:
+                self._ingest_results(
+                    args, passed=not failed, fingerprint=fingerprint)
+            if tests_failed and args.retain_testing_env:
                 self.logging.warning(
-                    "Conformance tests failed. Retain the testing env "
+                    "Tests failed. Retain the testing env "
                     "for debugging purposes.")
             else:
                 ci.down()
+
+    def _run_fingerprint(self, ci):
+        try:
+            fingerprint = ci.run_fingerprint()
+        except Exception as e:
+            self.logging.warning(
+                "Failed to compute the run fingerprint: %s", e)
+            return None
+        self.logging.info("Run fingerprint: %s", fingerprint)
+        return fingerprint
+
+    def _find_memoized_run(self, args, fingerprint):
+        # A recent successful run with the same fingerprint had the exact
+        # same inputs, so this run is short-circuited.
+        if args.memoize_max_age <= 0:
+            return False
+        store = e2e_history.ResultsStore(args.results_store)
+        try:
+            run = store.find_passed_run(
+                fingerprint, max_age=args.memoize_max_age * 3600)
+        finally:
+            store.close()
+        if not run:
+            return False
+        run["fingerprint"] = fingerprint
+        with open(os.path.join(args.artifacts_directory,
+                               "memoized-run.json"), "w") as f:
+            json.dump(run, f, indent=2)
+        self.logging.info(
+            "Run %s/%s, with the same fingerprint, passed at %s. Skipping "
+            "this run. Artifacts: %s", run["job_name"], run["build_id"],
+            time.ctime(run["started_at"]), run["artifacts"])
+        return True
+
+    def _ingest_results(self, args, passed, fingerprint=None):
+        job_name = os.environ.get("JOB_NAME", f"e2e-runner-{args.ci}")
+        build_id = os.environ.get("BUILD_ID", args.cluster_name)
+        try:
+            store = e2e_history.ResultsStore(args.results_store)
+            try:
+                store.ingest_run(
+                    args.artifacts_directory, job_name, build_id, passed,
+                    fingerprint=fingerprint, artifacts=args.artifacts_url)
+            finally:
+                store.close()
+        except Exception as e:
+            self.logging.warning(
+                "Failed to ingest the results into the store: %s", e)
@@ -0,0 +1,128 @@
+import copy
+import os
+import threading
+import time
+import traceback
+
+from e2e_runner import factory as e2e_factory
+from e2e_runner import logger as e2e_logger
+from e2e_runner.ci.capz_flannel import warm_pool as e2e_warm_pool
+from e2e_runner.cli import run_ci
+
+
+class WarmPool(run_ci.RunCI):
+    """Keep a pool of ready CAPZ clusters in the shared management cluster"""
+    logging = e2e_logger.get_logger(__name__)
+
+    def get_parser(self, prog_name):
+        p = super(WarmPool, self).get_parser(prog_name)
+        p.add_argument(
+            "--pool-size",
+            type=int,
+            default=2,
+            help="Number of ready (or provisioning) clusters kept in the "
+                 "pool, for the given Kubernetes version, Windows OS and "
+                 "Flannel mode.")
+        p.add_argument(
+            "--reconcile-interval",
+            type=int,
+            default=0,
+            help="Minutes between the pool reconciliations. If 0, the pool "
+                 "is reconciled only once.")
+        p.add_argument(
+            "--max-claim-age",
+            type=float,
+            default=12,
+            help="Hours after which a claimed cluster, never released by "
+                 "its job, is deleted.")
+        p.add_argument(
+            "--provisioning-timeout",
+            type=float,
+            default=2,
+            help="Hours after which a cluster still provisioning (like when "
+                 "its pool controller was stopped) is deleted.")
+        return p
+
+    def take_action(self, args):
+        if args.ci != "capz_flannel" or not args.mgmt_kubeconfig:
+            raise ValueError("The warm pool requires the 'capz_flannel' CI "
+                             "and the '--mgmt-kubeconfig'.")
+        if args.build:
+            raise ValueError("The warm pool clusters cannot use custom "
+                             "builds.")
+        os.makedirs(args.artifacts_directory, exist_ok=True)
+        while True:
+            self._reconcile(args)
+            if args.reconcile_interval <= 0:
+                return
+            time.sleep(args.reconcile_interval * 60)
+
+    def _reconcile(self, args):
+        pool = self._get_ci(args, args.cluster_name).warm_pool
+        deletions = []
+        for namespace in pool.namespaces():
+            if self._is_expired(args, pool, namespace):
+                deletions.append(self._start_deletion(
+                    args, namespace.metadata.name))
+        count = len(pool.namespaces(states=[
+            e2e_warm_pool.STATE_READY, e2e_warm_pool.STATE_PROVISIONING]))
+        missing = max(args.pool_size - count, 0)
+        self.logging.info(
+            "Warm pool %s has %d ready or provisioning clusters. "
+            "Provisioning %d clusters", pool.key, count, missing)
+        # The clusters are provisioned one at a time, since the CI uses
+        # the default kubeconfig.
+        for _ in range(missing):
+            self._provision(args)
+        for thread in deletions:
+            thread.join()
+
+    def _is_expired(self, args, pool, namespace):
+        state = (namespace.metadata.labels or {}).get(
+            e2e_warm_pool.STATE_LABEL)
+        age = time.time() - pool.state_time(namespace)
+        if state == e2e_warm_pool.STATE_RELEASED:
+            return True
+        if state == e2e_warm_pool.STATE_CLAIMED:
+            return age > args.max_claim_age * 3600
+        if state == e2e_warm_pool.STATE_PROVISIONING:
+            return age > args.provisioning_timeout * 3600
+        return False
+
+    def _provision(self, args):
+        # Add suffix to the cluster name to avoid resource group name
+        # conflicts.
+        cluster_name = f"{args.cluster_name}-{int(time.time())}"
+        ci = self._get_ci(args, cluster_name)
+        self.logging.info("Provisioning the warm pool cluster %s",
+                          cluster_name)
+        try:
+            ci.provision_warm_pool_cluster()
+        except Exception:
+            self.logging.error("{}".format(traceback.format_exc()))
+            ci.down()
+
+    def _start_deletion(self, args, cluster_name):
+        def _delete():
+            try:
+                self._get_ci(args, cluster_name).down()
+            except Exception as e:
+                self.logging.error(
+                    "Failed to delete the warm pool cluster %s: %s",
+                    cluster_name, e)
+
+        self.logging.info("Deleting the warm pool cluster %s", cluster_name)
+        thread = threading.Thread(
+            target=_delete, name=f"delete-{cluster_name}", daemon=True)
+        thread.start()
+        return thread
+
+    def _get_ci(self, args, cluster_name):
+        opts = copy.copy(args)
+        opts.cluster_name = cluster_name
+        # The pool clusters are not claimed by the pool controller.
+        opts.warm_pool = False
+        opts.artifacts_directory = os.path.join(
+            args.artifacts_directory, cluster_name)
+        os.makedirs(opts.artifacts_directory, exist_ok=True)
+        return e2e_factory.get_ci(args.ci)(opts)
@@ -52,3 +52,11 @@ class InvalidConformanceImageTag(Exception):
 
 class VersionMismatch(Exception):
     pass
+
+
+class ConformanceTestsAborted(ConformanceTestsFailed):
+    pass
+
+
+class SmokeTestsFailed(Exception):
+    pass
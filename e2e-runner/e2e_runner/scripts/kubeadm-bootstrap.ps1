@@ -5,7 +5,8 @@ Param(
     [Switch]$ContainerdBins,
     [Switch]$ContainerdShimBins,
     [Switch]$CRIToolsBins,
-    [Switch]$SDNCNIBins
+    [Switch]$SDNCNIBins,
+    [String]$RegistryMirrors
 )
 
 $ErrorActionPreference = "Stop"
@@ -13,6 +14,8 @@ $ErrorActionPreference = "Stop"
 $global:BUILD_DIR = Join-Path $env:SystemDrive "build"
 $global:KUBERNETES_DIR = Join-Path $env:SystemDrive "k"
 $global:CONTAINERD_DIR = Join-Path $env:ProgramFiles "containerd"
+$global:BUNDLES_DIR = Join-Path $BUILD_DIR "bundles"
+$global:CONTAINERD_CERTS_DIR = Join-Path $env:ProgramData "containerd\certs.d"
 
 
 function Start-ExecuteWithRetry {
@@ -90,17 +93,95 @@ function Set-PowerProfile {
     }
 }
 
+function Get-CIManifest {
+    $manifestFile = Join-Path $BUILD_DIR "manifest.json"
+    Start-FileDownload "$CIPackagesBaseURL/manifest.json" $manifestFile
+    return (Get-Content -Raw $manifestFile | ConvertFrom-Json)
+}
+
+function Test-FileHash {
+    Param(
+        [Parameter(Mandatory=$true)]
+        [string]$Path,
+        [Parameter(Mandatory=$true)]
+        [string]$SHA256
+    )
+    if(!(Test-Path $Path)) {
+        return $false
+    }
+    return ((Get-FileHash -Algorithm SHA256 $Path).Hash -eq $SHA256)
+}
+
+function Get-CIBundles {
+    # Downloads the needed bundles in parallel, verifies them against the
+    # manifest, and extracts them. Already downloaded bundles, matching the
+    # manifest, are not downloaded again.
+    Param(
+        [Parameter(Mandatory=$true)]
+        [string[]]$Names
+    )
+    $jobs = @()
+    foreach($name in $Names) {
+        $bundle = $CI_MANIFEST.bundles.$name
+        if(!$bundle) {
+            Throw "Bundle $name is missing from the CI manifest"
+        }
+        $bundleFile = Join-Path $BUNDLES_DIR "$name.tar.gz"
+        if(Test-FileHash $bundleFile $bundle.sha256) {
+            Write-Output "Bundle $name is already downloaded"
+            continue
+        }
+        $jobs += Start-Job -Name $name -ArgumentList @("$CIPackagesBaseURL/$($bundle.path)", $bundleFile) -ScriptBlock {
+            Param($URL, $Destination)
+            for($i = 0; $i -lt 10; $i++) {
+                curl.exe --fail -L -s -o $Destination $URL
+                if(!$LASTEXITCODE) {
+                    return
+                }
+                Start-Sleep 3
+            }
+            Throw "Failed to download $URL"
+        }
+    }
+    if($jobs) {
+        $jobs | Wait-Job | Receive-Job
+        $jobs | Remove-Job
+    }
+    foreach($name in $Names) {
+        $bundle = $CI_MANIFEST.bundles.$name
+        $bundleFile = Join-Path $BUNDLES_DIR "$name.tar.gz"
+        if(!(Test-FileHash $bundleFile $bundle.sha256)) {
+            Throw "Bundle $name doesn't match the CI manifest SHA-256 hash"
+        }
+        $bundleDir = Join-Path $BUNDLES_DIR $name
+        New-Item -ItemType Directory -Force -Path $bundleDir | Out-Null
+        tar.exe -xzf $bundleFile -C $bundleDir
+        if($LASTEXITCODE) {
+            Throw "Failed to extract bundle $name"
+        }
+    }
+}
+
 function Install-CIBinary {
+    # Installs a file from an extracted bundle, unless the destination
+    # already matches it.
     Param(
         [Parameter(Mandatory=$true)]
-        [string]$URL,
+        [string]$Bundle,
+        [Parameter(Mandatory=$true)]
+        [string]$FileName,
         [Parameter(Mandatory=$true)]
         [string]$Destination
     )
+    $fileSHA256 = $CI_MANIFEST.bundles.$Bundle.files.$FileName.sha256
+    if(Test-FileHash $Destination $fileSHA256) {
+        Write-Output "$Destination is already up to date"
+        return
+    }
     if(Test-Path $Destination) {
         Copy-Item -Force $Destination "${Destination}.bak"
     }
-    Start-FileDownload $URL $Destination
+    Copy-Item -Force (Join-Path $BUNDLES_DIR "$Bundle\$FileName") $Destination
 }
 
 function Set-ContainerdLogFile {
@@ -116,13 +197,52 @@ function Set-ContainerdLogFile {
     Start-Service -Name containerd
 }
 
+function New-ContainerdHostsFile {
+    Param(
+        [Parameter(Mandatory=$true)]
+        [string]$HostDirectory,
+        [Parameter(Mandatory=$true)]
+        [string[]]$Content
+    )
+    $dir = Join-Path $CONTAINERD_CERTS_DIR $HostDirectory
+    New-Item -ItemType Directory -Force -Path $dir | Out-Null
+    Set-Content -Path (Join-Path $dir "hosts.toml") -Value $Content -Encoding ascii
+}
+
+function Set-ContainerdRegistryMirrors {
+    # The mirrors are given as 'registry=http://endpoint,...'. The images
+    # are pulled from the upstream registries, if their mirror fails.
+    $configFile = Join-Path $CONTAINERD_DIR "config.toml"
+    $config = Get-Content -Raw $configFile
+    if($config -notmatch 'config_path\s*=') {
+        Write-Warning "The containerd config has no registry config_path. The images are pulled from the upstream registries"
+        return
+    }
+    $certsDir = $CONTAINERD_CERTS_DIR.Replace("\", "/")
+    $config = $config -replace 'config_path\s*=\s*".*"', "config_path = `"$certsDir`""
+    Set-Content -Path $configFile -Value $config -Encoding ascii
+    foreach($mirror in $RegistryMirrors.Split(",")) {
+        $registry, $endpoint = $mirror.Split("=", 2)
+        $upstream = $registry
+        if($registry -eq "docker.io") {
+            $upstream = "registry-1.docker.io"
+        }
+        New-ContainerdHostsFile -HostDirectory $registry -Content @(
+            "server = `"https://$upstream`"",
+            "",
+            "[host.`"$endpoint`"]",
+            "  capabilities = [`"pull`", `"resolve`"]"
+        )
+    }
+    Restart-Service -Name "containerd"
+}
+
 function Update-Kubernetes {
     $binaries = @("kubelet.exe", "kubeadm.exe", "kubectl.exe")
     foreach($bin in $binaries) {
-        Install-CIBinary "$CIPackagesBaseURL/kubernetes/bin/windows/amd64/$bin" "$KUBERNETES_DIR\$bin"
+        Install-CIBinary "kubernetes-windows" $bin "$KUBERNETES_DIR\$bin"
     }
-    New-Item -ItemType Directory -Force -Path $BUILD_DIR
-    Start-FileDownload "$CIPackagesBaseURL/kubernetes/bin/windows/amd64/kube-proxy.exe" "$BUILD_DIR\kube-proxy.exe"
+    Install-CIBinary "kubernetes-windows" "kube-proxy.exe" "$BUILD_DIR\kube-proxy.exe"
 }
 
 function Update-Containerd {
@@ -132,19 +252,19 @@ function Update-Containerd {
         "containerd-shim-runhcs-v1.exe",
         "crictl.exe", "critest.exe")
     foreach($bin in $binaries) {
-        Install-CIBinary "$CIPackagesBaseURL/containerd/bin/$bin" "$CONTAINERD_DIR\$bin"
+        Install-CIBinary "containerd" $bin "$CONTAINERD_DIR\$bin"
     }
     Start-Service -Name "containerd"
 }
 
 function Update-ContainerdShim {
-    Install-CIBinary "$CIPackagesBaseURL/containerd-shim/bin/containerd-shim-runhcs-v1.exe" "$CONTAINERD_DIR\containerd-shim-runhcs-v1.exe"
+    Install-CIBinary "containerd-shim" "containerd-shim-runhcs-v1.exe" "$CONTAINERD_DIR\containerd-shim-runhcs-v1.exe"
 }
 
 function Update-CRITools {
     $binaries = @("crictl.exe", "critest.exe")
     foreach($bin in $binaries) {
-        Install-CIBinary "$CIPackagesBaseURL/cri-tools/bin/$bin" "$CONTAINERD_DIR\$bin"
+        Install-CIBinary "cri-tools" $bin "$CONTAINERD_DIR\$bin"
     }
 }
 
@@ -152,7 +272,7 @@ function Update-SDNCNI {
     $binaries = @("nat.exe", "sdnbridge.exe", "sdnoverlay.exe")
     New-Item -ItemType Directory -Force -Path "${BUILD_DIR}\cni\bin"
     foreach($bin in $binaries) {
-        Install-CIBinary "$CIPackagesBaseURL/cni/bin/$bin" "$BUILD_DIR\cni\bin\$bin"
+        Install-CIBinary "sdn-cni" $bin "$BUILD_DIR\cni\bin\$bin"
     }
 }
 
@@ -163,6 +283,18 @@ try {
         Set-ContainerdLogFile
     }
 
+    $bundles = @()
+    if($K8sBins) { $bundles += "kubernetes-windows" }
+    if($ContainerdBins) { $bundles += "containerd" }
+    if($ContainerdShimBins) { $bundles += "containerd-shim" }
+    if($CRIToolsBins) { $bundles += "cri-tools" }
+    if($SDNCNIBins) { $bundles += "sdn-cni" }
+    if($bundles) {
+        New-Item -ItemType Directory -Force -Path $BUNDLES_DIR | Out-Null
+        $global:CI_MANIFEST = Get-CIManifest
+        Get-CIBundles -Names $bundles
+    }
+
     if($K8sBins) {
         Update-Kubernetes
     }
@@ -178,6 +310,9 @@ try {
     if($SDNCNIBins) {
         Update-SDNCNI
     }
+    if($RegistryMirrors) {
+        Set-ContainerdRegistryMirrors
+    }
 
     # Disable Windows Updates service
     Set-Service -Name "wuauserv" -StartupType Disabled
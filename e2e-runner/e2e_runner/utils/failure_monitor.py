@@ -0,0 +1,167 @@
+import re
+import subprocess
+import threading
+
+import pendulum
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import utils as e2e_utils
+
+logging = e2e_logger.get_logger(__name__)
+
+# Failure signatures of a broken cluster, which make every spec fail (e.g.
+# pod sandboxes networking, or HNS endpoints failures on Windows). Generic
+# connectivity errors are not included, since they are logged by specs
+# failing legitimately, or by the negative network tests.
+DEFAULT_FAILURE_SIGNATURES = [
+    r"failed to (set ?up|create) (pod )?(network|sandbox).*(hns|HNS|flannel|cni)",  # noqa:
+    r"HNS failed with error",
+    r"hcnCreateEndpoint failed",
+    r"failed to get network \"flannel\"",
+]
+
+GINKGO_SPEC_SEPARATOR = "-" * 30
+GINKGO_FAILED_SPEC = re.compile(
+    r"^\s*• (\[(FAILED|TIMEDOUT|PANICKED|INTERRUPTED|ABORTED)\]|Failure)")
+GINKGO_PASSED_SPEC = re.compile(r"^\s*• (\[[\d.]+ seconds\]|\[SLOW TEST)")
+# Only the beginning of a failed spec output is kept for the signatures
+# matching, to bound the memory usage.
+MAX_SPEC_OUTPUT_LINES = 500
+
+
+class GinkgoOutputParser(object):
+    # Splits the ginkgo verbose output into the specs reports, which are
+    # delimited by separator lines. The report first line gives the spec
+    # result.
+
+    def __init__(self, on_spec_done):
+        self.on_spec_done = on_spec_done
+        self._status = None
+        self._lines = []
+
+    def feed(self, line):
+        if line.startswith(GINKGO_SPEC_SEPARATOR):
+            self._flush()
+            return
+        if self._status is None:
+            if GINKGO_FAILED_SPEC.match(line):
+                self._status = "failed"
+            elif GINKGO_PASSED_SPEC.match(line):
+                self._status = "passed"
+        if (self._status == "failed" and
+                len(self._lines) < MAX_SPEC_OUTPUT_LINES):
+            self._lines.append(line)
+
+    def _flush(self):
+        if self._status:
+            self.on_spec_done(self._status, "\n".join(self._lines))
+        self._status = None
+        self._lines = []
+
+
+class FailureMonitor(object):
+
+    def __init__(self, pods_names, signatures=DEFAULT_FAILURE_SIGNATURES,
+                 signature_threshold=10, max_failure_rate=0.5, min_specs=20,
+                 container_name="conformance-tests", namespace="default"):
+        self.pods_names = pods_names
+        self.signatures = [re.compile(s) for s in signatures]
+        self.signature_threshold = signature_threshold
+        self.max_failure_rate = max_failure_rate
+        self.min_specs = min_specs
+        self.container_name = container_name
+        self.namespace = namespace
+        self.passed = 0
+        self.failed = 0
+        self.signatures_counts = {s.pattern: 0 for s in self.signatures}
+        self.abort_reason = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._procs = {}
+        self._tasks = [
+            e2e_utils.PeriodicTask(
+                self._make_follower(pod_name), 10,
+                name=f"failure-monitor-{pod_name}")
+            for pod_name in pods_names
+        ]
+
+    def start(self):
+        logging.info("Monitoring the conformance pod(s) output for "
+                     "catastrophic failures")
+        for task in self._tasks:
+            task.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopped.set()
+            for proc in self._procs.values():
+                proc.terminate()
+        for task in self._tasks:
+            task.stop()
+
+    def spec_done(self, status, output):
+        with self._lock:
+            if status == "passed":
+                self.passed += 1
+                return
+            self.failed += 1
+            for signature in self.signatures:
+                if signature.search(output):
+                    self.signatures_counts[signature.pattern] += 1
+            if self.abort_reason is None:
+                self.abort_reason = self._check_abort()
+                if self.abort_reason:
+                    logging.error("Aborting the conformance tests: %s",
+                                  self.abort_reason)
+
+    def _check_abort(self):
+        for pattern, count in self.signatures_counts.items():
+            if count >= self.signature_threshold:
+                return (f"the failure signature '{pattern}' matched {count} "
+                        "failed specs")
+        specs = self.passed + self.failed
+        if specs >= self.min_specs:
+            failure_rate = self.failed / specs
+            if failure_rate >= self.max_failure_rate:
+                return (f"{self.failed} out of {specs} specs failed "
+                        f"(failure rate: {failure_rate:.0%})")
+        return None
+
+    def _make_follower(self, pod_name):
+        parser = GinkgoOutputParser(self.spec_done)
+        state = {"last_timestamp": None}
+
+        def follow():
+            # The logs stream is resumed from the last seen timestamp, and
+            # the lines already parsed are skipped.
+            args = [
+                e2e_utils.get_kubectl_bin(), "logs", "--follow",
+                "--timestamps", "--namespace", self.namespace,
+                "--container", self.container_name, pod_name,
+            ]
+            resume_after = None
+            if state["last_timestamp"]:
+                args.append(f"--since-time={state['last_timestamp']}")
+                resume_after = pendulum.parse(state["last_timestamp"])
+            with self._lock:
+                if self._stopped.is_set():
+                    return
+                proc = subprocess.Popen(
+                    args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                self._procs[pod_name] = proc
+            try:
+                for raw_line in proc.stdout:  # pyright: ignore
+                    timestamp, _, line = raw_line.decode(
+                        errors="replace").rstrip("\n").partition(" ")
+                    if resume_after:
+                        if pendulum.parse(timestamp) <= resume_after:
+                            continue
+                        resume_after = None
+                    state["last_timestamp"] = timestamp
+                    parser.feed(line)
+            finally:
+                proc.stdout.close()  # pyright: ignore
+                proc.wait()
+                with self._lock:
+                    self._procs.pop(pod_name, None)
+
+        return follow
@@ -0,0 +1,219 @@
+import json
+import os
+import sqlite3
+import time
+
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import junit as e2e_junit
+
+logging = e2e_logger.get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    job_name TEXT NOT NULL,
+    build_id TEXT NOT NULL,
+    revision TEXT,
+    job_version TEXT,
+    started_at REAL NOT NULL,
+    passed INTEGER NOT NULL,
+    metadata TEXT,
+    fingerprint TEXT,
+    artifacts TEXT,
+    UNIQUE (job_name, build_id)
+);
+CREATE INDEX IF NOT EXISTS runs_job_started_idx
+    ON runs (job_name, started_at);
+CREATE INDEX IF NOT EXISTS runs_revision_idx ON runs (revision);
+CREATE INDEX IF NOT EXISTS runs_fingerprint_idx
+    ON runs (fingerprint, started_at);
+
+CREATE TABLE IF NOT EXISTS specs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS results (
+    spec_id INTEGER NOT NULL REFERENCES specs (id),
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    failed INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    PRIMARY KEY (spec_id, run_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_run_idx ON results (run_id);
+"""
+
+
+def percentile(sorted_values, p):
+    if len(sorted_values) == 0:
+        return None
+    k = (len(sorted_values) - 1) * p / 100.0
+    f = int(k)
+    c = min(f + 1, len(sorted_values) - 1)
+    return sorted_values[f] + (sorted_values[c] - sorted_values[f]) * (k - f)
+
+
+class ResultsStore(object):
+
+    def __init__(self, db_path):
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def ingest_run(self, artifacts_dir, job_name, build_id, passed,
+                   started_at=None, fingerprint=None, artifacts=None):
+        start = time.time()
+        metadata = {}
+        metadata_file = os.path.join(artifacts_dir, "metadata.json")
+        if os.path.exists(metadata_file):
+            with open(metadata_file) as f:
+                metadata = json.load(f)
+        results = [
+            (1 if tc["status"] == e2e_junit.STATUS_FAILED else 0,
+             tc["time"], tc["name"])
+            for tc in e2e_junit.iter_junit_files_test_cases(
+                e2e_junit.find_junit_files(artifacts_dir))
+            if tc["status"] != e2e_junit.STATUS_SKIPPED
+        ]
+        with self.conn:
+            # Re-ingesting the same run replaces it.
+            self.conn.execute(
+                "DELETE FROM runs WHERE job_name = ? AND build_id = ?",
+                (job_name, build_id))
+            cursor = self.conn.execute(
+                "INSERT INTO runs (job_name, build_id, revision, "
+                "job_version, started_at, passed, metadata, fingerprint, "
+                "artifacts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_name, build_id, metadata.get("revision"),
+                 metadata.get("job-version"), started_at or time.time(),
+                 1 if passed else 0, json.dumps(metadata), fingerprint,
+                 artifacts or artifacts_dir))
+            run_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO specs (name) VALUES (?)",
+                ((name,) for _, _, name in results))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results "
+                "(spec_id, run_id, failed, duration) "
+                "SELECT id, ?, ?, ? FROM specs WHERE name = ?",
+                ((run_id, failed, duration, name)
+                 for failed, duration, name in results))
+        logging.info("Ingested run %s/%s with %d results in %.3f seconds",
+                     job_name, build_id, len(results), time.time() - start)
+        return run_id
+
+    def find_passed_run(self, fingerprint, max_age):
+        row = self.conn.execute(
+            "SELECT job_name, build_id, started_at, artifacts FROM runs "
+            "WHERE fingerprint = ? AND passed = 1 AND started_at >= ? "
+            "ORDER BY started_at DESC LIMIT 1",
+            (fingerprint, time.time() - max_age)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(
+            ["job_name", "build_id", "started_at", "artifacts"], row))
+
+    def flakes(self, job_name=None, last_runs=100, limit=50):
+        # A spec is flaky if, within the last runs, it both passed and
+        # failed. The flake rate is the failures ratio.
+        rows = self.conn.execute(
+            "WITH window AS ("
+            "  SELECT id FROM runs WHERE (?1 IS NULL OR job_name = ?1)"
+            "  ORDER BY started_at DESC LIMIT ?2) "
+            "SELECT s.name, COUNT(*) AS runs, SUM(r.failed) AS failures "
+            "FROM window w "
+            "JOIN results r ON r.run_id = w.id "
+            "JOIN specs s ON s.id = r.spec_id "
+            "GROUP BY r.spec_id "
+            "HAVING failures > 0 AND failures < runs "
+            "ORDER BY CAST(failures AS REAL) / runs DESC, runs DESC "
+            "LIMIT ?3",
+            (job_name, last_runs, limit)).fetchall()
+        return [
+            (name, runs, failures, failures / runs)
+            for name, runs, failures in rows
+        ]
+
+    def durations(self, spec_pattern="%", job_name=None, last_runs=100,
+                  percentiles=(50, 90, 99), limit=50):
+        rows = self.conn.execute(
+            "WITH window AS ("
+            "  SELECT id FROM runs WHERE (?1 IS NULL OR job_name = ?1)"
+            "  ORDER BY started_at DESC LIMIT ?2) "
+            "SELECT s.name, r.duration "
+            "FROM window w "
+            "JOIN results r ON r.run_id = w.id "
+            "JOIN specs s ON s.id = r.spec_id "
+            "WHERE s.name LIKE ?3 "
+            "ORDER BY s.name, r.duration",
+            (job_name, last_runs, spec_pattern)).fetchall()
+        specs = {}
+        for name, duration in rows:
+            specs.setdefault(name, []).append(duration)
+        result = [
+            (name, len(values), *[percentile(values, p) for p in percentiles])
+            for name, values in specs.items()
+        ]
+        # Sort by the highest percentile, slowest first.
+        result.sort(key=lambda r: r[-1], reverse=True)
+        return result[:limit]
+
+    def spec_mean_durations(self, job_name=None, last_runs=20):
+        rows = self.conn.execute(
+            "WITH window AS ("
+            "  SELECT id FROM runs WHERE (?1 IS NULL OR job_name = ?1)"
+            "  ORDER BY started_at DESC LIMIT ?2) "
+            "SELECT s.name, AVG(r.duration) "
+            "FROM window w "
+            "JOIN results r ON r.run_id = w.id "
+            "JOIN specs s ON s.id = r.spec_id "
+            "GROUP BY r.spec_id",
+            (job_name, last_runs)).fetchall()
+        return dict(rows)
+
+    def revisions(self, job_name=None, limit=20):
+        return self.conn.execute(
+            "SELECT revision, MAX(started_at) AS last_run FROM runs "
+            "WHERE (?1 IS NULL OR job_name = ?1) AND revision IS NOT NULL "
+            "GROUP BY revision ORDER BY last_run DESC LIMIT ?2",
+            (job_name, limit)).fetchall()
+
+    def regressions(self, revision, base_revision=None, job_name=None):
+        # Specs which failed on the given revision, and never failed, but
+        # passed, on the base revision (the previous revision by default).
+        if base_revision is None:
+            revisions = [r for r, _ in self.revisions(job_name, limit=1000)]
+            if revision not in revisions:
+                return []
+            index = revisions.index(revision)
+            if index + 1 >= len(revisions):
+                return []
+            base_revision = revisions[index + 1]
+        rows = self.conn.execute(
+            "WITH revision_results AS ("
+            "  SELECT r.spec_id, u.revision, SUM(r.failed) AS failures,"
+            "         COUNT(*) AS runs"
+            "  FROM runs u JOIN results r ON r.run_id = u.id"
+            "  WHERE u.revision IN (?1, ?2)"
+            "    AND (?3 IS NULL OR u.job_name = ?3)"
+            "  GROUP BY r.spec_id, u.revision) "
+            "SELECT s.name, cur.failures, cur.runs "
+            "FROM revision_results cur "
+            "JOIN revision_results base "
+            "  ON base.spec_id = cur.spec_id AND base.revision = ?2 "
+            "JOIN specs s ON s.id = cur.spec_id "
+            "WHERE cur.revision = ?1 AND cur.failures > 0 "
+            "  AND base.failures = 0 "
+            "ORDER BY cur.failures DESC, s.name",
+            (revision, base_revision, job_name)).fetchall()
+        return [
+            (name, base_revision, failures, runs)
+            for name, failures, runs in rows
+        ]
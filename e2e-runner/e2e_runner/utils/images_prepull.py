@@ -0,0 +1,283 @@
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import utils as e2e_utils
+
+logging = e2e_logger.get_logger(__name__)
+
+PULLED_IMAGE_MESSAGE = re.compile(
+    r'Successfully pulled image "([^"]+)" in ([0-9.hmsµun]+)')
+GO_DURATION_UNITS = {
+    "h": 3600, "m": 60, "s": 1, "ms": 1e-3, "us": 1e-6, "µs": 1e-6,
+    "ns": 1e-9,
+}
+# Reasons of the containers waiting for their images to be pulled.
+PULLING_REASONS = ["ContainerCreating", "PodInitializing"]
+MANIFEST_MEDIA_TYPES = [
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+]
+
+
+def parse_go_duration(duration):
+    # Parses Go durations, like '1m2.5s' or '350ms', to seconds.
+    seconds = 0.0
+    for value, unit in re.findall(r"([0-9.]+)(h|ms|us|µs|ns|m|s)", duration):
+        seconds += float(value) * GO_DURATION_UNITS[unit]
+    return seconds
+
+
+def parse_image(image):
+    # Returns the registry API host, the repository and the reference (tag
+    # or digest) of the image, following the Docker reference rules.
+    name, _, digest = image.partition("@")
+    registry = "docker.io"
+    repo = name
+    parts = name.split("/", 1)
+    if len(parts) == 2 and ("." in parts[0] or ":" in parts[0] or
+                            parts[0] == "localhost"):
+        registry, repo = parts
+    elif len(parts) == 1:
+        repo = f"library/{name}"
+    reference = digest
+    if ":" in repo.split("/")[-1]:
+        repo, _, tag = repo.rpartition(":")
+        reference = reference or tag
+    if registry == "docker.io":
+        registry = "registry-1.docker.io"
+    return registry, repo, reference or "latest"
+
+
+def _registry_get(url, accept, token=None):
+    headers = {"Accept": ", ".join(accept)}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    with urlopen(Request(url, headers=headers), timeout=30) as f:
+        return json.loads(f.read().decode())
+
+
+def _registry_token(challenge):
+    # Anonymous token from the 'WWW-Authenticate: Bearer realm=...'
+    # challenge.
+    params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+    realm = params.pop("realm")
+    with urlopen(f"{realm}?{urlencode(params)}", timeout=30) as f:
+        response = json.loads(f.read().decode())
+    return response.get("token") or response.get("access_token")
+
+
+def image_os_list(image):
+    # Returns the operating systems of the image platforms, from its
+    # registry manifest.
+    registry, repo, reference = parse_image(image)
+    base_url = f"https://{registry}/v2/{repo}"
+    token = None
+    try:
+        manifest = _registry_get(
+            f"{base_url}/manifests/{reference}", MANIFEST_MEDIA_TYPES)
+    except HTTPError as e:
+        if e.code != 401:
+            raise e
+        token = _registry_token(e.headers["WWW-Authenticate"])
+        manifest = _registry_get(
+            f"{base_url}/manifests/{reference}", MANIFEST_MEDIA_TYPES,
+            token=token)
+    if "manifests" in manifest:
+        return sorted(set(
+            m.get("platform", {}).get("os", "unknown")
+            for m in manifest["manifests"]))
+    # Single platform image, with the platform in its config.
+    config = _registry_get(
+        f"{base_url}/blobs/{manifest['config']['digest']}", ["*/*"],
+        token=token)
+    return [config.get("os", "unknown")]
+
+
+class ImagesPrepull(object):
+    # The E2E test images (resolved with the repo-list) are pulled on the
+    # Windows nodes in the background, while the cluster bring-up goes
+    # on. Listing the images pulls the conformance image on the Linux
+    # node as well.
+    NAMESPACE = "e2e-images-prepull"
+
+    def __init__(self, k8s_client, conformance_image, repo_list_file,
+                 e2e_runner_dir, list_timeout=900):
+        self.k8s_client = k8s_client
+        self.conformance_image = conformance_image
+        self.repo_list_file = repo_list_file
+        self.e2e_runner_dir = e2e_runner_dir
+        self.list_timeout = list_timeout
+        self.images = []
+        self.error = None
+        self._start_time = None
+        self._thread = None
+
+    def start(self):
+        logging.info("Starting the E2E images pre-pull")
+        self._start_time = time.time()
+        self._thread = threading.Thread(
+            target=self._run, name="images-prepull", daemon=True)
+        self._thread.start()
+
+    def finish(self, output_file, timeout=600):
+        # Waits for the images pre-pull to be done, reports the per-node
+        # pull durations, and removes the pre-pull resources.
+        deadline = time.time() + timeout
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        if self.error:
+            logging.warning("The E2E images pre-pull failed: %s", self.error)
+        elif self._thread and not self._thread.is_alive():
+            try:
+                self._wait_pulls(deadline)
+            except Exception as e:
+                logging.warning("Failed to wait for the images pulls: %s", e)
+        try:
+            report = self._pull_durations_report()
+            with open(output_file, "w") as f:
+                json.dump(report, f, indent=2)
+            for node, node_report in sorted(report["nodes"].items()):
+                logging.info(
+                    "Node %s pre-pulled %d images (total pull duration: "
+                    "%.2f seconds)", node, len(node_report["images"]),
+                    node_report["total_pull_duration"])
+        except Exception as e:
+            logging.warning("Failed to report the images pull durations: %s",
+                            e)
+        e2e_utils.exec_kubectl(
+            ["delete", "namespace", self.NAMESPACE, "--wait=false"],
+            allowed_error_codes=[1])
+
+    def _wait_pulls(self, deadline):
+        # The pulls are done when every DaemonSet pod is created, and none
+        # of their containers is still waiting for its image. The failed
+        # pulls (e.g. 'ImagePullBackOff') are done as well.
+        while True:
+            pulling = self._pulling_containers_count()
+            if pulling == 0:
+                logging.info("The E2E images pre-pull is done")
+                return
+            if time.time() >= deadline:
+                logging.warning(
+                    "Timed out waiting for the E2E images pre-pull. There "
+                    "are %d images still pulling", pulling)
+                return
+            time.sleep(min(15, max(deadline - time.time(), 0)))
+
+    def _pulling_containers_count(self):
+        output, _ = e2e_utils.exec_kubectl(
+            ["get", "daemonset", "e2e-images-prepull",
+             "--namespace", self.NAMESPACE, "--output", "json"],
+            capture_output=True, hide_cmd=True)
+        desired = json.loads(output)["status"].get(
+            "desiredNumberScheduled", 0)
+        output, _ = e2e_utils.exec_kubectl(
+            ["get", "pods", "--namespace", self.NAMESPACE,
+             "--selector", "app=e2e-images-prepull", "--output", "json"],
+            capture_output=True, hide_cmd=True)
+        pods = json.loads(output)["items"]
+        # The images of the pods not created yet are still pulling.
+        pulling = max(desired - len(pods), 0) * len(self.images)
+        for pod in pods:
+            statuses = pod.get("status", {}).get("containerStatuses") or []
+            pulling += len(self.images) - len(statuses)
+            for status in statuses:
+                waiting = status.get("state", {}).get("waiting")
+                if waiting and waiting.get("reason") in PULLING_REASONS:
+                    pulling += 1
+        return pulling
+
+    def _run(self):
+        try:
+            self._create_images_list_pod()
+            self.images = self._windows_images(self._list_images())
+            logging.info("Pre-pulling %d E2E images on the Windows nodes",
+                         len(self.images))
+            manifest_file = "/tmp/images-prepull.yaml"
+            e2e_utils.render_template(
+                "templates/images-prepull.yaml.j2", manifest_file,
+                {"namespace": self.NAMESPACE, "images": self.images},
+                self.e2e_runner_dir)
+            self.k8s_client.create_from_yaml(
+                manifest_file, namespace=self.NAMESPACE)
+        except Exception as e:
+            self.error = e
+
+    def _create_images_list_pod(self):
+        manifest_file = "/tmp/images-list.yaml"
+        e2e_utils.render_template(
+            "templates/images-list.yaml.j2", manifest_file,
+            {"namespace": self.NAMESPACE,
+             "conformance_image": self.conformance_image},
+            self.e2e_runner_dir)
+        # The namespace is created first, since the pod needs the configmap.
+        e2e_utils.exec_kubectl(
+            ["create", "namespace", self.NAMESPACE], allowed_error_codes=[1])
+        self.k8s_client.create_configmap_from_file(
+            "repo-list", self.repo_list_file, namespace=self.NAMESPACE,
+            config_map_file_name="repos.yaml")
+        e2e_utils.exec_kubectl(["apply", "-f", manifest_file])
+
+    def _list_images(self):
+        self.k8s_client.wait_pod_phase(
+            "e2e-images-list", "Succeeded", namespace=self.NAMESPACE,
+            timeout=self.list_timeout)
+        output, _ = e2e_utils.exec_kubectl(
+            ["logs", "--namespace", self.NAMESPACE, "e2e-images-list"],
+            capture_output=True, hide_cmd=True)
+        images = []
+        for line in (output or "").splitlines():
+            line = line.strip()
+            # Only the image references are kept, not the log lines.
+            if re.match(r"^[a-z0-9.\-:]+(/[\w.\-]+)+(:[\w.\-]+)?(@sha256:[0-9a-f]+)?$", line):  # noqa:
+                images.append(line)
+        return sorted(set(images))
+
+    def _windows_images(self, images):
+        # The Linux only images are never pulled on the Windows nodes. The
+        # images with unknown platforms are kept.
+        def _is_windows_image(image):
+            try:
+                return "windows" in image_os_list(image)
+            except Exception as e:
+                logging.debug("Cannot get the %s platforms: %s", image, e)
+                return True
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            is_windows = list(executor.map(_is_windows_image, images))
+        windows_images = [i for i, w in zip(images, is_windows) if w]
+        logging.info("Skipping %d Linux only E2E images",
+                     len(images) - len(windows_images))
+        return windows_images
+
+    def _pull_durations_report(self):
+        output, _ = e2e_utils.exec_kubectl(
+            ["get", "events", "--namespace", self.NAMESPACE,
+             "--field-selector", "reason=Pulled", "--output", "json"],
+            capture_output=True, hide_cmd=True)
+        nodes = {}
+        for event in json.loads(output)["items"]:
+            match = PULLED_IMAGE_MESSAGE.search(event.get("message", ""))
+            if not match:
+                continue
+            node = (event.get("source", {}).get("host") or
+                    event.get("reportingInstance") or "unknown")
+            node_report = nodes.setdefault(
+                node, {"images": {}, "total_pull_duration": 0.0})
+            duration = parse_go_duration(match.group(2))
+            node_report["images"][match.group(1)] = duration
+            node_report["total_pull_duration"] += duration
+        return {
+            "images": self.images,
+            "elapsed": time.time() - self._start_time,
+            "nodes": nodes,
+        }
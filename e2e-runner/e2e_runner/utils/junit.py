@@ -0,0 +1,217 @@
+import glob
+import os
+import re
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+STATUS_PASSED = "passed"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+
+MAX_MESSAGE_LENGTH = 4096
+
+# The merged results keep the test case with the highest priority status.
+STATUS_PRIORITY = {
+    STATUS_SKIPPED: 0,
+    STATUS_PASSED: 1,
+    STATUS_FAILED: 2,
+}
+
+# Ginkgo prefixes the JUnit test case names with the node type, like
+# '[It] [sig-network] ...'. The suite nodes are reported as test cases as
+# well, but they are not specs.
+NODE_TYPE_REGEX = re.compile(r"^\[([A-Za-z]+(?: \(Suite\))?)\]\s*")
+SUITE_NODE_TYPES = [
+    "BeforeSuite", "AfterSuite", "SynchronizedBeforeSuite",
+    "SynchronizedAfterSuite", "ReportBeforeSuite", "ReportAfterSuite",
+    "DeferCleanup (Suite)",
+]
+# Trailing bracketed group of the JUnit test case names, which may be the
+# Ginkgo spec labels.
+LABELS_REGEX = re.compile(r" \[[^\[\]]*\]$")
+
+
+def find_junit_files(directory):
+    files = glob.glob(
+        os.path.join(directory, "**", "junit*.xml"), recursive=True)
+    files.sort()
+    return files
+
+
+def iter_test_cases(junit_file):
+    for elem in _iter_test_case_elements(junit_file):
+        yield _parse_test_case(elem)
+
+
+def iter_junit_files_test_cases(junit_files):
+    for junit_file in junit_files:
+        for test_case in iter_test_cases(junit_file):
+            yield test_case
+
+
+def merge_junit_files(junit_files, output_file,
+                      suite_name="Kubernetes e2e suite",
+                      replacement_files=()):
+    # The test cases from the replacement files (e.g. the reruns of the
+    # failed specs) replace the test cases with the same name. Every test
+    # case is kept only once, since the sharded runs report all the suite
+    # specs, with the specs outside of the shard focus skipped.
+    replacements = {}
+    for junit_file in replacement_files:
+        for elem in _iter_test_case_elements(junit_file):
+            test_case = _parse_test_case(elem)
+            if test_case["status"] == STATUS_SKIPPED:
+                continue
+            elem.tail = "\n"
+            replacements[test_case["name"]] = (
+                test_case, ET.tostring(elem, encoding="utf-8"))
+
+    # The kept test cases and the suite totals are computed in a first
+    # pass, so that the merged test cases can be streamed to the output
+    # file in the second pass.
+    selected = {}
+    for file_index, junit_file in enumerate(junit_files):
+        for case_index, test_case in enumerate(iter_test_cases(junit_file)):
+            name = test_case["name"]
+            if name in replacements:
+                test_case = replacements[name][0]
+            current = selected.get(name)
+            if current and STATUS_PRIORITY[test_case["status"]] <= \
+               STATUS_PRIORITY[current[2]]:
+                continue
+            selected[name] = (
+                file_index, case_index, test_case["status"],
+                test_case["time"])
+    totals = {"tests": 0, "failures": 0, "skipped": 0, "time": 0.0}
+    for _, _, status, time in selected.values():
+        totals["tests"] += 1
+        totals["time"] += time
+        if status == STATUS_FAILED:
+            totals["failures"] += 1
+        elif status == STATUS_SKIPPED:
+            totals["skipped"] += 1
+    suite_attrs = " ".join([
+        f"name={quoteattr(suite_name)}",
+        f'tests="{totals["tests"]}"',
+        f'failures="{totals["failures"]}"',
+        'errors="0"',
+        f'skipped="{totals["skipped"]}"',
+        f'time="{totals["time"]:.3f}"',
+    ])
+    with open(output_file, "wb") as f:
+        f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(f'<testsuites tests="{totals["tests"]}" '
+                f'failures="{totals["failures"]}" '
+                f'time="{totals["time"]:.3f}">\n'.encode())
+        f.write(f"<testsuite {suite_attrs}>\n".encode())
+        for file_index, junit_file in enumerate(junit_files):
+            for case_index, elem in enumerate(
+                    _iter_test_case_elements(junit_file)):
+                name = elem.get("name", "")
+                if selected[name][:2] != (file_index, case_index):
+                    continue
+                replacement = replacements.get(name)
+                if replacement:
+                    f.write(replacement[1])
+                    continue
+                elem.tail = "\n"
+                f.write(ET.tostring(elem, encoding="utf-8"))
+        f.write(b"</testsuite>\n</testsuites>\n")
+    return totals
+
+
+def failed_test_names(junit_files):
+    return sorted(set(
+        test_case["name"]
+        for test_case in iter_junit_files_test_cases(junit_files)
+        if test_case["status"] == STATUS_FAILED and
+        not is_suite_node(test_case["name"])
+    ))
+
+
+def executed_specs_count(junit_files):
+    return sum(
+        1 for test_case in iter_junit_files_test_cases(junit_files)
+        if test_case["status"] != STATUS_SKIPPED and
+        not is_suite_node(test_case["name"])
+    )
+
+
+def is_suite_node(test_case_name):
+    match = NODE_TYPE_REGEX.match(test_case_name)
+    return bool(match) and match.group(1) in SUITE_NODE_TYPES
+
+
+def spec_text(test_case_name):
+    # The spec text matched by the Ginkgo focus, without the node type.
+    return NODE_TYPE_REGEX.sub("", test_case_name, count=1)
+
+
+def go_quote_meta(text):
+    # Equivalent of Go's regexp.QuoteMeta. Python's re.escape() escapes
+    # characters (e.g. spaces) which are invalid escapes for Go regexes.
+    return re.sub(r"([\\.+*?()|\[\]{}^$])", r"\\\1", text)
+
+
+def focus_regex(spec_names):
+    # Matches exactly the given specs, and not the specs whose text only
+    # contains one of them. The Ginkgo labels appended to the JUnit test
+    # case names (like '... [Conformance] [Conformance]') may be missing
+    # from the matched spec text, so the last bracketed group is optional.
+    specs = []
+    for name in spec_names:
+        text = spec_text(name)
+        match = LABELS_REGEX.search(text)
+        if not match:
+            specs.append(go_quote_meta(text))
+            continue
+        specs.append(go_quote_meta(text[:match.start()]) +
+                     f"(?:{go_quote_meta(match.group())})?")
+    return f"^(?:{'|'.join(specs)})$"
+
+
+def _iter_test_case_elements(junit_file):
+    # Stream the test cases, and drop every parsed element as soon as
+    # it's consumed. This keeps the memory usage bounded, regardless of
+    # the JUnit file size.
+    parents = []
+    for event, elem in ET.iterparse(junit_file, events=("start", "end")):
+        if event == "start":
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag != "testcase":
+            continue
+        yield elem
+        elem.clear()
+        if len(parents) > 0:
+            parents[-1].remove(elem)
+
+
+def _parse_test_case(elem):
+    status = STATUS_PASSED
+    message = None
+    for child in elem:
+        if child.tag in ["failure", "error"]:
+            status = STATUS_FAILED
+            message = child.get("message") or child.text
+            break
+        if child.tag == "skipped":
+            status = STATUS_SKIPPED
+            message = child.get("message") or child.text
+    if message:
+        message = message.strip()[:MAX_MESSAGE_LENGTH]
+    return {
+        "name": elem.get("name", ""),
+        "classname": elem.get("classname", ""),
+        "time": float(elem.get("time") or 0),
+        "status": status,
+        "message": message,
+    }
+
+
+def spec_sig(spec_name):
+    match = re.search(r"\[(sig-[\w-]+)\]", spec_name)
+    if match:
+        return match.group(1)
+    return "unknown"
@@ -1,4 +1,5 @@
 import base64
+import json
 import math
 import os
 import time
@@ -58,12 +59,16 @@ class KubernetesClient(object):
     def is_pod_running(self, name, namespace="default"):
         return self.get_pod_phase(name, namespace) == "Running"
 
-    def wait_running_pods(self, name=None, namespace="default", timeout=600):
+    def wait_running_pods(self, name=None, namespace="default", timeout=600,
+                          ignored_namespaces=[]):
         pods = []
         if name is not None:
             pods.append(self.get_pod(name, namespace))
         else:
-            pods = self.core_v1_api.list_pod_for_all_namespaces().items
+            pods = [
+                p for p in self.core_v1_api.list_pod_for_all_namespaces().items
+                if p.metadata.namespace not in ignored_namespaces
+            ]
         logging.info(
             "Waiting up to %.2f minutes for given pod(s) to be ready",
             timeout / 60.0)
@@ -139,6 +144,20 @@ class KubernetesClient(object):
                 assert phase != "Running", (
                     f"Pod {name} is still running after {timeout} seconds")
 
+    def list_nodes(self, operating_system=None):
+        nodes = self.core_v1_api.list_node().items
+        if operating_system is None:
+            return nodes
+        return [
+            n for n in nodes
+            if n.status.node_info.operating_system == operating_system
+        ]
+
+    def get_node_stats_summary(self, name):
+        resp = self.core_v1_api.connect_get_node_proxy_with_path(
+            name, "stats/summary", _preload_content=False)
+        return json.loads(resp.data)
+
     def delete_pod(self, name, namespace="default"):
         self.core_v1_api.delete_namespaced_pod(name=name, namespace=namespace)
 
@@ -0,0 +1,86 @@
+import json
+import os
+import re
+import tempfile
+
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import utils as e2e_utils
+
+logging = e2e_logger.get_logger(__name__)
+
+# Conservative resource usage estimate of a single ginkgo node, used when
+# there is no usage measured by previous runs.
+DEFAULT_GINKGO_NODE_USAGE = {
+    "cpu": 1.0,
+    "memory": 2 * 1024 ** 3,
+}
+# Fraction of the allocatable resources given to the ginkgo nodes. The rest
+# is left for the system pods and the test pods' startup spikes.
+CAPACITY_FACTOR = 0.8
+
+QUANTITY_SUFFIXES = {
+    "m": 1e-3, "k": 1e3, "M": 1e6, "G": 1e9, "T": 1e12,
+    "Ki": 1024, "Mi": 1024 ** 2, "Gi": 1024 ** 3, "Ti": 1024 ** 4,
+}
+
+
+def parse_quantity(quantity):
+    match = re.match(r"^([0-9.]+)([a-zA-Z]*)$", str(quantity).strip())
+    if not match:
+        raise ValueError(f"Invalid Kubernetes quantity: {quantity}")
+    value, suffix = match.groups()
+    if suffix and suffix not in QUANTITY_SUFFIXES:
+        raise ValueError(f"Invalid Kubernetes quantity suffix: {quantity}")
+    return float(value) * QUANTITY_SUFFIXES.get(suffix, 1)
+
+
+def is_node_schedulable(node, non_blocking_taints=()):
+    if node.spec.unschedulable:
+        return False
+    for taint in node.spec.taints or []:
+        if taint.effect not in ["NoSchedule", "NoExecute"]:
+            continue
+        if taint.key not in non_blocking_taints:
+            return False
+    for condition in node.status.conditions or []:
+        if condition.type == "Ready":
+            return condition.status == "True"
+    return False
+
+
+def nodes_allocatable(nodes):
+    cpu = 0.0
+    memory = 0.0
+    for node in nodes:
+        cpu += parse_quantity(node.status.allocatable["cpu"])
+        memory += parse_quantity(node.status.allocatable["memory"])
+    return {"cpu": cpu, "memory": memory}
+
+
+def load_ginkgo_node_usage(sources):
+    # Each source is the path or URL of a previous run's parallelism.json
+    # artifact. The highest measured usage is used.
+    usage = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, source in enumerate(sources):
+            if source.startswith(("http://", "https://")):
+                source_file = os.path.join(tmp_dir, f"parallelism_{i}.json")
+                e2e_utils.download_file(source, source_file)
+            else:
+                source_file = source
+            with open(source_file) as f:
+                measured = json.load(f).get("measured_ginkgo_node_usage")
+            if not measured:
+                continue
+            for key in DEFAULT_GINKGO_NODE_USAGE:
+                if measured.get(key):
+                    usage[key] = max(usage.get(key, 0), measured[key])
+    return usage
+
+
+def ginkgo_nodes(allocatable, usage, max_nodes):
+    nodes = min(
+        int(allocatable[key] * CAPACITY_FACTOR / usage[key])
+        for key in DEFAULT_GINKGO_NODE_USAGE
+    )
+    return max(1, min(nodes, max_nodes))
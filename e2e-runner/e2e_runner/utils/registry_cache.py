@@ -0,0 +1,42 @@
+import yaml
+
+REGISTRY_CACHE_IMAGE = "registry:2"
+REGISTRY_CACHE_DATA_DIR = "/var/lib/registry-cache"
+
+
+def load_layout(layout_file):
+    with open(layout_file) as f:
+        return yaml.safe_load(f.read())
+
+
+def cache_endpoints(cache_address, layout):
+    return {
+        registry: f"{cache_address}:{cache['port']}"
+        for registry, cache in layout["registries"].items()
+    }
+
+
+def registry_mirrors(cache_address, layout):
+    # Returns the containerd mirrors in the format expected by the
+    # 'kubeadm-bootstrap.ps1' script: 'registry=http://endpoint,...'.
+    endpoints = cache_endpoints(cache_address, layout)
+    return ",".join(f"{registry}=http://{endpoint}"
+                    for registry, endpoint in endpoints.items())
+
+
+def deploy_script(layout):
+    # Returns the script deploying the registry caches on a Docker host.
+    # Already running caches are kept, together with their cached content.
+    script = []
+    for registry, cache in layout["registries"].items():
+        name = f"registry-cache-{registry.replace('.', '-')}"
+        data_dir = f"{REGISTRY_CACHE_DATA_DIR}/{registry}"
+        script += [
+            f"sudo mkdir -p {data_dir}",
+            f"docker inspect {name} >/dev/null 2>&1 || "
+            f"docker run -d --restart always --name {name} "
+            f"-p {cache['port']}:5000 -v {data_dir}:/var/lib/registry "
+            f"-e REGISTRY_PROXY_REMOTEURL={cache['remote']} "
+            f"{REGISTRY_CACHE_IMAGE}",
+        ]
+    return script
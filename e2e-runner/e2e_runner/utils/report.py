@@ -0,0 +1,110 @@
+import heapq
+import json
+import re
+
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import junit as e2e_junit
+
+logging = e2e_logger.get_logger(__name__)
+
+FAILURE_SIGNATURE_PATTERNS = [
+    (re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.I), "<uuid>"),  # noqa:
+    (re.compile(r"\b\d{1,3}(\.\d{1,3}){3}(:\d+)?\b"), "<ip>"),
+    (re.compile(r"\b0x[0-9a-f]+\b", re.I), "<hex>"),
+    (re.compile(r"\b[0-9a-f]{12,}\b", re.I), "<hex>"),
+    (re.compile(r"-[a-z0-9]{5}\b"), "-<id>"),
+    (re.compile(r"\d+(\.\d+)?"), "<n>"),
+]
+MAX_SIGNATURE_LENGTH = 200
+MAX_SIGNATURE_SPECS = 20
+
+
+def failure_signature(message):
+    if not message:
+        return "<no message>"
+    signature = message.strip().splitlines()[0]
+    for pattern, replacement in FAILURE_SIGNATURE_PATTERNS:
+        signature = pattern.sub(replacement, signature)
+    return signature[:MAX_SIGNATURE_LENGTH]
+
+
+class ConformanceReport(object):
+
+    def __init__(self, slowest_specs_count=20):
+        self.slowest_specs_count = slowest_specs_count
+        self.counts = {
+            e2e_junit.STATUS_PASSED: 0,
+            e2e_junit.STATUS_FAILED: 0,
+            e2e_junit.STATUS_SKIPPED: 0,
+        }
+        self.total_duration = 0.0
+        self.sigs = {}
+        self.failures = {}
+        # Min-heap with the slowest specs seen so far.
+        self._slowest = []
+        self._index = 0
+
+    def add_test_case(self, test_case):
+        status = test_case["status"]
+        self.counts[status] += 1
+        if status == e2e_junit.STATUS_SKIPPED:
+            return
+
+        duration = test_case["time"]
+        self.total_duration += duration
+
+        sig = self.sigs.setdefault(
+            e2e_junit.spec_sig(test_case["name"]),
+            {"specs": 0, "failed": 0, "duration": 0.0})
+        sig["specs"] += 1
+        sig["duration"] += duration
+
+        item = (duration, self._index, test_case["name"], status)
+        self._index += 1
+        if len(self._slowest) < self.slowest_specs_count:
+            heapq.heappush(self._slowest, item)
+        elif self.slowest_specs_count > 0:
+            heapq.heappushpop(self._slowest, item)
+
+        if status == e2e_junit.STATUS_FAILED:
+            sig["failed"] += 1
+            signature = failure_signature(test_case["message"])
+            failure = self.failures.setdefault(
+                signature, {"count": 0, "specs": []})
+            failure["count"] += 1
+            if len(failure["specs"]) < MAX_SIGNATURE_SPECS:
+                failure["specs"].append(test_case["name"])
+
+    def add_junit_files(self, junit_files):
+        for test_case in e2e_junit.iter_junit_files_test_cases(junit_files):
+            self.add_test_case(test_case)
+
+    def summary(self):
+        slowest = sorted(self._slowest, reverse=True)
+        failures = sorted(
+            self.failures.items(), key=lambda i: i[1]["count"], reverse=True)
+        sigs = sorted(
+            self.sigs.items(), key=lambda i: i[1]["duration"], reverse=True)
+        return {
+            "counts": dict(self.counts),
+            "total_duration": self.total_duration,
+            "sigs": dict(sigs),
+            "slowest_specs": [
+                {"name": name, "duration": duration, "status": status}
+                for duration, _, name, status in slowest
+            ],
+            "failures": [
+                {"signature": signature, **failure}
+                for signature, failure in failures
+            ],
+        }
+
+    def write(self, output_file):
+        with open(output_file, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        logging.info(
+            "Conformance report summary written to %s (passed: %d, "
+            "failed: %d, skipped: %d)", output_file,
+            self.counts[e2e_junit.STATUS_PASSED],
+            self.counts[e2e_junit.STATUS_FAILED],
+            self.counts[e2e_junit.STATUS_SKIPPED])
@@ -0,0 +1,118 @@
+import os
+import subprocess
+import tarfile
+import tempfile
+import threading
+
+from e2e_runner import exceptions as e2e_exceptions
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import utils as e2e_utils
+
+logging = e2e_logger.get_logger(__name__)
+
+
+class PodResultsSyncer(object):
+
+    def __init__(self, pod_name, remote_dir, local_dir, interval=300,
+                 namespace="default"):
+        self.pod_name = pod_name
+        self.remote_dir = remote_dir.rstrip("/")
+        self.local_dir = local_dir
+        self.interval = interval
+        self.namespace = namespace
+        # Remote relative file path -> (size, mtime) of the synced version.
+        self.synced_files = {}
+        self._lock = threading.Lock()
+        self._task = None
+        if interval > 0:
+            self._task = e2e_utils.PeriodicTask(
+                self.sync, interval, name="results-syncer")
+
+    def start(self):
+        if not self._task:
+            return
+        logging.info("Syncing pod %s:%s to %s every %s seconds",
+                     self.pod_name, self.remote_dir, self.local_dir,
+                     self.interval)
+        self._task.start()
+
+    def stop(self):
+        if self._task:
+            self._task.stop()
+        logging.info("Final sync of pod %s:%s",
+                     self.pod_name, self.remote_dir)
+        self.sync()
+
+    def sync(self):
+        with self._lock:
+            remote_files = self._list_remote_files()
+            changed = [
+                path for path, stat in remote_files.items()
+                if self.synced_files.get(path) != stat
+            ]
+            if len(changed) == 0:
+                return
+            self._download_files(changed)
+            for path in changed:
+                self.synced_files[path] = remote_files[path]
+            logging.info("Synced %d new or changed file(s) from pod %s",
+                         len(changed), self.pod_name)
+
+    def _kubectl_exec_args(self, cmd, stdin=False):
+        args = [e2e_utils.get_kubectl_bin(), "exec"]
+        if stdin:
+            args.append("-i")
+        args += ["--namespace", self.namespace, self.pod_name, "--", *cmd]
+        return args
+
+    @e2e_utils.retry_on_error()
+    def _list_remote_files(self):
+        p = subprocess.run(
+            self._kubectl_exec_args([
+                "find", self.remote_dir, "-type", "f",
+                "-exec", "stat", "-c", "%s %Y %n", "{}", "+",
+            ]),
+            capture_output=True, check=True, timeout=300)
+        files = {}
+        prefix = f"{self.remote_dir}/"
+        for line in p.stdout.decode().splitlines():
+            size, mtime, path = line.split(" ", 2)
+            if path.startswith(prefix):
+                files[path[len(prefix):]] = (int(size), int(mtime))
+        return files
+
+    @e2e_utils.retry_on_error()
+    def _download_files(self, paths):
+        # The files are streamed as a compressed tar archive, and they are
+        # extracted while the archive is being read.
+        with tempfile.TemporaryFile() as files_list, \
+                tempfile.TemporaryFile() as stderr:
+            files_list.write("".join(f"{path}\n" for path in paths).encode())
+            files_list.seek(0)
+            p = subprocess.Popen(
+                self._kubectl_exec_args(
+                    ["tar", "czf", "-", "-C", self.remote_dir, "-T", "-"],
+                    stdin=True),
+                stdin=files_list, stdout=subprocess.PIPE, stderr=stderr)
+            try:
+                with tarfile.open(fileobj=p.stdout, mode="r|gz") as tar:
+                    for member in tar:
+                        self._extract_member(tar, member)
+            finally:
+                p.stdout.close()  # pyright: ignore
+                p.wait(timeout=300)
+            if p.returncode != 0:
+                stderr.seek(0)
+                raise e2e_exceptions.ShellCmdFailed(
+                    f"Failed to download files from pod {self.pod_name}: "
+                    f"{stderr.read().decode().strip()}")
+
+    def _extract_member(self, tar, member):
+        local_dir = os.path.realpath(self.local_dir)
+        dest = os.path.realpath(os.path.join(local_dir, member.name))
+        if not dest.startswith(local_dir + os.sep):
+            logging.warning("Skipping unsafe archive member: %s", member.name)
+            return
+        if not (member.isfile() or member.isdir()):
+            return
+        tar.extract(member, local_dir)
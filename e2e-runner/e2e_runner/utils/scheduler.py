@@ -0,0 +1,60 @@
+import heapq
+import os
+import statistics
+import tempfile
+
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import junit as e2e_junit
+from e2e_runner.utils import utils as e2e_utils
+
+logging = e2e_logger.get_logger(__name__)
+
+
+def load_spec_durations(sources):
+    # Each source is either a JUnit file, a directory with JUnit files, or
+    # the URL of a JUnit file. The spec duration is the mean duration of
+    # all its non-skipped runs.
+    totals = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, source in enumerate(sources):
+            if source.startswith(("http://", "https://")):
+                junit_file = os.path.join(tmp_dir, f"junit_{i}.xml")
+                e2e_utils.download_file(source, junit_file)
+                junit_files = [junit_file]
+            elif os.path.isdir(source):
+                junit_files = e2e_junit.find_junit_files(source)
+            else:
+                junit_files = [source]
+            for tc in e2e_junit.iter_junit_files_test_cases(junit_files):
+                if tc["status"] == e2e_junit.STATUS_SKIPPED:
+                    continue
+                total = totals.setdefault(tc["name"], [0.0, 0])
+                total[0] += tc["time"]
+                total[1] += 1
+    return {name: t[0] / t[1] for name, t in totals.items()}
+
+
+def pack_specs(specs, shards, durations):
+    # Longest processing time first: the specs are sorted by duration
+    # descending, and each one is assigned to the least loaded shard. The
+    # specs without a known duration (e.g. new or renamed specs) are given
+    # the median known duration.
+    shards_specs = [[] for _ in range(shards)]
+    known_durations = sorted(durations[s] for s in specs if s in durations)
+    estimate = 0.0
+    if known_durations:
+        estimate = statistics.median(known_durations)
+    specs_durations = sorted(
+        [(durations.get(s, estimate), s) for s in specs], reverse=True)
+
+    loads = [(0.0, i) for i in range(shards)]
+    for duration, spec in specs_durations:
+        load, i = heapq.heappop(loads)
+        shards_specs[i].append(spec)
+        heapq.heappush(loads, (load + duration, i))
+
+    logging.info(
+        "Packed %d specs (%d with known durations) across %d shards. "
+        "Estimated longest shard duration: %.2f minutes",
+        len(specs), len(known_durations), shards, max(loads)[0] / 60)
+    return shards_specs
@@ -0,0 +1,140 @@
+import json
+import shlex
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import utils as e2e_utils
+
+logging = e2e_logger.get_logger(__name__)
+
+
+class ClusterSmokeTests(object):
+    # The smoke tests pods run the agnhost netexec server, and its /dial
+    # endpoint is called via the API server pods proxy. This way, every
+    # connectivity check is run from inside the source pod. The checks are
+    # meant to fail fast, so every step has a short timeout.
+    NETEXEC_PORT = 8080
+    DIAL_TIMEOUT = 15
+
+    def __init__(self, namespace, pods_timeout=180, windows_node_port=True,
+                 max_workers=16):
+        self.namespace = namespace
+        self.pods_timeout = pods_timeout
+        self.windows_node_port = windows_node_port
+        self.max_workers = max_workers
+
+    def wait_ready(self):
+        for resource in ["daemonset/smoke-windows", "deployment/smoke-linux"]:
+            e2e_utils.exec_kubectl([
+                "rollout", "status", resource,
+                "--namespace", self.namespace,
+                f"--timeout={self.pods_timeout}s",
+            ], retries=1)
+
+    def run(self):
+        checks = self.checks()
+        logging.info("Running %d smoke tests connectivity checks",
+                     len(checks))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(lambda c: self._check(*c), checks))
+
+    def checks(self):
+        pods = self._get_json(["pods"])["items"]
+        nodes = self._get_json(["nodes"], namespaced=False)["items"]
+        services = self._get_json(["services"])["items"]
+
+        nodes_addresses = {}
+        for node in nodes:
+            for address in node["status"]["addresses"]:
+                if address["type"] == "InternalIP":
+                    nodes_addresses[node["metadata"]["name"]] = \
+                        address["address"]
+        win_pods = [p for p in pods
+                    if p["metadata"]["labels"]["app"] == "smoke-windows"]
+        linux_pods = [p for p in pods
+                      if p["metadata"]["labels"]["app"] == "smoke-linux"]
+        if len(win_pods) == 0 or len(linux_pods) == 0:
+            raise Exception("Missing the Windows or Linux smoke tests pods")
+        linux_pod = linux_pods[0]
+        service = next(s for s in services
+                       if s["metadata"]["name"] == "smoke-windows")
+        node_port = next(
+            s for s in services
+            if s["metadata"]["name"] == "smoke-windows-nodeport"
+        )["spec"]["ports"][0]["nodePort"]
+        service_dns = f"smoke-windows.{self.namespace}.svc.cluster.local"
+
+        checks = []
+        for i, pod in enumerate(win_pods):
+            # The next Windows pod, scheduled on a different node.
+            peer = win_pods[(i + 1) % len(win_pods)]
+            if peer["spec"]["nodeName"] != pod["spec"]["nodeName"]:
+                checks.append(("pod-to-pod", pod, peer["status"]["podIP"],
+                               self.NETEXEC_PORT))
+                if self.windows_node_port:
+                    checks.append((
+                        "node-port", pod,
+                        nodes_addresses[peer["spec"]["nodeName"]],
+                        node_port))
+            checks += [
+                ("pod-to-pod", pod, linux_pod["status"]["podIP"],
+                 self.NETEXEC_PORT),
+                ("pod-to-pod", linux_pod, pod["status"]["podIP"],
+                 self.NETEXEC_PORT),
+                ("pod-to-service", pod, service["spec"]["clusterIP"], 80),
+                ("dns", pod, service_dns, 80),
+                ("node-port", linux_pod,
+                 nodes_addresses[pod["spec"]["nodeName"]], node_port),
+            ]
+        checks += [
+            ("pod-to-service", linux_pod, service["spec"]["clusterIP"], 80),
+            ("dns", linux_pod, service_dns, 80),
+        ]
+        return checks
+
+    def _check(self, name, pod, host, port):
+        start = time.time()
+        result = {
+            "check": name,
+            "source": f"{pod['metadata']['name']} ({pod['spec']['nodeName']})",
+            "target": f"{host}:{port}",
+            "passed": False,
+            "error": None,
+        }
+        try:
+            response = self._dial(pod["metadata"]["name"], host, port)
+            result["passed"] = len(response.get("responses") or []) > 0
+            if not result["passed"]:
+                result["error"] = "; ".join(response.get("errors") or [])
+        except Exception as e:
+            result["error"] = str(e)
+        result["duration"] = time.time() - start
+        return result
+
+    def _dial(self, pod_name, host, port):
+        query = urllib.parse.urlencode({
+            "request": "hostname",
+            "protocol": "http",
+            "host": host,
+            "port": port,
+            "tries": 3,
+        })
+        url = (f"/api/v1/namespaces/{self.namespace}/pods/"
+               f"{pod_name}:{self.NETEXEC_PORT}/proxy/dial?{query}")
+        # The netexec server already tries the dial request a few times.
+        output, _ = e2e_utils.exec_kubectl(
+            ["get", "--raw", shlex.quote(url),
+             f"--request-timeout={self.DIAL_TIMEOUT}s"],
+            capture_output=True, hide_cmd=True,
+            timeout=2 * self.DIAL_TIMEOUT, retries=1)
+        return json.loads(output)
+
+    def _get_json(self, resource, namespaced=True):
+        args = ["get", *resource, "--output", "json"]
+        if namespaced:
+            args += ["--namespace", self.namespace]
+        output, _ = e2e_utils.exec_kubectl(
+            args, capture_output=True, hide_cmd=True)
+        return json.loads(output)
@@ -0,0 +1,84 @@
+import json
+import math
+
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import junit as e2e_junit
+
+logging = e2e_logger.get_logger(__name__)
+
+
+def wilson_interval(failures, runs, z=1.96):
+    # Wilson score interval of the failure rate. Unlike the normal
+    # approximation, it's still meaningful for rates close to 0 or 1, and
+    # for a small number of runs. The default z gives a 95% confidence.
+    if runs == 0:
+        return (0.0, 1.0)
+    rate = failures / runs
+    denominator = 1 + z ** 2 / runs
+    center = (rate + z ** 2 / (2 * runs)) / denominator
+    margin = (z * math.sqrt(rate * (1 - rate) / runs +
+                            z ** 2 / (4 * runs ** 2)) / denominator)
+    return (max(0.0, center - margin), min(1.0, center + margin))
+
+
+class StressReport(object):
+
+    def __init__(self):
+        # Spec name -> [runs, failures]
+        self.specs = {}
+        self.iterations = 0
+        self.failed_iterations = []
+
+    def add_iteration(self, iteration, junit_files):
+        # An iteration which executed no specs (its focus matched no spec)
+        # is failed.
+        failures = 0
+        executed = 0
+        for test_case in e2e_junit.iter_junit_files_test_cases(junit_files):
+            if test_case["status"] == e2e_junit.STATUS_SKIPPED or \
+               e2e_junit.is_suite_node(test_case["name"]):
+                continue
+            executed += 1
+            spec = self.specs.setdefault(test_case["name"], [0, 0])
+            spec[0] += 1
+            if test_case["status"] == e2e_junit.STATUS_FAILED:
+                spec[1] += 1
+                failures += 1
+        self.iterations += 1
+        if executed == 0:
+            logging.warning("Stress iteration %d executed no specs",
+                            iteration)
+        if failures > 0 or executed == 0:
+            self.failed_iterations.append(iteration)
+        return failures
+
+    def summary(self):
+        specs = []
+        for name, (runs, failures) in self.specs.items():
+            low, high = wilson_interval(failures, runs)
+            specs.append({
+                "name": name,
+                "runs": runs,
+                "failures": failures,
+                "failure_rate": failures / runs,
+                "failure_rate_95_ci": [low, high],
+            })
+        specs.sort(key=lambda s: (s["failure_rate"], s["runs"]),
+                   reverse=True)
+        return {
+            "iterations": self.iterations,
+            "failed_iterations": sorted(self.failed_iterations),
+            "specs": specs,
+        }
+
+    def write(self, output_file):
+        summary = self.summary()
+        with open(output_file, "w") as f:
+            json.dump(summary, f, indent=2)
+        for spec in summary["specs"]:
+            low, high = spec["failure_rate_95_ci"]
+            logging.info(
+                "%s: %d/%d failed (%.1f%%, 95%% CI: %.1f%% - %.1f%%)",
+                spec["name"], spec["failures"], spec["runs"],
+                spec["failure_rate"] * 100, low * 100, high * 100)
+        logging.info("Stress report written to %s", output_file)
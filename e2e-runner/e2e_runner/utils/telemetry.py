@@ -0,0 +1,182 @@
+import json
+import math
+import os
+import threading
+import time
+from array import array
+
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import utils as e2e_utils
+
+logging = e2e_logger.get_logger(__name__)
+
+
+class NodeTelemetrySampler(object):
+    # Samples are stored as one float64 array per column, per node. Missing
+    # values (not every kubelet reports every stat) are stored as NaN.
+    COLUMNS = [
+        "timestamp",
+        "cpu_usage_nano_cores",
+        "memory_working_set_bytes",
+        "memory_available_bytes",
+        "fs_used_bytes",
+        "fs_capacity_bytes",
+        "network_rx_bytes",
+        "network_tx_bytes",
+    ]
+
+    def __init__(self, k8s_client, interval=30):
+        self.k8s_client = k8s_client
+        self.interval = interval
+        self.nodes_os = {}
+        self.samples = {}
+        self._lock = threading.Lock()
+        self._task = e2e_utils.PeriodicTask(
+            self.sample, interval, name="node-telemetry-sampler")
+
+    def start(self):
+        logging.info("Starting node telemetry sampler (interval: %ss)",
+                     self.interval)
+        self._task.start()
+
+    def stop(self):
+        self._task.stop()
+        logging.info("Stopped node telemetry sampler")
+
+    def sample(self):
+        for node in self.k8s_client.list_nodes():
+            name = node.metadata.name
+            try:
+                summary = self.k8s_client.get_node_stats_summary(name)
+            except Exception as e:
+                logging.warning(
+                    "Failed to get stats summary for node %s: %s", name, e)
+                continue
+            with self._lock:
+                self.nodes_os[name] = node.status.node_info.operating_system
+                self._append_sample(name, summary.get("node", {}))
+
+    def write_artifacts(self, output_dir):
+        with self._lock:
+            if len(self.samples) == 0:
+                logging.warning("No node telemetry samples were collected")
+                return
+            os.makedirs(output_dir, exist_ok=True)
+            summary = {}
+            for node_name, columns in self.samples.items():
+                time_series = {
+                    "node": node_name,
+                    "os": self.nodes_os.get(node_name),
+                    "interval": self.interval,
+                    "columns": {
+                        c: [self._json_value(v) for v in columns[c]]
+                        for c in self.COLUMNS
+                    },
+                }
+                node_file = os.path.join(output_dir, f"{node_name}.json")
+                with open(node_file, "w") as f:
+                    json.dump(time_series, f)
+                summary[node_name] = self._node_peak_usage(node_name, columns)
+        summary_file = os.path.join(output_dir, "summary.json")
+        with open(summary_file, "w") as f:
+            json.dump(summary, f, indent=2)
+        logging.info("Node telemetry artifacts written to %s", output_dir)
+
+    def peak_usage_increase(self, operating_system=None):
+        # Peak CPU (cores) and memory (bytes) usage above the first sample,
+        # summed across the nodes. The first sample is taken before the
+        # tests start, so this is the usage added by the tests.
+        usage = {"cpu": 0.0, "memory": 0.0}
+        with self._lock:
+            for node_name, columns in self.samples.items():
+                if (operating_system and
+                        self.nodes_os.get(node_name) != operating_system):
+                    continue
+                for key, column, scale in [
+                        ("cpu", "cpu_usage_nano_cores", 1e9),
+                        ("memory", "memory_working_set_bytes", 1)]:
+                    values = columns[column]
+                    if len(values) < 2 or math.isnan(values[0]):
+                        continue
+                    peak = self._max(values[1:])
+                    if not math.isnan(peak):
+                        usage[key] += max(peak - values[0], 0) / scale
+        return usage
+
+    def _append_sample(self, node_name, node_stats):
+        if node_name not in self.samples:
+            self.samples[node_name] = {c: array("d") for c in self.COLUMNS}
+        cpu = node_stats.get("cpu", {})
+        memory = node_stats.get("memory", {})
+        fs = node_stats.get("fs", {})
+        rx_bytes, tx_bytes = self._network_bytes(node_stats.get("network", {}))
+        values = {
+            "timestamp": time.time(),
+            "cpu_usage_nano_cores": cpu.get("usageNanoCores"),
+            "memory_working_set_bytes": memory.get("workingSetBytes"),
+            "memory_available_bytes": memory.get("availableBytes"),
+            "fs_used_bytes": fs.get("usedBytes"),
+            "fs_capacity_bytes": fs.get("capacityBytes"),
+            "network_rx_bytes": rx_bytes,
+            "network_tx_bytes": tx_bytes,
+        }
+        columns = self.samples[node_name]
+        for c in self.COLUMNS:
+            value = values[c]
+            columns[c].append(math.nan if value is None else float(value))
+
+    def _network_bytes(self, network_stats):
+        # Windows kubelets don't report the top-level network stats, only
+        # the per-interface ones.
+        if "rxBytes" in network_stats or "txBytes" in network_stats:
+            return network_stats.get("rxBytes"), network_stats.get("txBytes")
+        interfaces = network_stats.get("interfaces") or []
+        if len(interfaces) == 0:
+            return None, None
+        rx_bytes = sum(i.get("rxBytes", 0) for i in interfaces)
+        tx_bytes = sum(i.get("txBytes", 0) for i in interfaces)
+        return rx_bytes, tx_bytes
+
+    def _node_peak_usage(self, node_name, columns):
+        return {
+            "os": self.nodes_os.get(node_name),
+            "samples": len(columns["timestamp"]),
+            "peak_cpu_cores": self._json_value(
+                self._max(columns["cpu_usage_nano_cores"]) / 1e9),
+            "peak_memory_working_set_bytes": self._json_value(
+                self._max(columns["memory_working_set_bytes"])),
+            "min_memory_available_bytes": self._json_value(
+                self._min(columns["memory_available_bytes"])),
+            "peak_fs_used_bytes": self._json_value(
+                self._max(columns["fs_used_bytes"])),
+            "peak_network_rx_bytes_per_second": self._json_value(
+                self._max_rate(columns["timestamp"],
+                               columns["network_rx_bytes"])),
+            "peak_network_tx_bytes_per_second": self._json_value(
+                self._max_rate(columns["timestamp"],
+                               columns["network_tx_bytes"])),
+        }
+
+    def _max(self, values):
+        values = [v for v in values if not math.isnan(v)]
+        return max(values) if values else math.nan
+
+    def _min(self, values):
+        values = [v for v in values if not math.isnan(v)]
+        return min(values) if values else math.nan
+
+    def _max_rate(self, timestamps, counters):
+        rates = []
+        for i in range(1, len(counters)):
+            elapsed = timestamps[i] - timestamps[i - 1]
+            delta = counters[i] - counters[i - 1]
+            # NaN deltas are skipped, and negative deltas mean that the
+            # counters were reset (e.g. network adapter re-created).
+            if elapsed > 0 and delta >= 0:
+                rates.append(delta / elapsed)
+        return max(rates) if rates else math.nan
+
+    def _json_value(self, value):
+        if math.isnan(value):
+            return None
+        return value
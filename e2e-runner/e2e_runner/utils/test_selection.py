@@ -0,0 +1,52 @@
+import fnmatch
+import re
+
+import yaml
+from e2e_runner import logger as e2e_logger
+from e2e_runner.utils import junit as e2e_junit
+
+logging = e2e_logger.get_logger(__name__)
+
+
+def load_mapping(mapping_file):
+    with open(mapping_file) as f:
+        mapping = yaml.safe_load(f.read())
+    for key in ["mandatory", "ignore", "full", "rules"]:
+        mapping.setdefault(key, [])
+    return mapping
+
+
+def _matches(path, patterns):
+    return any(fnmatch.fnmatch(path, p) for p in patterns)
+
+
+def select_focus_regex(changed_files, mapping):
+    # Returns the narrowed focus regex, or None if the full E2E tests need
+    # to run.
+    focus = []
+    for path in changed_files:
+        if _matches(path, mapping["ignore"]):
+            continue
+        if _matches(path, mapping["full"]):
+            logging.info("Changed path %s needs the full E2E tests", path)
+            return None
+        rules = [r for r in mapping["rules"] if _matches(path, r["paths"])]
+        if len(rules) == 0:
+            logging.info(
+                "Changed path %s is not mapped to any E2E tests. Running "
+                "the full E2E tests", path)
+            return None
+        for rule in rules:
+            focus += [f for f in rule["focus"] if f not in focus]
+    focus += [f for f in mapping["mandatory"] if f not in focus]
+    return "|".join(focus)
+
+
+def select_specs(spec_names, selection_regex):
+    # Returns the specs (e.g. listed with the configured focus and skip
+    # regexes) matched by the selection focus regex.
+    regex = re.compile(selection_regex)
+    return [
+        name for name in spec_names
+        if regex.search(e2e_junit.spec_text(name))
+    ]
@@ -1,10 +1,13 @@
 import os
+import re
 import socket
 import subprocess
 import tarfile
 import tempfile
+import threading
 import time
 from collections import OrderedDict
+from urllib.parse import urlparse
 from urllib.request import urlopen, urlretrieve
 
 import configargparse
@@ -18,6 +21,16 @@ logging = e2e_logger.get_logger(__name__)
 
 LAST_LOG_TIMESTAMP = None
 
+# The caching proxy keys the cached files on their URLs, so only the URLs
+# of immutable files are cached: with a release version (like 'v1.29.0',
+# or 'v1.30.0-alpha.1.12+3f1b2c9') or a content digest path segment, and
+# without a moving reference (like 'latest', or a branch name).
+IMMUTABLE_URL_SEGMENT_REGEX = re.compile(
+    r"^(v?[0-9]+\.[0-9]+\.[0-9]+([.+-][\w.+-]*)?|"
+    r"(sha256:)?[0-9a-f]{40,64})$")
+MUTABLE_URL_SEGMENT_REGEX = re.compile(
+    r"^(latest|stable|nightly|master|main|release-[0-9.]+)([.-].*)?$")
+
 
 def str2bool(v):
     if v.lower() == 'true':
@@ -28,6 +41,47 @@ def str2bool(v):
         raise configargparse.ArgumentTypeError("Boolean value expected")
 
 
+class PeriodicTask(object):
+
+    def __init__(self, func, interval, name=None):
+        self.func = func
+        self.interval = interval
+        self.name = name or func.__name__
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=60):
+        if not self.is_running:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout=timeout)  # pyright: ignore
+        if self._thread.is_alive():  # pyright: ignore
+            logging.warning(
+                "Periodic task %s didn't stop in %s seconds",
+                self.name, timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.func()
+            except Exception as e:
+                logging.warning("Periodic task %s failed: %s", self.name, e)
+            self._stop_event.wait(self.interval)
+
+
 def retry_on_error(max_attempts=5, max_sleep_seconds=60):
     return tenacity.retry(
         stop=tenacity.stop_after_attempt(max_attempts),  # pyright: ignore
@@ -158,6 +212,29 @@ def make_tgz_archive(source_dir, output_file):
         tar.add(source_dir, arcname=os.path.basename(source_dir))
 
 
+def is_immutable_url(url):
+    segments = urlparse(url).path.split("/")
+    if any(MUTABLE_URL_SEGMENT_REGEX.match(s) for s in segments):
+        return False
+    return any(IMMUTABLE_URL_SEGMENT_REGEX.match(s) for s in segments)
+
+
+def http_cache_url(url, cache_endpoint):
+    # Rewrites the URL to be downloaded through the bootstrap VM caching
+    # proxy, if there is one, and if the URL file is immutable.
+    parsed = urlparse(url)
+    if not cache_endpoint or parsed.scheme not in ["http", "https"]:
+        return url
+    if not is_immutable_url(url):
+        logging.info("Not caching the mutable URL %s", url)
+        return url
+    cached_url = (f"http://{cache_endpoint}/cache/"
+                  f"{parsed.scheme}/{parsed.netloc}{parsed.path}")
+    if parsed.query:
+        cached_url += f"?{parsed.query}"
+    return cached_url
+
+
 @retry_on_error()
 def download_file(url, dest):
     urlretrieve(url, dest)
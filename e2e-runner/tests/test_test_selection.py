@@ -0,0 +1,95 @@
+import glob
+import os
+import re
+import unittest
+
+import yaml
+from e2e_runner.utils import junit as e2e_junit
+from e2e_runner.utils import test_selection as e2e_test_selection
+
+E2E_RUNNER_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "e2e_runner")
+TEST_REGEX_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    "prow", "test-regex")
+
+HYBRID_NETWORK_SPEC = (
+    "[It] [sig-windows] [Feature:Windows] Hybrid cluster network for all "
+    "supported CNIs should have stable networking for Linux and Windows "
+    "pods")
+NODE_PORT_SPEC = (
+    "[It] [sig-windows] [Feature:Windows] Services should be able to create "
+    "a functioning NodePort service for Windows")
+DNS_SPEC = (
+    "[It] [sig-network] DNS should provide DNS for the cluster "
+    "[Conformance] [Conformance]")
+STORAGE_SPEC = (
+    "[It] [sig-storage] ConfigMap should be consumable from pods in volume "
+    "[NodeConformance] [Conformance] [NodeConformance, Conformance]")
+SERIAL_SPEC = (
+    "[It] [sig-network] Services should serve a basic endpoint from pods "
+    "[Serial] [Conformance]")
+SPECS = [
+    HYBRID_NETWORK_SPEC, NODE_PORT_SPEC, DNS_SPEC, STORAGE_SPEC,
+    SERIAL_SPEC,
+]
+
+
+def dry_run(specs, focus, skip):
+    # Same specs selection as the Ginkgo dry-run of the configured focus
+    # and skip regexes.
+    return [
+        s for s in specs
+        if re.search(focus, e2e_junit.spec_text(s)) and
+        not (skip and re.search(skip, e2e_junit.spec_text(s)))
+    ]
+
+
+class TestSelectSpecs(unittest.TestCase):
+
+    def setUp(self):
+        self.mapping = e2e_test_selection.load_mapping(
+            os.path.join(E2E_RUNNER_DIR, "test-selection.yaml"))
+        self.test_regex_files = glob.glob(
+            os.path.join(TEST_REGEX_DIR, "*.yaml"))
+
+    def test_shipped_focus_regexes(self):
+        selection = e2e_test_selection.select_focus_regex(
+            ["pkg/proxy/winkernel/proxier.go"], self.mapping)
+        self.assertNotEqual(len(self.test_regex_files), 0)
+        for test_regex_file in self.test_regex_files:
+            with open(test_regex_file) as f:
+                test_regex = yaml.safe_load(f.read())
+            specs = dry_run(SPECS, test_regex["focus"], test_regex["skip"])
+            selected = e2e_test_selection.select_specs(specs, selection)
+            for spec in selected:
+                self.assertIn(spec, specs)
+            self.assertIn(HYBRID_NETWORK_SPEC, selected)
+            self.assertIn(NODE_PORT_SPEC, selected)
+            self.assertNotIn(STORAGE_SPEC, selected)
+            self.assertNotIn(SERIAL_SPEC, selected)
+
+    def test_selected_specs_focus(self):
+        selected = [HYBRID_NETWORK_SPEC, DNS_SPEC]
+        focus = re.compile(e2e_junit.focus_regex(selected))
+        for spec in SPECS:
+            text = e2e_junit.spec_text(spec)
+            # Ginkgo matches the focus against the spec text, which may not
+            # have the labels suffix of the JUnit test case name.
+            unlabeled_text = e2e_junit.LABELS_REGEX.sub("", text)
+            self.assertEqual(bool(focus.search(text)), spec in selected)
+            self.assertEqual(
+                bool(focus.search(unlabeled_text)), spec in selected)
+        self.assertIsNone(
+            focus.search(e2e_junit.spec_text(HYBRID_NETWORK_SPEC) + " x"))
+
+    def test_mapping_regexes_compile(self):
+        regexes = list(self.mapping["mandatory"])
+        for rule in self.mapping["rules"]:
+            regexes += rule["focus"]
+        for regex in regexes:
+            re.compile(regex)
+
+
+if __name__ == "__main__":
+    unittest.main()